@@ -0,0 +1,254 @@
+"""
+Revenue Analytics Module
+
+Computes the /api/stats/analytics report for a date range with one of two
+interchangeable engines that return identical results:
+
+- "pandas": loads only the needed fields through projected cursors into
+  columnar NumPy arrays and aggregates them vectorized in a worker thread.
+- "facet": pushes the grouping down to Mongo as one $facet aggregation per
+  collection, so only per-day and per-service rows travel over the wire.
+
+Revenue figures come from `transactions`; customer and cancellation figures
+come from `appointments` (customers are identified by `customer_key`, the
+normalized phone number, falling back to the raw `phone` where it is unset).
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from export import iter_batches
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("facet", "pandas")
+CANCELLED_STATUS = "İptal"
+
+
+def _range_match(field: str, start_date: Optional[str], end_date: Optional[str]) -> dict:
+    bounds = {}
+    if start_date:
+        bounds['$gte'] = start_date
+    if end_date:
+        bounds['$lte'] = end_date
+    return {field: bounds} if bounds else {}
+
+
+def _ratio(part: float, whole: float) -> Optional[float]:
+    return round(part / whole, 4) if whole else None
+
+
+def _periods(keys, amounts, counts) -> List[dict]:
+    return [
+        {"period": key, "amount": round(float(amount), 2), "count": int(count)}
+        for key, amount, count in zip(keys, amounts, counts)
+    ]
+
+
+def _report(by_day, by_week, by_month, by_service, total, count,
+            appointments, cancelled, customers, repeat) -> dict:
+    return {
+        "revenue": {
+            "total": round(float(total), 2),
+            "count": int(count),
+            "average_ticket": round(float(total) / count, 2) if count else None,
+        },
+        "by_day": by_day,
+        "by_week": by_week,
+        "by_month": by_month,
+        "by_service": by_service,
+        "customers": {
+            "total": int(customers),
+            "repeat": int(repeat),
+            "repeat_ratio": _ratio(repeat, customers),
+        },
+        "appointments": {
+            "total": int(appointments),
+            "cancelled": int(cancelled),
+            "cancellation_rate": _ratio(cancelled, appointments),
+        },
+    }
+
+
+# === pandas ===
+
+async def _load_columns(cursor, fields: List[str]) -> Dict[str, list]:
+    columns = {field: [] for field in fields}
+    async for batch in iter_batches(cursor):
+        for field in fields:
+            columns[field].extend(doc.get(field) for doc in batch)
+    return columns
+
+
+def _numeric(values: list) -> np.ndarray:
+    try:
+        amounts = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        amounts = pd.to_numeric(np.asarray(values, dtype=object), errors="coerce")
+    return np.nan_to_num(amounts, nan=0.0)
+
+
+def _group_sums(keys: list, amounts: np.ndarray, keep_missing: bool = False):
+    """(unique keys, sum, count) via hash factorize + bincount (no sorting)."""
+    codes, uniques = pd.factorize(np.asarray(keys, dtype=object), use_na_sentinel=not keep_missing)
+    present = codes >= 0
+    sums = np.bincount(codes[present], weights=amounts[present], minlength=len(uniques))
+    counts = np.bincount(codes[present], minlength=len(uniques))
+    return uniques, sums, counts
+
+
+def _pandas_report(tx: Dict[str, list], appts: Dict[str, list]) -> dict:
+    amounts = _numeric(tx["amount"])
+
+    # Önce güne indir; hafta/ay o (küçük) günlük tablodan türetilir
+    day_keys, day_sums, day_counts = _group_sums(tx["date"], amounts)
+    daily = pd.DataFrame({"sum": day_sums, "count": day_counts}, index=pd.Index(day_keys, dtype=object))
+    days = pd.to_datetime(daily.index.to_series(), format="%Y-%m-%d", errors="coerce")
+    valid = days.notna().to_numpy()
+    dated = daily[valid].sort_index()
+    iso = days[valid].sort_index().dt.isocalendar()
+    week_keys = iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+    weekly = dated.groupby(week_keys.to_numpy(), sort=True).sum()
+    monthly = dated.groupby(dated.index.str.slice(0, 7), sort=True).sum()
+
+    names, service_sums, service_counts = _group_sums(tx["service_name"], amounts, keep_missing=True)
+    services = pd.DataFrame({"sum": service_sums, "count": service_counts}, index=pd.Index(names, dtype=object))
+    services = services.sort_values(["sum", "count"], ascending=False, kind="stable")
+
+    status = np.asarray(appts["status"], dtype=object)
+    cancelled = status == CANCELLED_STATUS
+    keys = pd.Series(appts["customer_key"], dtype=object).fillna(pd.Series(appts["phone"], dtype=object))
+    keys = keys.to_numpy()[~cancelled]
+    visits = np.bincount(pd.factorize(keys.astype(str))[0]) if len(keys) else np.array([], dtype=int)
+
+    return _report(
+        by_day=_periods(dated.index, dated["sum"], dated["count"]),
+        by_week=_periods(weekly.index, weekly["sum"], weekly["count"]),
+        by_month=_periods(monthly.index, monthly["sum"], monthly["count"]),
+        by_service=[
+            {"service_name": None if pd.isna(name) else name, "amount": round(float(amount), 2), "count": int(count)}
+            for name, amount, count in zip(services.index, services["sum"], services["count"])
+        ],
+        total=amounts.sum(),
+        count=len(amounts),
+        appointments=len(status),
+        cancelled=int(cancelled.sum()),
+        customers=len(visits),
+        repeat=int((visits >= 2).sum()),
+    )
+
+
+async def analytics_pandas(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+    tx = await _load_columns(
+        db.transactions.find(_range_match("date", start_date, end_date),
+                             {"_id": 0, "date": 1, "amount": 1, "service_name": 1}),
+        ["date", "amount", "service_name"],
+    )
+    appts = await _load_columns(
+        db.appointments.find(_range_match("appointment_date", start_date, end_date),
+                             {"_id": 0, "customer_key": 1, "phone": 1, "status": 1}),
+        ["customer_key", "phone", "status"],
+    )
+    # Gruplama CPU yoğun: event loop'u bloklamasın diye thread havuzunda
+    return await asyncio.get_running_loop().run_in_executor(None, _pandas_report, tx, appts)
+
+
+# === $facet ===
+
+def _transactions_pipeline(start_date: Optional[str], end_date: Optional[str]) -> list:
+    day = {"$dateFromString": {"dateString": "$_id", "format": "%Y-%m-%d", "onError": None, "onNull": None}}
+    return [
+        {"$match": _range_match("date", start_date, end_date)},
+        {"$project": {"_id": 0, "date": 1, "service_name": 1,
+                      "amount": {"$convert": {"input": "$amount", "to": "double", "onError": 0, "onNull": 0}}}},
+        {"$facet": {
+            "by_service": [
+                {"$group": {"_id": "$service_name", "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$sort": {"amount": -1, "count": -1, "_id": 1}},
+            ],
+            "by_day": [
+                {"$group": {"_id": "$date", "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$addFields": {"day": day}},
+                {"$match": {"day": {"$ne": None}}},
+                {"$sort": {"_id": 1}},
+            ],
+            "totals": [
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+            ],
+        }},
+    ]
+
+
+def _appointments_pipeline(start_date: Optional[str], end_date: Optional[str]) -> list:
+    return [
+        {"$match": _range_match("appointment_date", start_date, end_date)},
+        {"$project": {"_id": 0, "status": 1,
+                      "customer": {"$ifNull": ["$customer_key", {"$toString": "$phone"}]}}},
+        {"$facet": {
+            "statuses": [
+                {"$group": {"_id": {"$eq": ["$status", CANCELLED_STATUS]}, "count": {"$sum": 1}}},
+            ],
+            "customers": [
+                {"$match": {"status": {"$ne": CANCELLED_STATUS}}},
+                {"$group": {"_id": "$customer", "visits": {"$sum": 1}}},
+                {"$group": {"_id": None, "customers": {"$sum": 1},
+                            "repeat": {"$sum": {"$cond": [{"$gte": ["$visits", 2]}, 1, 0]}}}},
+            ],
+        }},
+    ]
+
+
+def _rollup_days(by_day: List[dict], key) -> List[dict]:
+    """Sum daily rows into coarser periods (rows are date sorted)."""
+    rows: Dict[str, list] = {}
+    for row in by_day:
+        bucket = rows.setdefault(key(row), [0.0, 0])
+        bucket[0] += row["amount"]
+        bucket[1] += row["count"]
+    keys = sorted(rows)
+    return _periods(keys, [rows[k][0] for k in keys], [rows[k][1] for k in keys])
+
+
+def _iso_week(row: dict) -> str:
+    year, week, _ = row["day"].isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+async def analytics_facet(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+    tx = (await db.transactions.aggregate(_transactions_pipeline(start_date, end_date)).to_list(1))[0]
+    ap = (await db.appointments.aggregate(_appointments_pipeline(start_date, end_date)).to_list(1))[0]
+
+    # Hafta/ay gruplaması birkaç bin günlük satır üzerinde yapılır
+    by_day = tx["by_day"]
+    totals = tx["totals"][0] if tx["totals"] else {"amount": 0.0, "count": 0}
+    statuses = {row["_id"]: row["count"] for row in ap["statuses"]}
+    customers = ap["customers"][0] if ap["customers"] else {"customers": 0, "repeat": 0}
+
+    return _report(
+        by_day=_periods([row["_id"] for row in by_day], [row["amount"] for row in by_day],
+                        [row["count"] for row in by_day]),
+        by_week=_rollup_days(by_day, _iso_week),
+        by_month=_rollup_days(by_day, lambda row: row["_id"][:7]),
+        by_service=[
+            {"service_name": row["_id"], "amount": round(float(row["amount"]), 2), "count": int(row["count"])}
+            for row in tx["by_service"]
+        ],
+        total=totals["amount"],
+        count=totals["count"],
+        appointments=sum(statuses.values()),
+        cancelled=statuses.get(True, 0),
+        customers=customers["customers"],
+        repeat=customers["repeat"],
+    )
+
+
+async def revenue_analytics(db, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            engine: str = "facet") -> dict:
+    if engine == "pandas":
+        return await analytics_pandas(db, start_date, end_date)
+    if engine == "facet":
+        return await analytics_facet(db, start_date, end_date)
+    raise ValueError(f"unknown analytics engine: {engine}")
@@ -0,0 +1,98 @@
+"""
+Slot Availability Module
+
+Working hours come from Settings: a business day D opens at `work_start_hour`
+and closes at `work_end_hour`, which wraps past midnight when it is not after
+the start (default 07:00 -> 03:00). Slots after midnight fall on the next
+calendar date, so they are folded back into business day D here.
+
+Appointments are read by their canonical UTC `starts_at` (one index range
+scan) and placed on the grid in local time.
+
+Taken slots are kept as one integer bitmask per business day (bit i = slot i),
+which keeps month-wide calendars to a few dozen integers.
+"""
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from timeutil import local_day_range
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class SlotGrid:
+    """Slot start offsets (minutes after business-day midnight) of one day."""
+
+    def __init__(self, work_start_hour: int, work_end_hour: int, interval: int):
+        if interval <= 0:
+            raise ValueError("appointment_interval must be positive")
+        self.interval = interval
+        self.start = work_start_hour * 60
+        end = work_end_hour * 60
+        self.wraps = end <= self.start
+        if self.wraps:
+            end += MINUTES_PER_DAY
+        self.offsets = list(range(self.start, end - interval + 1, interval))
+        self.times = [f"{(o % MINUTES_PER_DAY) // 60:02d}:{o % 60:02d}" for o in self.offsets]
+        self.full_mask = (1 << len(self.offsets)) - 1
+
+    def locate(self, local_start: datetime) -> Tuple[date, int]:
+        """Map a local start time to (business day, offset in minutes)."""
+        calendar_date = local_start.date()
+        offset = local_start.hour * 60 + local_start.minute
+        if self.wraps and offset < self.start:
+            return calendar_date - timedelta(days=1), offset + MINUTES_PER_DAY
+        return calendar_date, offset
+
+    def busy_bits(self, offset: int) -> int:
+        """Bits of the slots overlapped by an appointment starting at `offset`."""
+        bits = 0
+        first = (offset - self.start) // self.interval
+        for i in (first, first + 1):
+            if 0 <= i < len(self.offsets):
+                slot = self.offsets[i]
+                if slot < offset + self.interval and offset < slot + self.interval:
+                    bits |= 1 << i
+        return bits
+
+    def started_mask(self, day: date, now_local: datetime) -> int:
+        """Bits of the slots of `day` that already started at `now_local`."""
+        elapsed = (now_local - datetime.combine(day, datetime.min.time())) / timedelta(minutes=1)
+        return (1 << bisect_right(self.offsets, elapsed)) - 1 if elapsed >= 0 else 0
+
+
+def query_range(grid: SlotGrid, start_day: date, end_day: date) -> dict:
+    """starts_at filter for the business days (one extra calendar day for the wrap)."""
+    return local_day_range(start_day, end_day + timedelta(days=1) if grid.wraps else end_day)
+
+
+def busy_masks(grid: SlotGrid, appointments: Iterable[dict], start_day: date, end_day: date,
+               tz: tzinfo) -> Dict[date, int]:
+    masks: Dict[date, int] = {}
+    for appt in appointments:
+        starts_at = appt.get('starts_at')
+        if starts_at is None:
+            continue
+        day, offset = grid.locate(starts_at.astimezone(tz))
+        if start_day <= day <= end_day:
+            masks[day] = masks.get(day, 0) | grid.busy_bits(offset)
+    return masks
+
+
+def free_days(grid: SlotGrid, masks: Dict[date, int], start_day: date, end_day: date,
+              now_local: Optional[datetime] = None) -> List[dict]:
+    days = []
+    day = start_day
+    while day <= end_day:
+        taken = masks.get(day, 0)
+        if now_local is not None:
+            taken |= grid.started_mask(day, now_local)
+        free = grid.full_mask & ~taken
+        days.append({
+            "date": day.isoformat(),
+            "free_mask": format(free, "x"),
+            "free_slots": [t for i, t in enumerate(grid.times) if free >> i & 1],
+        })
+        day += timedelta(days=1)
+    return days
@@ -0,0 +1,99 @@
+"""
+Analytics Benchmark
+
+Seeds a scratch database with a synthetic multi-year history and times both
+analytics engines ("facet" and "pandas") on it, checking that they agree.
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017 python bench_analytics.py --years 5 --per-day 60
+    MONGO_URL=... python bench_analytics.py --skip-seed --start 2023-01-01 --end 2023-12-31
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from analytics import ENGINES, revenue_analytics
+
+BENCH_DB = 'royal_koltuk_bench'
+SERVICES = [("Koltuk Yıkama", 750.0), ("Halı Yıkama", 400.0), ("Yatak Temizliği", 600.0),
+            ("Sandalye Yıkama", 150.0), ("Araç Koltuğu", 900.0)]
+
+
+async def seed(db, years: int, per_day: int, customers: int):
+    await db.appointments.drop()
+    await db.transactions.drop()
+    rng = random.Random(42)
+    day = date.today() - timedelta(days=365 * years)
+    appointments, transactions = [], []
+    while day <= date.today():
+        for slot in range(per_day):
+            name, price = rng.choice(SERVICES)
+            appt_id = str(uuid.uuid4())
+            status = rng.choices(("Tamamlandı", "İptal", "Bekliyor"), (85, 10, 5))[0]
+            appointments.append({
+                "id": appt_id, "customer_name": "Müşteri", "phone": f"05{rng.randrange(customers):09d}",
+                "address": "-", "service_id": name, "service_name": name, "service_price": price,
+                "appointment_date": day.isoformat(), "appointment_time": f"{7 + slot % 20:02d}:00",
+                "status": status, "created_at": datetime.now(timezone.utc),
+            })
+            if status == "Tamamlandı":
+                transactions.append({
+                    "id": str(uuid.uuid4()), "appointment_id": appt_id, "customer_name": "Müşteri",
+                    "service_name": name, "amount": price, "date": day.isoformat(),
+                    "created_at": datetime.now(timezone.utc),
+                })
+        if len(appointments) >= 20_000:
+            await db.appointments.insert_many(appointments, ordered=False)
+            await db.transactions.insert_many(transactions, ordered=False)
+            appointments, transactions = [], []
+        day += timedelta(days=1)
+    if appointments:
+        await db.appointments.insert_many(appointments, ordered=False)
+    if transactions:
+        await db.transactions.insert_many(transactions, ordered=False)
+    await db.appointments.create_index([("appointment_date", -1), ("id", -1)])
+    await db.transactions.create_index([("date", -1), ("id", -1)])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark analytics engines")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--per-day", type=int, default=60)
+    parser.add_argument("--customers", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[BENCH_DB]
+    if not args.skip_seed:
+        print(f"Seeding {args.years} years x {args.per_day} appointments/day...")
+        await seed(db, args.years, args.per_day, args.customers)
+    print(f"appointments={await db.appointments.estimated_document_count()} "
+          f"transactions={await db.transactions.estimated_document_count()}")
+
+    results = {}
+    for engine in ENGINES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results[engine] = await revenue_analytics(db, args.start, args.end, engine)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{engine:>6}: best={timings[0] * 1000:.0f} ms median={timings[len(timings) // 2] * 1000:.0f} ms")
+
+    first, *others = results.values()
+    print("results match" if all(other == first for other in others) else "❌ results differ")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
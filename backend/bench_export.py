@@ -0,0 +1,113 @@
+"""
+Export Benchmark
+
+Streams N synthetic transactions through the export writers and reports
+throughput, output size and peak memory. By default the rows come from an
+in-memory generator so only the writer is measured; with --mongo they are
+inserted into a scratch database first and read back through Motor.
+
+Kullanım:
+    python bench_export.py --rows 1000000
+    python bench_export.py --rows 1000000 --gzip
+    python bench_export.py --rows 200000 --format xlsx
+    MONGO_URL=mongodb://localhost:27017 python bench_export.py --rows 1000000 --mongo
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+import tracemalloc
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from export import EXPORT_BATCH_SIZE, TRANSACTION_COLUMNS, stream_csv, stream_xlsx
+
+
+def synthetic_transaction(i: int) -> dict:
+    day = date(2020, 1, 1) + timedelta(days=i % 2000)
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "appointment_id": str(uuid.UUID(int=i + 10**12)),
+        "customer_name": f"Müşteri {i % 5000}",
+        "service_name": ("Koltuk Yıkama", "Halı Yıkama", "Yatak Temizliği")[i % 3],
+        "amount": float(250 + i % 750),
+        "date": day.isoformat(),
+        "created_at": datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc),
+    }
+
+
+class SyntheticCursor:
+    """Just enough of a Motor cursor (to_list) to feed the export writers."""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.position = 0
+
+    async def to_list(self, length: int):
+        end = min(self.position + length, self.rows)
+        batch = [synthetic_transaction(i) for i in range(self.position, end)]
+        self.position = end
+        return batch
+
+
+async def seed(db, rows: int):
+    await db.transactions.drop()
+    for start in range(0, rows, 10_000):
+        await db.transactions.insert_many(
+            [synthetic_transaction(i) for i in range(start, min(start + 10_000, rows))], ordered=False
+        )
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming exports")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=("csv", "xlsx"), default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--mongo", action="store_true", help="read the rows back from MONGO_URL")
+    parser.add_argument("--trace", action="store_true", help="report Python heap peak (slower)")
+    args = parser.parse_args()
+
+    client = None
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client['royal_koltuk_bench']
+        print(f"Seeding {args.rows} transactions...")
+        await seed(db, args.rows)
+        cursor = db.transactions.find({}, {"_id": 0}).sort([("date", 1), ("id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    else:
+        cursor = SyntheticCursor(args.rows)
+
+    if args.format == "xlsx":
+        body = stream_xlsx(cursor, TRANSACTION_COLUMNS)
+    else:
+        body = stream_csv(cursor, TRANSACTION_COLUMNS, compress=args.gzip)
+
+    if args.trace:
+        tracemalloc.start()
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    size = chunks = 0
+    async for chunk in body:
+        size += len(chunk)
+        chunks += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"rows={args.rows} format={args.format}{'+gzip' if args.gzip else ''} source={'mongo' if args.mongo else 'synthetic'}")
+    print(f"time={elapsed:.2f}s rows/s={args.rows / elapsed:,.0f} output={size / 2**20:.1f} MiB chunks={chunks}")
+    print(f"peak_rss={peak_rss_mb():.0f} MiB (before export {rss_before:.0f} MiB)")
+    if args.trace:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"python_heap_peak={peak / 2**20:.1f} MiB")
+    if client is not None:
+        await client['royal_koltuk_bench'].transactions.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
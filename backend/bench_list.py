@@ -0,0 +1,190 @@
+"""
+Appointment List Benchmark
+
+GET /api/appointments latency over a seeded appointments collection:
+
+    before: the pre-sweeper handler; reads up to 1000 rows, parses every
+            "Bekliyor" date with strptime, builds Transaction models and
+            completes the due ones with update_many + insert_many, then
+            validates the rows through response_model
+    after:  the current handler; an index-backed page read and nothing else,
+            completion runs in complete_due_appointments
+
+Before each "before" request `--due` appointments are set back to "Bekliyor"
+(untimed), so every read has the completion work the old code did while
+the salon was open. Requests go through the ASGI app in-process.
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017 python bench_list.py --rows 10000 100000
+    python bench_list.py --memory   # mongomock_motor ile, Mongo gerekmez
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')  # Motor bağlanmadan import edilir
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+import httpx
+from fastapi import APIRouter, Depends
+
+import server
+from customers import customer_key
+from indexes import ensure_indexes
+from search import search_keys
+from timeutil import appointment_starts_at
+
+BENCH_DB = 'royal_koltuk_bench'
+SLOTS_PER_DAY = 20
+BATCH = 10_000
+
+
+async def seed(db, rows: int) -> List[str]:
+    """Past appointments, completed; returns the ids of the latest day's slots"""
+    await db.appointments.drop()
+    await db.transactions.drop()
+    first_day = date.today() - timedelta(days=rows // SLOTS_PER_DAY + 2)
+    batch = []
+    for i in range(rows):
+        day = (first_day + timedelta(days=i // SLOTS_PER_DAY)).isoformat()
+        slot = i % SLOTS_PER_DAY
+        time_str = f"{8 + slot // 2:02d}:{slot % 2 * 30:02d}"
+        name, phone = f"Müşteri {i}", f"0545{i:07d}"
+        starts_at = appointment_starts_at(day, time_str)
+        batch.append({
+            "id": str(uuid.uuid4()), "customer_name": name, "phone": phone, "address": "-",
+            "service_id": "bench", "service_name": "Koltuk Yıkama", "service_price": 750.0,
+            "appointment_date": day, "appointment_time": time_str, "status": "Tamamlandı",
+            "slot_active": True, "starts_at": starts_at, "customer_key": customer_key(phone),
+            "search_keys": search_keys(name, phone), "created_at": starts_at,
+            "updated_at": starts_at, "completed_at": starts_at.isoformat(),
+        })
+        if len(batch) == BATCH:
+            await db.appointments.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.appointments.insert_many(batch, ordered=False)
+    latest = await db.appointments.find({}, {"_id": 0, "id": 1}).sort(
+        [("appointment_date", -1), ("id", -1)]).limit(SLOTS_PER_DAY).to_list(None)
+    return [doc["id"] for doc in latest]
+
+
+legacy_router = APIRouter()
+
+
+@legacy_router.get("/bench/legacy-appointments", response_model=List[server.Appointment])
+async def legacy_get_appointments(
+    date: Optional[str] = None,
+    status: Optional[str] = None,
+    current_user: server.User = Depends(server.get_current_user)
+):
+    """get_appointments as it was before the completion sweeper"""
+    query = {}
+    if date: query['appointment_date'] = date
+    if status: query['status'] = status
+    appointments_from_db = await server.db.appointments.find(query, {"_id": 0}).sort("appointment_date", -1).to_list(1000)
+
+    turkey_tz = ZoneInfo("Europe/Istanbul")
+    now = datetime.now(turkey_tz)
+    ids_to_update = []
+    transactions_to_create = []
+    for appt in appointments_from_db:
+        if isinstance(appt.get('created_at'), str):
+            appt['created_at'] = datetime.fromisoformat(appt['created_at'])
+        if appt.get('status') == 'Bekliyor':
+            try:
+                naive_dt = datetime.strptime(f"{appt['appointment_date']} {appt['appointment_time']}", "%Y-%m-%d %H:%M")
+                if now >= naive_dt.replace(tzinfo=turkey_tz) + timedelta(hours=1):
+                    appt['status'] = 'Tamamlandı'
+                    appt['completed_at'] = datetime.now(timezone.utc).isoformat()
+                    ids_to_update.append(appt['id'])
+                    trans_doc = server.Transaction(
+                        appointment_id=appt['id'], customer_name=appt['customer_name'],
+                        service_name=appt['service_name'], amount=appt['service_price'],
+                        date=appt['appointment_date']
+                    ).model_dump()
+                    trans_doc['created_at'] = trans_doc['created_at'].isoformat()
+                    transactions_to_create.append(trans_doc)
+            except (ValueError, TypeError) as e:
+                logging.warning(f"Randevu {appt['id']} için tarih ayrıştırılamadı: {e}")
+
+    if ids_to_update:
+        await server.db.appointments.update_many(
+            {"id": {"$in": ids_to_update}},
+            {"$set": {"status": "Tamamlandı", "completed_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    if transactions_to_create:
+        await server.db.transactions.insert_many(transactions_to_create)
+    return appointments_from_db
+
+
+async def measure(http, path: str, repeat: int, reset=None) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        if reset:
+            await reset()
+        started = time.perf_counter()
+        response = await http.get(path)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(label: str, timings: List[float]) -> str:
+    timings = sorted(timings)
+    return (f"  {label:>6}: p50={statistics.median(timings):.1f} ms "
+            f"p90={timings[int(len(timings) * 0.9) - 1]:.1f} ms max={timings[-1]:.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark GET /api/appointments before and after the completion sweeper")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--due", type=int, default=SLOTS_PER_DAY, help="appointments to complete per 'before' read")
+    parser.add_argument("--memory", action="store_true", help="use mongomock_motor instead of MONGO_URL")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.memory:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient(tz_aware=True)[BENCH_DB]
+    else:
+        db = server.client[BENCH_DB]
+    server.db = db
+    server.app.include_router(legacy_router)
+    server.app.dependency_overrides[server.get_current_user] = lambda: server.User(username="bench")
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+            for rows in args.rows:
+                print(f"Seeding {rows} appointments...")
+                due = (await seed(db, rows))[:args.due]
+                if not args.memory:
+                    await ensure_indexes(db)
+
+                async def reopen():
+                    await db.appointments.update_many({"id": {"$in": due}}, {"$set": {"status": "Bekliyor"}})
+                    await db.transactions.delete_many({})
+
+                print(f"rows={rows} repeat={args.repeat} due/read={len(due)}")
+                before = await measure(http, "/bench/legacy-appointments", args.repeat, reopen)
+                print(summary("before", before))
+                await server.complete_due_appointments()
+                after = await measure(http, "/api/appointments", args.repeat)
+                print(summary("after", after))
+    finally:
+        server.app.dependency_overrides.clear()
+        if not args.memory:
+            await server.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
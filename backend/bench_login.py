@@ -0,0 +1,125 @@
+"""
+Login Storm Benchmark
+
+Latency of an ordinary authenticated endpoint (GET /api/services) while many
+clients log in at once:
+
+    idle:    no logins, the baseline
+    inline:  bcrypt verification on the event loop (what /api/token did
+             before password_executor)
+    pool:    verification in password_executor (PASSWORD_HASH_WORKERS threads)
+
+A probe is due every 10 ms and its latency counts from when it was due, so
+time the event loop spends blocked shows up. Requests go through the ASGI app
+in-process; rate limiting is turned off so every login reaches bcrypt.
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017 python bench_login.py --logins 100
+    python bench_login.py --memory   # mongomock_motor ile, Mongo gerekmez
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')  # Motor bağlanmadan import edilir
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+os.environ.setdefault('BCRYPT_ROUNDS', '12')
+
+import httpx
+
+import server
+
+BENCH_DB = 'royal_koltuk_bench'
+PASSWORD = 'bench-password'
+PROBE_INTERVAL = 0.01
+
+
+async def inline_verify(plain_password, hashed_password):
+    """The pre-executor code path"""
+    return server.pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def summary(label: str, latencies: list) -> str:
+    latencies = sorted(latencies)
+    return (f"  {label:>6}: probes={len(latencies)} p50={latencies[len(latencies) // 2] * 1000:.1f} ms "
+            f"p99={latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000:.1f} ms "
+            f"max={latencies[-1] * 1000:.1f} ms")
+
+
+async def run(label: str, http, token: str, logins: int, concurrency: int):
+    latencies = []
+    counter = iter(range(logins))
+    storm_done = asyncio.Event()
+
+    async def login_worker():
+        for _ in counter:
+            response = await http.post("/api/token", data={"username": "bench", "password": PASSWORD})
+            response.raise_for_status()
+
+    async def probe():
+        # Gecikme planlanan gönderim anından ölçülür; event loop bloklanınca
+        # bekleyen probe'lar da sayılır (coordinated omission)
+        headers = {"Authorization": f"Bearer {token}"}
+        intended = time.perf_counter()
+        while not storm_done.is_set():
+            response = await http.get("/api/services", headers=headers)
+            response.raise_for_status()
+            finished = time.perf_counter()
+            while intended <= finished:
+                latencies.append(finished - intended)
+                intended += PROBE_INTERVAL
+            await asyncio.sleep(intended - finished)
+
+    prober = asyncio.create_task(probe())
+    started = time.perf_counter()
+    if logins:
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+    else:
+        await asyncio.sleep(2)
+    elapsed = time.perf_counter() - started
+    storm_done.set()
+    await prober
+    rate = f"  logins={logins / elapsed:.1f}/s" if logins else ""
+    print(summary(label, latencies) + rate)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark endpoint latency during a login storm")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--memory", action="store_true", help="use mongomock_motor instead of MONGO_URL")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.memory:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient(tz_aware=True)[BENCH_DB]
+    else:
+        db = server.client[BENCH_DB]
+    server.db = db
+    await db.users.delete_many({})
+    await db.services.delete_many({})
+    await db.services.insert_one({"id": "bench", "name": "Koltuk Yıkama", "price": 750.0})
+    await db.users.insert_one({"username": "bench", "hashed_password": await server.get_password_hash(PASSWORD)})
+    print(f"bcrypt rounds={server.BCRYPT_ROUNDS} pool={server.PASSWORD_HASH_WORKERS} cpus={os.cpu_count()} "
+          f"logins={args.logins} concurrency={args.concurrency}")
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+            token = server.create_access_token({"sub": "bench"})
+            await run("idle", http, token, 0, 0)
+            pooled = server.verify_and_update_password
+            server.verify_and_update_password = inline_verify
+            await run("inline", http, token, args.logins, args.concurrency)
+            server.verify_and_update_password = pooled
+            await run("pool", http, token, args.logins, args.concurrency)
+    finally:
+        if not args.memory:
+            await server.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+Real-time Feed Load Test
+
+Connects N WebSocket subscribers to a running API (/api/ws), then updates
+appointments directly in Mongo and measures how long each change takes to
+reach every subscriber (write -> receive), plus delivery completeness.
+
+Change streams need a replica set; a throwaway local one:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017 &
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 uvicorn server:app --port 8001 --workers 2
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python bench_realtime.py \\
+        --api http://localhost:8001 --username admin --password ... --subscribers 300 --updates 200
+
+--synthetic needs neither Mongo nor a server: change events are fed straight
+into one in-process ChangeFeed whose subscribers are stub sockets, so it
+measures only the per-worker fan-out (delta encoding, queues, sends):
+
+    python bench_realtime.py --synthetic --subscribers 300 --updates 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+
+import aiohttp
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from realtime import ChangeFeed
+
+BENCH_PREFIX = "bench-realtime"
+
+
+async def login(session, api: str, username: str, password: str) -> str:
+    async with session.post(f"{api}/api/token", data={"username": username, "password": password}) as response:
+        response.raise_for_status()
+        return (await response.json())["access_token"]
+
+
+async def subscriber(session, url: str, token: str, ready: asyncio.Event, latencies: list, received: list,
+                     index: int):
+    async with session.ws_connect(url, protocols=("bearer", token), heartbeat=30) as ws:
+        ready.set()
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            record(message.data, latencies, received, index)
+
+
+def record(message: str, latencies: list, received: list, index: int):
+    delta = json.loads(message)
+    notes = (delta.get("fields") or {}).get("notes", "")
+    if delta.get("type") == "change" and notes.startswith(BENCH_PREFIX):
+        latencies.append(time.time() - float(notes.split(":")[1]))
+        received[index] += 1
+
+
+class StubSocket:
+    """Accepted WebSocket stand-in: records sends, never receives"""
+
+    def __init__(self, latencies: list, received: list, index: int):
+        self.latencies, self.received, self.index = latencies, received, index
+        self.closed = asyncio.Event()
+
+    async def send_text(self, message: str):
+        record(message, self.latencies, self.received, self.index)
+
+    async def iter_text(self):
+        await self.closed.wait()
+        return
+        yield
+
+    async def close(self, code: int = 1000):
+        self.closed.set()
+
+
+async def synthetic(args, latencies: list, received: list):
+    feed = ChangeFeed(None, {"appointments": ["id", "customer_name", "status", "notes"]})
+    sockets = [StubSocket(latencies, received, i) for i in range(args.subscribers)]
+    tasks = [asyncio.create_task(feed.serve(socket)) for socket in sockets]
+    await asyncio.sleep(0)
+    appointment_id = f"{BENCH_PREFIX}-{uuid.uuid4()}"
+
+    for i in range(args.updates):
+        notes = f"{BENCH_PREFIX}:{time.time()}"
+        feed._publish(*feed.delta({
+            "_id": {"_data": f"{i:032x}"}, "ns": {"coll": "appointments"}, "operationType": "update",
+            "fullDocument": {"id": appointment_id, "status": "Bekliyor", "notes": notes},
+            "updateDescription": {"updatedFields": {"notes": notes}, "removedFields": []},
+        }))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.sleep(0.5)
+    for socket in sockets:
+        await socket.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the /api/ws change feed")
+    parser.add_argument("--api", default="http://localhost:8001")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50, help="updates per second")
+    parser.add_argument("--synthetic", action="store_true", help="in-process fan-out only (no Mongo/server)")
+    args = parser.parse_args()
+
+    latencies, received = [], [0] * args.subscribers
+    if args.synthetic:
+        await synthetic(args, latencies, received)
+        report(args, latencies, received)
+        return
+    if not args.username or not args.password:
+        parser.error("--username and --password are required without --synthetic")
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ.get('DB_NAME', 'royal_koltuk')]
+    appointment_id = f"{BENCH_PREFIX}-{uuid.uuid4()}"
+    await db.appointments.insert_one({
+        "id": appointment_id, "customer_name": "Bench", "phone": "05000000000", "address": "-",
+        "service_id": "-", "service_name": "-", "service_price": 0.0, "appointment_date": "2000-01-01",
+        "appointment_time": "00:00", "notes": "", "status": "İptal", "slot_active": False,
+    })
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = await login(session, args.api, args.username, args.password)
+        url = f"{args.api.replace('http', 'ws', 1)}/api/ws"
+        readies = [asyncio.Event() for _ in range(args.subscribers)]
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(subscriber(session, url, token, readies[i], latencies, received, i))
+                 for i in range(args.subscribers)]
+        await asyncio.wait_for(asyncio.gather(*(ready.wait() for ready in readies)), timeout=60)
+        print(f"{args.subscribers} subscribers connected in {time.perf_counter() - started:.1f}s")
+
+        for _ in range(args.updates):
+            await db.appointments.update_one({"id": appointment_id},
+                                             {"$set": {"notes": f"{BENCH_PREFIX}:{time.time()}"}})
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.sleep(2)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    await db.appointments.delete_one({"id": appointment_id})
+    client.close()
+    report(args, latencies, received)
+
+
+def report(args, latencies: list, received: list):
+    expected = args.subscribers * args.updates
+    print(f"delivered {len(latencies)}/{expected} deltas "
+          f"({min(received)}..{max(received)} per subscriber)")
+    if latencies:
+        latencies.sort()
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"latency p50={quantiles[49] * 1000:.1f} ms p95={quantiles[94] * 1000:.1f} ms "
+              f"p99={quantiles[98] * 1000:.1f} ms max={latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
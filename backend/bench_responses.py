@@ -0,0 +1,127 @@
+"""
+List Response Benchmark
+
+CPU time per request spent turning 1000 Mongo documents into the response
+body of GET /api/appointments and GET /api/transactions:
+
+    before: created_at stored as an ISO string and parsed per row, then
+            FastAPI validates and serializes every row through response_model
+            and encodes it with the standard json module
+    after:  created_at is a BSON datetime, only the model's fields are
+            projected, defaults filled in and the rows encoded with orjson
+
+The Mongo round trip is the same for both and is not measured.
+
+Kullanım:
+    python bench_responses.py
+    python bench_responses.py --rows 1000 --repeat 500
+"""
+import argparse
+import asyncio
+import copy
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')  # Motor bağlanmadan import edilir
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from responses import ORJSON_AVAILABLE, FastJSONResponse
+from server import TRUSTED_APPOINTMENTS, TRUSTED_TRANSACTIONS, app
+from search import search_keys
+
+
+def synthetic_appointment(i: int) -> dict:
+    day = date(2024, 1, 1) + timedelta(days=i % 365)
+    created = datetime(day.year, day.month, day.day, 9, 30, 15, 123000, tzinfo=timezone.utc)
+    name, phone = f"Ayşe Yılmaz {i}", f"0545{i:07d}"
+    return {
+        "id": str(uuid.UUID(int=i)), "customer_name": name, "phone": phone,
+        "address": "Nevşehir Merkez", "service_id": "koltuk", "service_name": "Koltuk Yıkama",
+        "service_price": 750.0, "appointment_date": day.isoformat(), "appointment_time": "10:30",
+        "notes": "", "status": "Bekliyor", "created_at": created, "completed_at": None,
+        "starts_at": created, "slot_active": True, "customer_key": phone[1:],
+        "search_keys": search_keys(name, phone),
+    }
+
+
+def synthetic_transaction(i: int) -> dict:
+    day = date(2024, 1, 1) + timedelta(days=i % 365)
+    return {
+        "id": str(uuid.UUID(int=i)), "appointment_id": str(uuid.UUID(int=i + 10**12)),
+        "customer_name": f"Ayşe Yılmaz {i}", "service_name": "Koltuk Yıkama", "amount": 750.0,
+        "date": day.isoformat(), "created_at": datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc),
+        "customer_key": f"545{i:07d}",
+    }
+
+
+def legacy_docs(docs, excluded=()):
+    """What the old handlers read: every stored field, created_at as a string."""
+    rows = []
+    for doc in docs:
+        row = {key: value for key, value in doc.items() if key not in excluded}
+        row["created_at"] = row["created_at"].isoformat()
+        rows.append(row)
+    return rows
+
+
+def response_field(path: str):
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path == path and "GET" in route.methods:
+            return route.response_field
+    raise LookupError(path)
+
+
+async def before(rows, field) -> bytes:
+    for row in rows:
+        if isinstance(row.get('created_at'), str):
+            row['created_at'] = datetime.fromisoformat(row['created_at'])
+    content = await serialize_response(field=field, response_content=rows, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def after(rows, trusted) -> bytes:
+    return FastJSONResponse(trusted.rows(rows)).body
+
+
+async def measure(label, make_rows, work, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        rows = make_rows()
+        started = time.process_time()
+        body = await work(rows)
+        timings.append(time.process_time() - started)
+    timings.sort()
+    print(f"  {label:>6}: median={timings[len(timings) // 2] * 1000:.2f} ms CPU "
+          f"best={timings[0] * 1000:.2f} ms  body={len(body) / 1024:.0f} KiB")
+    return timings[len(timings) // 2]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    print(f"orjson={'yes' if ORJSON_AVAILABLE else 'no'} rows={args.rows} repeat={args.repeat}")
+
+    endpoints = [
+        ("/api/appointments", synthetic_appointment, TRUSTED_APPOINTMENTS, ("_id", "search_keys")),
+        ("/api/transactions", synthetic_transaction, TRUSTED_TRANSACTIONS, ("_id",)),
+    ]
+    for path, make_doc, trusted, excluded in endpoints:
+        docs = [make_doc(i) for i in range(args.rows)]
+        legacy = legacy_docs(docs, excluded)
+        projected = [{key: doc[key] for key in trusted.projection if key in doc} for doc in docs]
+        field = response_field(path)
+
+        print(path)
+        slow = await measure("before", lambda: copy.deepcopy(legacy), lambda rows: before(rows, field), args.repeat)
+        fast = await measure("after", lambda: copy.deepcopy(projected), lambda rows: after(rows, trusted), args.repeat)
+        print(f"  speedup x{slow / fast:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Search Benchmark
+
+Seeds a scratch database with synthetic appointments (Turkish names, mixed
+phone formats) and compares typeahead latency of the old unanchored $regex
+filter with the search_keys lookup, including the keys/documents examined.
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017 python bench_search.py --rows 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import time
+import uuid
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import INDEXES, ensure_indexes
+from search import search_filter, search_keys
+
+BENCH_DB = 'royal_koltuk_bench'
+FIRST_NAMES = ["Ayşe", "Fatma", "Emine", "Hatice", "Zeynep", "Elif", "Mehmet", "Mustafa", "Ahmet", "Ali",
+               "Hüseyin", "Hasan", "İbrahim", "İsmail", "Ömer", "Şükrü", "Çağrı", "Gülşen", "Özlem", "Işıl"]
+LAST_NAMES = ["Yılmaz", "Kaya", "Demir", "Şahin", "Çelik", "Yıldız", "Yıldırım", "Öztürk", "Aydın", "Özdemir",
+              "Arslan", "Doğan", "Kılıç", "Aslan", "Çetin", "Kara", "Koç", "Kurt", "Özkan", "Şimşek"]
+PHONE_FORMATS = ["0{}", "+90{}", "{}", "0{} ", "90 {}"]
+QUERIES = ["a", "ay", "ayş", "ayşe", "ayşe y", "ayşe yıl", "ŞAHİN", "işıl", "0545", "0545 12", "+90 532 4"]
+
+
+async def seed(db, rows: int):
+    await db.appointments.drop()
+    rng = random.Random(7)
+    batch = []
+    for i in range(rows):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        phone = rng.choice(PHONE_FORMATS).format(f"5{rng.randrange(10**9):09d}")
+        batch.append({
+            "id": str(uuid.uuid4()), "customer_name": name, "phone": phone,
+            "appointment_date": f"202{rng.randrange(5)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            "appointment_time": "10:00", "status": "Tamamlandı", "address": "-",
+            "service_id": "bench", "service_name": "Koltuk Yıkama", "service_price": 750.0,
+            "created_at": "2024-01-01T00:00:00+00:00", "search_keys": search_keys(name, phone),
+        })
+        if len(batch) == 10_000:
+            await db.appointments.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.appointments.insert_many(batch, ordered=False)
+    await ensure_indexes(db, {"appointments": INDEXES["appointments"]})
+
+
+def regex_filter(query: str) -> dict:
+    return {"$or": [{"customer_name": {"$regex": re.escape(query), "$options": "i"}},
+                    {"phone": {"$regex": re.escape(query), "$options": "i"}}]}
+
+
+async def measure(db, query_filter: dict, repeat: int, limit: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await db.appointments.find(query_filter, {"_id": 0, "search_keys": 0}).sort(
+            [("appointment_date", -1), ("id", -1)]).limit(limit).to_list(limit)
+        timings.append((time.perf_counter() - started) * 1000)
+    explain = await db.appointments.find(query_filter).sort(
+        [("appointment_date", -1), ("id", -1)]).limit(limit).explain()
+    stats = explain.get("executionStats", {})
+    return statistics.median(timings), stats.get("totalKeysExamined"), stats.get("totalDocsExamined")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark appointment search")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[BENCH_DB]
+    if not args.skip_seed:
+        print(f"Seeding {args.rows} appointments...")
+        await seed(db, args.rows)
+
+    print(f"{'query':<12} {'regex ms':>9} {'docs':>8} | {'keys ms':>8} {'keys':>6} {'docs':>6}")
+    for query in QUERIES:
+        regex_ms, _, regex_docs = await measure(db, regex_filter(query), args.repeat, args.limit)
+        keys_ms, keys, docs = await measure(db, search_filter(query), args.repeat, args.limit)
+        print(f"{query:<12} {regex_ms:>9.1f} {regex_docs or 0:>8} | {keys_ms:>8.1f} {keys or 0:>6} {docs or 0:>6}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+SMS Dispatch Benchmark
+
+POST /api/appointments latency while the SMS provider (fake_iletimerkezi, run
+in its own thread) answers slowly:
+
+    before: the handler sends the confirmation SMS itself with a blocking
+            requests.get (what server.py did before the dispatch queue)
+    after:  the handler only inserts into sms_log; SmsDispatcher workers
+            deliver in the background
+
+Requests are issued by `--concurrency` clients in parallel through the ASGI
+app, so in "before" every request also waits for the others' SMS calls.
+
+Kullanım:
+    MONGO_URL=mongodb://localhost:27017 python bench_sms.py --delay 1 --requests 200
+    python bench_sms.py --memory   # mongomock_motor ile, Mongo gerekmez
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')  # Motor bağlanmadan import edilir
+
+import httpx
+import requests
+from aiohttp import web
+
+import fake_iletimerkezi
+import server
+import sms
+
+BENCH_DB = 'royal_koltuk_bench'
+
+
+def start_provider(delay: float) -> str:
+    """Fake provider on its own loop, so a blocking client cannot stall it"""
+    started = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(fake_iletimerkezi.make_app(delay, 0.0))
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", 0).start())
+        address["url"] = "http://{}:{}".format(*runner.addresses[0][:2])
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return address["url"]
+
+
+def blocking_send(api_url: str):
+    """The pre-queue code path: one synchronous HTTP call inside the handler"""
+    async def send(to_phone: str, message: str, kind: str = "generic"):
+        requests.get(f"{api_url}/v1/send-sms/get/", params={"receipents": to_phone, "text": message}, timeout=10)
+        return None
+    return send
+
+
+async def run(label: str, db, total: int, concurrency: int):
+    await db.appointments.delete_many({})
+    await db.services.delete_many({})
+    await db.services.insert_one({"id": "bench", "name": "Koltuk Yıkama", "price": 750.0})
+    latencies = []
+    counter = iter(range(total))
+
+    async def worker(http):
+        for i in counter:
+            body = {
+                "customer_name": "Bench", "phone": "05455953250", "address": "-", "service_id": "bench",
+                "appointment_date": f"2099-{i // 28 % 12 + 1:02d}-{i % 28 + 1:02d}",
+                "appointment_time": f"{8 + i // 336 % 12:02d}:00",
+            }
+            started = time.perf_counter()
+            response = await http.post("/api/appointments", json=body)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"  {label:>6}: p50={latencies[len(latencies) // 2] * 1000:.0f} ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f} ms "
+          f"max={latencies[-1] * 1000:.0f} ms  throughput={total / elapsed:.1f} req/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark appointment creation with a slow SMS provider")
+    parser.add_argument("--delay", type=float, default=1.0, help="provider response time (s)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--memory", action="store_true", help="use mongomock_motor instead of MONGO_URL")
+    args = parser.parse_args()
+
+    if args.memory:
+        from mongomock_motor import AsyncMongoMockClient
+        db = AsyncMongoMockClient(tz_aware=True)[BENCH_DB]
+    else:
+        db = server.client[BENCH_DB]
+    server.db = db
+    server.app.dependency_overrides[server.get_current_user] = lambda: server.User(username="bench")
+
+    api_url = start_provider(args.delay)
+    os.environ['ILETIMERKEZI_API_URL'] = api_url
+    print(f"provider delay={args.delay}s requests={args.requests} concurrency={args.concurrency}")
+
+    server.enqueue_sms = blocking_send(api_url)
+    await run("before", db, args.requests, args.concurrency)
+
+    server.enqueue_sms = sms.enqueue_sms
+    await sms.start_sms_dispatcher(db)
+    try:
+        await run("after", db, args.requests, args.concurrency)
+    finally:
+        await sms.stop_sms_dispatcher()
+        if not args.memory:
+            await server.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
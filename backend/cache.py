@@ -1,9 +1,28 @@
 """
 Redis Cache Helper Module
+
+Two tier cache: a bounded in-process LRU (L1) in front of Redis (L2).
+
+Cached values are grouped by tags (usually collection names). Every tag has a
+version counter in Redis and a local one per process; invalidation increments
+both and is broadcast to the other uvicorn workers over Redis pub/sub, so old
+entries become unreachable without searching keys. When Redis is down the
+cache keeps working with L1 only and reconnects in the background.
+
+The shared versions also serve as ETags for conditional GETs (etags.py); while
+Redis is reachable L1 entries are only used under the shared version they
+were stored with, so a body is never older than the ETag sent with it.
 """
+import asyncio
+import hashlib
+import inspect
 import json
 import os
-from typing import Optional, Any
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
 from functools import wraps
 import logging
 
@@ -11,104 +30,371 @@ logger = logging.getLogger(__name__)
 
 # Try to import redis, but make it optional
 try:
-    import redis
+    import redis.asyncio as aioredis
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
     logger.warning("Redis module not found. Cache functionality will be disabled.")
 
+CACHE_L1_SIZE = int(os.environ.get('CACHE_L1_SIZE', '512'))
+CACHE_L1_TTL = float(os.environ.get('CACHE_L1_TTL', '30'))
+INVALIDATION_CHANNEL = "royal:invalidate"
+VERSION_EPOCH_KEY = "royal:epoch"
+REDIS_RETRY_SECONDS = 5
+
+# Parameters that never take part in a cache key (per-request objects)
+EXCLUDED_KEY_PARAMS = {"current_user", "request", "response", "background_tasks", "etag"}
+
 # Redis connection
 redis_client = None
+_pubsub_client = None
+_redis_ok = False
+_maintenance_task = None
+_instance_id = uuid.uuid4().hex
+
+# Local tag versions; bumped by local and broadcast invalidations
+_local_versions: Dict[str, int] = defaultdict(int)
+_invalidation_listeners: List[Callable[[Sequence[str]], None]] = []
+
+# In-flight computations per cache key (single-flight)
+_inflight: Dict[str, asyncio.Future] = {}
+
+# prefix -> Counter(l1_hits, l2_hits, misses, evictions)
+cache_stats: Dict[str, Counter] = defaultdict(Counter)
+
+
+class LRUCache:
+    """Size and TTL bounded LRU (event loop only, not thread safe)."""
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, _ = self._data.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def discard_where(self, predicate: Callable[[Any], bool]) -> int:
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _count_eviction(key):
+    cache_stats[key[0]]["evictions"] += 1
+
+
+_l1 = LRUCache(CACHE_L1_SIZE, CACHE_L1_TTL, on_evict=_count_eviction)
+
+
+async def init_redis():
+    """Initialize the Redis connection pool and the invalidation subscriber"""
+    global redis_client, _pubsub_client, _redis_ok, _maintenance_task
 
-def init_redis():
-    """Initialize Redis connection"""
-    global redis_client
-    
     if not REDIS_AVAILABLE:
         logger.info("Redis module not available. Cache functionality disabled.")
         redis_client = None
         return
-    
+
+    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+    timeout = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '0.5'))
+    redis_client = aioredis.from_url(
+        redis_url,
+        decode_responses=True,
+        max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', '50')),
+        socket_timeout=timeout,
+        socket_connect_timeout=timeout,
+    )
+    # Pub/sub bağlantısı uzun süre boşta bekler, okuma timeout'u olmamalı
+    _pubsub_client = aioredis.from_url(redis_url, decode_responses=True, socket_connect_timeout=timeout)
+
     try:
-        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379')
-        redis_client = redis.from_url(redis_url, decode_responses=True)
         # Test connection
-        redis_client.ping()
+        await redis_client.ping()
+        _redis_ok = True
         logger.info("Redis connection established")
     except Exception as e:
-        logger.warning(f"Redis connection failed: {e}. Cache will be disabled.")
-        redis_client = None
+        _redis_ok = False
+        logger.warning(f"Redis connection failed: {e}. Using in-process cache only.")
+
+    _maintenance_task = asyncio.create_task(_maintain_redis())
+
+
+async def close_redis():
+    global redis_client, _pubsub_client, _redis_ok, _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        await asyncio.gather(_maintenance_task, return_exceptions=True)
+        _maintenance_task = None
+    for client in (redis_client, _pubsub_client):
+        if client is not None:
+            await client.close()
+    redis_client = _pubsub_client = None
+    _redis_ok = False
+
+
+def get_redis():
+    """The Redis client if it is currently reachable, otherwise None."""
+    return redis_client if _redis_ok else None
+
+
+def mark_redis_down(error: Exception):
+    """Stop using Redis until the background health check reconnects."""
+    global _redis_ok
+    if _redis_ok:
+        logger.warning(f"Redis unavailable ({error}). Falling back to in-process cache.")
+    _redis_ok = False
+
+
+async def _listen_invalidations():
+    pubsub = _pubsub_client.pubsub()
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                data = json.loads(message["data"])
+            except (TypeError, ValueError):
+                continue
+            if data.get("src") != _instance_id:
+                _apply_invalidation(data.get("tags", []))
+    finally:
+        await pubsub.close()
+
+
+async def _maintain_redis():
+    """Reconnect after outages and apply invalidations broadcast by other workers."""
+    global _redis_ok
+    while True:
+        try:
+            if not _redis_ok:
+                await redis_client.ping()
+                _redis_ok = True
+                # Kesinti sırasında kaçırılan invalidasyonlar olabilir; yeni epoch
+                # kesinti öncesi verilen ETag'leri de geçersiz kılar
+                _l1.clear()
+                await redis_client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex[:8])
+                logger.info("Redis connection restored")
+            await _listen_invalidations()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            mark_redis_down(e)
+            await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+
+def add_invalidation_listener(listener: Callable[[Sequence[str]], None]):
+    """Call `listener(tags)` on every local or broadcast invalidation."""
+    _invalidation_listeners.append(listener)
+
+
+def _apply_invalidation(tags: Sequence[str]):
+    for tag in tags:
+        _local_versions[tag] += 1
+    for listener in _invalidation_listeners:
+        try:
+            listener(tags)
+        except Exception as e:
+            logger.error(f"Invalidation listener error: {e}")
+
 
 def get_cache_key(prefix: str, key: str) -> str:
     """Generate cache key"""
     return f"royal:{prefix}:{key}"
 
-def cache_result(prefix: str, ttl: int = 300):
+
+def get_version_key(tag: str) -> str:
+    return f"royal:ver:{tag}"
+
+
+def _json_default(value: Any):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def hash_arguments(func, args: tuple, kwargs: dict) -> str:
+    """Stable hash of the call arguments, ignoring per-request parameters."""
+    try:
+        bound = inspect.signature(func).bind_partial(*args, **kwargs)
+        arguments = bound.arguments
+    except TypeError:
+        arguments = {"args": list(args), **kwargs}
+    relevant = {k: v for k, v in arguments.items() if k not in EXCLUDED_KEY_PARAMS}
+    raw = json.dumps(relevant, sort_keys=True, default=_json_default, separators=(",", ":"))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+async def get_shared_versions(tags: Sequence[str]) -> Optional[str]:
+    """Version string of `tags` that every worker agrees on; None without Redis.
+
+    Prefixed with an epoch that changes when a worker reconnects after an
+    outage (its invalidations may not have reached Redis) or when Redis lost
+    its data, so a counter starting over never repeats an old version string.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        epoch, *versions = await client.mget([VERSION_EPOCH_KEY] + [get_version_key(tag) for tag in tags])
+        if epoch is None:
+            await client.set(VERSION_EPOCH_KEY, uuid.uuid4().hex[:8], nx=True)
+            epoch = await client.get(VERSION_EPOCH_KEY)
+    except Exception as e:
+        mark_redis_down(e)
+        return None
+    return ".".join([epoch, *(str(int(v)) if v is not None else "0" for v in versions)])
+
+
+def get_cache_stats() -> Dict[str, dict]:
+    """Hit/miss/eviction counters per prefix"""
+    stats = {}
+    for prefix, counter in cache_stats.items():
+        lookups = counter["l1_hits"] + counter["l2_hits"] + counter["misses"]
+        stats[prefix] = {
+            **counter,
+            "hit_ratio": round((counter["l1_hits"] + counter["l2_hits"]) / lookups, 4) if lookups else None,
+        }
+    return {"redis": _redis_ok, "l1_entries": len(_l1), "prefixes": stats}
+
+
+async def _single_flight(key: str, compute):
+    """Run `compute()` once per key even if many callers miss at the same time."""
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await compute()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved when nobody else is waiting
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def cache_result(prefix: str, ttl: int = 300, tags: Optional[Iterable[str]] = None):
     """
     Decorator to cache function results
-    
+
     Args:
         prefix: Cache key prefix
-        ttl: Time to live in seconds (default 5 minutes)
+        ttl: Time to live in seconds (default 5 minutes); L1 entries live at
+             most CACHE_L1_TTL seconds
+        tags: Invalidation tags (defaults to the prefix); invalidate_cache(tag)
+              makes every entry carrying that tag stale
     """
+    tags = tuple(tags) if tags else (prefix,)
+
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Skip caching if Redis is not available
-            if redis_client is None:
-                return await func(*args, **kwargs)
-            
-            # Generate cache key from function arguments
-            cache_key = get_cache_key(prefix, f"{func.__name__}:{str(args)}:{str(kwargs)}")
-            
-            try:
-                # Try to get from cache
-                cached_result = redis_client.get(cache_key)
-                if cached_result is not None:
-                    logger.debug(f"Cache hit: {cache_key}")
-                    return json.loads(cached_result)
-                
-                # Execute function
+            stats = cache_stats[prefix]
+            arg_hash = hash_arguments(func, args, kwargs)
+            l1_key = (prefix, f"{func.__name__}:{arg_hash}")
+            local_version = tuple(_local_versions[tag] for tag in tags)
+            # Redis varken L1 de paylaşılan versiyonla doğrulanır: başka worker'ın
+            # invalidasyonu pub/sub ile gelmeden, yeni versiyondan üretilen ETag
+            # eski gövdeyle gönderilmesin
+            shared_version = await get_shared_versions(tags)
+
+            entry = _l1.get(l1_key)
+            if entry is not None and entry[:2] == (local_version, shared_version):
+                stats["l1_hits"] += 1
+                return entry[2]
+
+            client = get_redis()
+            cache_key = None
+            if client is not None and shared_version is not None:
+                try:
+                    cache_key = get_cache_key(prefix, f"{func.__name__}:v{shared_version}:{arg_hash}")
+
+                    cached_result = await client.get(cache_key)
+                    if cached_result is not None:
+                        logger.debug(f"Cache hit: {cache_key}")
+                        stats["l2_hits"] += 1
+                        value = json.loads(cached_result)
+                        _l1.set(l1_key, (local_version, shared_version, value), ttl)
+                        return value
+                except Exception as e:
+                    mark_redis_down(e)
+                    cache_key = None
+
+            stats["misses"] += 1
+
+            async def compute():
                 result = await func(*args, **kwargs)
-                
-                # Store in cache
-                redis_client.setex(cache_key, ttl, json.dumps(result, default=str))
-                logger.debug(f"Cache miss, stored: {cache_key}")
-                
+                encoded = json.dumps(result, default=_json_default)
+                # L1 keeps the same JSON shaped value that L2 would return
+                _l1.set(l1_key, (local_version, shared_version, json.loads(encoded)), ttl)
+                if cache_key is not None:
+                    try:
+                        await client.setex(cache_key, ttl, encoded)
+                        logger.debug(f"Cache miss, stored: {cache_key}")
+                    except Exception as e:
+                        mark_redis_down(e)
                 return result
-            except Exception as e:
-                logger.error(f"Cache error: {e}")
-                # Fallback to function execution
-                return await func(*args, **kwargs)
-        
+
+            return await _single_flight(cache_key or repr(l1_key), compute)
+
         return wrapper
     return decorator
 
-def invalidate_cache(prefix: str, pattern: str = None):
+
+async def invalidate_cache(*tags: str):
     """
-    Invalidate cache entries
-    
+    Invalidate every cache entry carrying one of the given tags, in this
+    process immediately and in the other workers via pub/sub
+
     Args:
-        prefix: Cache key prefix
-        pattern: Optional pattern to match specific keys
+        tags: Tags (usually collection names) whose version is bumped
     """
-    if redis_client is None:
+    _apply_invalidation(tags)
+
+    client = get_redis()
+    if client is None:
         return
-    
+
     try:
-        if pattern:
-            cache_key = get_cache_key(prefix, pattern)
-            deleted = redis_client.delete(cache_key)
-        else:
-            # Delete all keys with this prefix
-            pattern_key = f"royal:{prefix}:*"
-            keys = redis_client.keys(pattern_key)
-            if keys:
-                deleted = redis_client.delete(*keys)
-            else:
-                deleted = 0
-        
-        logger.info(f"Invalidated {deleted} cache entries for prefix: {prefix}")
+        async with client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(get_version_key(tag))
+            pipe.publish(INVALIDATION_CHANNEL, json.dumps({"src": _instance_id, "tags": list(tags)}))
+            await pipe.execute()
+        logger.debug(f"Invalidated cache tags: {', '.join(tags)}")
     except Exception as e:
-        logger.error(f"Cache invalidation error: {e}")
-
+        mark_redis_down(e)
@@ -9,6 +9,9 @@ from passlib.context import CryptContext
 from dotenv import load_dotenv
 from pathlib import Path
 
+from cache import init_redis
+from user_cache import invalidate_user
+
 # Environment variables yükle
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -29,6 +32,8 @@ async def create_user():
         print("Lütfen backend/.env dosyasında MONGO_URL'i ayarlayın.")
         return
     
+    await init_redis()
+    
     try:
         client = AsyncIOMotorClient(mongo_url)
         db = client[db_name]
@@ -62,6 +67,8 @@ async def create_user():
                 {"username": username},
                 {"$set": {"hashed_password": hashed_password}}
             )
+            # Çalışan API'lerdeki kullanıcı önbelleğini temizle
+            await invalidate_user(username)
             print(f"✅ '{username}' kullanıcısının şifresi başarıyla güncellendi!")
             client.close()
             return
@@ -83,6 +90,7 @@ async def create_user():
         }
         
         await db.users.insert_one(user_doc)
+        await invalidate_user(username)
         
         print("\n" + "=" * 50)
         print("✅ Kullanıcı başarıyla oluşturuldu!")
@@ -0,0 +1,177 @@
+"""
+Customer Directory Module
+
+Keeps one `customers` document per customer, keyed by the normalized phone
+number (same rules as SMS sending, so "0545…", "+90545…" and "545…" are one
+customer):
+
+    {_id: key, phone, name, appointment_count, completed_count, revenue,
+     last_visit, updated_at}
+
+Appointments and transactions carry the same `customer_key`. The totals are
+maintained incrementally on every write; rare corrections (phone changes,
+deletions, un-completing) recompute a single customer with `refresh_customer`
+and `rebuild_customers` recomputes everything (also the startup backfill).
+"""
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+from sms import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+COMPLETED_STATUS = "Tamamlandı"
+BACKFILL_BATCH_SIZE = 1000
+
+
+def customer_key(phone: Optional[str]) -> Optional[str]:
+    """Normalized mobile number; digits only for other (e.g. landline) numbers."""
+    key = normalize_phone(phone or '')
+    if key:
+        return key
+    digits = re.sub(r'\D', '', phone or '')
+    return digits or None
+
+
+def _delta_update(name: Optional[str] = None, appointments: int = 0, completed: int = 0,
+                  revenue: float = 0.0, visit_date: Optional[str] = None) -> dict:
+    update = {
+        "$inc": {"appointment_count": appointments, "completed_count": completed, "revenue": revenue},
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+    }
+    if name:
+        update["$set"]["name"] = name
+    if visit_date:
+        update["$max"] = {"last_visit": visit_date}
+    return update
+
+
+async def record_customer(db, key: Optional[str], **delta):
+    """Apply one delta (appointments, completed, revenue, visit_date, name)."""
+    await record_customers(db, {key: delta})
+
+
+async def record_customers(db, deltas: Dict[str, dict]):
+    """Apply many per-customer deltas with one bulk write."""
+    writes = []
+    for key, delta in deltas.items():
+        if not key:
+            continue
+        update = _delta_update(**delta)
+        update.setdefault("$setOnInsert", {})["phone"] = key
+        writes.append(UpdateOne({"_id": key}, update, upsert=True))
+    if writes:
+        await db.customers.bulk_write(writes, ordered=False)
+
+
+async def _aggregate_customers(db, key: Optional[str] = None) -> Dict[str, dict]:
+    """Totals per customer (or for one `key`) straight from the source collections."""
+    match = {"customer_key": key if key else {"$ne": None}}
+    customers: Dict[str, dict] = {}
+    async for row in db.appointments.aggregate([
+        {"$match": match},
+        {"$sort": {"appointment_date": 1}},
+        {"$group": {
+            "_id": "$customer_key",
+            "name": {"$last": "$customer_name"},
+            "appointment_count": {"$sum": 1},
+            "completed_count": {"$sum": {"$cond": [{"$eq": ["$status", COMPLETED_STATUS]}, 1, 0]}},
+            "last_visit": {"$max": {"$cond": [{"$eq": ["$status", COMPLETED_STATUS]}, "$appointment_date", None]}},
+        }},
+    ], allowDiskUse=True):
+        customers[row.pop("_id")] = {**row, "revenue": 0.0}
+
+    async for row in db.transactions.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$customer_key", "revenue": {"$sum": "$amount"}}},
+    ], allowDiskUse=True):
+        customers.setdefault(row["_id"], {
+            "name": None, "appointment_count": 0, "completed_count": 0, "last_visit": None,
+        })["revenue"] = row["revenue"]
+    return customers
+
+
+def _customer_doc(key: str, totals: dict, now: datetime) -> dict:
+    return {"phone": key, **totals, "updated_at": now}
+
+
+async def refresh_customer(db, key: Optional[str]):
+    """Recompute one customer from its appointments and transactions."""
+    if not key:
+        return
+    totals = (await _aggregate_customers(db, key)).get(key)
+    if totals is None:
+        await db.customers.delete_one({"_id": key})
+        return
+    await db.customers.replace_one({"_id": key}, _customer_doc(key, totals, datetime.now(timezone.utc)),
+                                   upsert=True)
+
+
+async def _backfill_keys(db):
+    """Set customer_key on appointments and transactions written before it existed."""
+    while True:
+        batch = await db.appointments.find(
+            {"customer_key": {"$exists": False}}, {"_id": 1, "phone": 1}
+        ).limit(BACKFILL_BATCH_SIZE).to_list(BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        await db.appointments.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"customer_key": customer_key(doc.get("phone"))}})
+            for doc in batch
+        ], ordered=False)
+
+    while True:
+        batch = await db.transactions.find(
+            {"customer_key": {"$exists": False}}, {"_id": 1, "appointment_id": 1}
+        ).limit(BACKFILL_BATCH_SIZE).to_list(BACKFILL_BATCH_SIZE)
+        if not batch:
+            break
+        keys = {
+            appt["id"]: appt.get("customer_key")
+            async for appt in db.appointments.find(
+                {"id": {"$in": [doc.get("appointment_id") for doc in batch]}},
+                {"_id": 0, "id": 1, "customer_key": 1},
+            )
+        }
+        await db.transactions.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"customer_key": keys.get(doc.get("appointment_id"))}})
+            for doc in batch
+        ], ordered=False)
+
+
+async def rebuild_customers(db) -> int:
+    """Backfill customer keys and recompute the whole directory.
+
+    Documents are replaced in place and only customers missing from the
+    aggregate are removed afterwards, so readers never see an empty directory.
+    Callers outside the migrations hold indexes.migration_lock.
+    """
+    await _backfill_keys(db)
+    # Damga okumadan önce alınır: hesaplama sürerken artımlı güncellenen ya da
+    # yeni eklenen müşterilerin updated_at'i daha yenidir, silinmezler
+    now = datetime.now(timezone.utc)
+    customers = await _aggregate_customers(db)
+    writes = [ReplaceOne({"_id": key}, _customer_doc(key, totals, now), upsert=True)
+              for key, totals in customers.items()]
+    for start in range(0, len(writes), BACKFILL_BATCH_SIZE):
+        await db.customers.bulk_write(writes[start:start + BACKFILL_BATCH_SIZE], ordered=False)
+    removed = await db.customers.delete_many({"updated_at": {"$not": {"$gte": now}}})
+    logger.info(f"Rebuilt {len(writes)} customers, removed {removed.deleted_count}")
+    return len(writes)
+
+
+def completion_deltas(appointments: Iterable[dict], transactions: Iterable[dict]) -> Dict[str, dict]:
+    """Per-customer deltas for appointments that just became completed."""
+    deltas = defaultdict(lambda: {"completed": 0, "revenue": 0.0, "visit_date": None})
+    for appt in appointments:
+        delta = deltas[appt.get("customer_key")]
+        delta["completed"] += 1
+        delta["visit_date"] = max(filter(None, (delta["visit_date"], appt.get("appointment_date"))), default=None)
+    for trans in transactions:
+        deltas[trans.get("customer_key")]["revenue"] += trans["amount"]
+    return dict(deltas)
@@ -0,0 +1,67 @@
+"""
+Conditional GET (ETag) Module
+
+Read-mostly endpoints send an ETag built from the shared version counters of
+the collections they read (the cache tags that invalidate_cache() bumps in
+Redis on every write). A client that sends it back in If-None-Match gets
+304 Not Modified before Mongo is queried or a body is serialized:
+
+    strong  "services-<versions>"          body depends on the collection only
+    weak    W/"<sha1(path, query, versions)>"   filtered / paginated lists
+
+Without Redis there is no version every worker agrees on, so no ETag is sent
+and requests are served as usual.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+
+from cache import get_shared_versions
+
+# Tarayıcı yanıtı saklar ama her kullanımda If-None-Match ile doğrular
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Weak comparison (RFC 9110) against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def set_etag_headers(response: Response, etag: Optional[str]):
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+class ConditionalGet:
+    """Dependency answering 304 for a matching If-None-Match; otherwise returns the ETag (or None).
+
+    The headers are set on the injected response; routes that return their
+    own Response object apply them with `set_etag_headers`. Declare it after
+    `current_user` so unauthenticated requests never see a 304.
+    """
+
+    def __init__(self, *tags: str, weak: bool = False):
+        self.tags = tags
+        self.weak = weak
+
+    async def __call__(self, request: Request, response: Response) -> Optional[str]:
+        versions = await get_shared_versions(self.tags)
+        if versions is None:
+            return None
+        if self.weak:
+            query = sorted(request.query_params.multi_items())
+            raw = f"{request.url.path}|{query}|{versions}"
+            etag = f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+        else:
+            etag = f'"{"-".join(self.tags)}-{versions}"'
+        if etag_matches(etag, request.headers.get("if-none-match")):
+            raise HTTPException(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+        set_etag_headers(response, etag)
+        return etag
@@ -0,0 +1,139 @@
+"""
+Streaming Export Module
+
+Writes Mongo query results as CSV (optionally gzip compressed) or XLSX without
+materialising the result set: the cursor is drained in EXPORT_BATCH_SIZE
+batches and CSV bytes are yielded as soon as a chunk fills up, so memory use
+does not depend on the size of the date range.
+
+XLSX is written by pandas through the XlsxWriter engine in constant memory
+mode into a temporary file, which is streamed once the workbook is closed.
+"""
+import asyncio
+import csv
+import io
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Sequence
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pandas as pd
+    import xlsxwriter  # noqa: F401  (pandas engine)
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+CHUNK_BYTES = 64 * 1024
+XLSX_MAX_ROWS = 1_048_575  # Excel limit minus the header row
+
+TRANSACTION_COLUMNS = ["id", "date", "appointment_id", "customer_name", "service_name", "amount", "created_at"]
+APPOINTMENT_COLUMNS = [
+    "id", "appointment_date", "appointment_time", "customer_name", "phone", "address",
+    "service_name", "service_price", "status", "notes", "created_at", "completed_at",
+]
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+GZIP_MEDIA_TYPE = "application/gzip"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def iter_batches(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[list]:
+    """Drain a Motor cursor batch by batch."""
+    while True:
+        batch = await cursor.to_list(length=batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+async def stream_csv(cursor, columns: Sequence[str], compress: bool = False) -> AsyncIterator[bytes]:
+    """Yield the CSV export of `cursor` in ~CHUNK_BYTES pieces."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM: Excel Türkçe karakterleri ancak bununla doğru açıyor
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def take() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return gzip.compress(data) if gzip else data
+
+    async for batch in iter_batches(cursor):
+        writer.writerows([_cell(doc.get(col)) for col in columns] for doc in batch)
+        if buffer.tell() >= CHUNK_BYTES:
+            chunk = take()
+            if chunk:
+                yield chunk
+
+    tail = take()
+    if gzip:
+        tail += gzip.flush()
+    if tail:
+        yield tail
+
+
+def _write_xlsx_batch(excel, rows: list, columns: Sequence[str], state: dict):
+    frame = pd.DataFrame([[_cell(doc.get(col)) for col in columns] for doc in rows], columns=list(columns))
+    offset = 0
+    while offset < len(frame):
+        if state["row"] >= XLSX_MAX_ROWS:
+            state["sheet"] += 1
+            state["row"] = 0
+        part = frame.iloc[offset:offset + XLSX_MAX_ROWS - state["row"]]
+        first = state["row"] == 0
+        part.to_excel(excel, sheet_name=f"Sayfa{state['sheet']}", index=False,
+                      header=first, startrow=0 if first else state["row"] + 1)
+        state["row"] += len(part)
+        offset += len(part)
+
+
+async def stream_xlsx(cursor, columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """Build the XLSX export in a temporary file and yield it in chunks."""
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("XLSX export requires pandas and XlsxWriter")
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        excel = pd.ExcelWriter(path, engine="xlsxwriter",
+                               engine_kwargs={"options": {"constant_memory": True}})
+        state = {"sheet": 1, "row": 0}
+        try:
+            async for batch in iter_batches(cursor):
+                # Dosyaya yazma CPU işi, event loop'u bloklamasın
+                await asyncio.to_thread(_write_xlsx_batch, excel, batch, columns, state)
+            if state["row"] == 0 and state["sheet"] == 1:
+                # Boş aralık: sadece başlık satırı
+                await asyncio.to_thread(pd.DataFrame(columns=list(columns)).to_excel, excel,
+                                        sheet_name="Sayfa1", index=False)
+        finally:
+            await asyncio.to_thread(excel.close)
+
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove export file {path}: {e}")
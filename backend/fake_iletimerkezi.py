@@ -0,0 +1,73 @@
+"""
+Yerel sahte İletimerkezi sunucusu (test ve yük ölçümü için)
+Kullanım: python fake_iletimerkezi.py --port 8099 --delay 5 --fail-rate 0.2
+
+Backend'i bu sunucuya yönlendirmek için backend/.env içinde:
+ILETIMERKEZI_API_URL="http://localhost:8099"
+"""
+import argparse
+import asyncio
+import random
+import xml.etree.ElementTree as ET
+
+from aiohttp import web
+
+RESPONSE_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<response><status><code>{code}</code><message>{message}</message></status>'
+    '<order><id>{order_id}</id></order></response>'
+)
+
+
+def make_app(delay: float, fail_rate: float) -> web.Application:
+    app = web.Application()
+    app['sent'] = []
+
+    async def send_sms_get(request: web.Request):
+        await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return web.Response(
+                text=RESPONSE_XML.format(code=503, message="Servis geçici olarak kullanılamıyor", order_id=0),
+                content_type='text/xml',
+            )
+        app['sent'].append({
+            'receipents': request.query.get('receipents'),
+            'text': request.query.get('text'),
+        })
+        return web.Response(
+            text=RESPONSE_XML.format(code=200, message="İşlem başarılı", order_id=len(app['sent'])),
+            content_type='text/xml',
+        )
+
+    async def send_sms_post(request: web.Request):
+        await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return web.Response(
+                text=RESPONSE_XML.format(code=503, message="Servis geçici olarak kullanılamıyor", order_id=0),
+                content_type='text/xml',
+            )
+        root = ET.fromstring(await request.read())
+        text = root.findtext('.//message/text')
+        for number in root.iterfind('.//receipents/number'):
+            app['sent'].append({'receipents': number.text, 'text': text})
+        return web.Response(
+            text=RESPONSE_XML.format(code=200, message="İşlem başarılı", order_id=len(app['sent'])),
+            content_type='text/xml',
+        )
+
+    async def stats(request: web.Request):
+        return web.json_response({'sent': len(app['sent']), 'last': app['sent'][-10:]})
+
+    app.router.add_get('/v1/send-sms/get/', send_sms_get)
+    app.router.add_post('/v1/send-sms', send_sms_post)
+    app.router.add_get('/_stats', stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sahte İletimerkezi SMS API")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=0.0, help="Her istek için yapay gecikme (saniye)")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="503 dönecek isteklerin oranı (0-1)")
+    args = parser.parse_args()
+    web.run_app(make_app(args.delay, args.fail_rate), port=args.port)
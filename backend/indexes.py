@@ -0,0 +1,565 @@
+"""
+Mongo Index and Migration Manager
+
+Declares every index the API relies on, applies them idempotently at startup
+(after the one-off data migrations they depend on) and offers explain() based
+helpers to detect queries that fall back to a collection scan.
+
+Data migrations that touch every document run in checkpointed batches
+(`backfill_batches`) and resume after an interruption.
+
+Kullanım (migrasyonlar + index'ler, elle): python indexes.py
+          (ayrıca sorgu kontrolü):         python indexes.py --check
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from customers import rebuild_customers, refresh_customer
+from reminders import backfill_reminders
+from rollups import rebuild_rollups
+from scheduler import LeaderLock
+from search import backfill_search_keys, search_keys
+from sync import TOMBSTONE_RETENTION_DAYS
+from timeutil import appointment_starts_at
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+# Migrasyonları ve index kurulumunu aynı anda tek worker yapar; süre uzarsa kira yenilenir
+MIGRATION_LOCK_SECONDS = 60
+
+# Index declarations per collection. Names are left to Mongo's defaults
+# (e.g. "status_1_starts_at_1") so existing indexes are recognised.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+    ],
+    "services": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "settings": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "appointments": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Çakışma kontrolü ve günlük sayımlar
+        IndexModel([("appointment_date", ASCENDING), ("appointment_time", ASCENDING), ("status", ASCENDING)]),
+        # Slot rezervasyonu: aynı tarih/saatte tek aktif (iptal edilmemiş) randevu
+        IndexModel([("appointment_date", ASCENDING), ("appointment_time", ASCENDING)],
+                   unique=True, partialFilterExpression={"slot_active": True}),
+        # Telefona göre arama (phone önekiyle tek başına phone aramalarını da karşılar)
+        IndexModel([("phone", ASCENDING), ("appointment_date", DESCENDING), ("id", DESCENDING)]),
+        # Arama (isim/telefon önekleri, multikey) + tarih sıralaması
+        IndexModel([("search_keys", ASCENDING), ("appointment_date", DESCENDING), ("id", DESCENDING)]),
+        # Müşteri geçmişi (normalize edilmiş telefon)
+        IndexModel([("customer_key", ASCENDING), ("appointment_date", DESCENDING), ("id", DESCENDING)]),
+        # Keyset sayfalama
+        IndexModel([("appointment_date", DESCENDING), ("id", DESCENDING)]),
+        # Otomatik tamamlama
+        IndexModel([("status", ASCENDING), ("starts_at", ASCENDING)]),
+        # Zaman aralıkları (müsaitlik, günlük sayımlar, kampanya alıcıları)
+        IndexModel([("starts_at", ASCENDING)]),
+        # Delta sync (GET /api/sync?since=)
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "transactions": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("appointment_id", ASCENDING)], unique=True),
+        # Tarih aralığı sorguları ve keyset sayfalama
+        IndexModel([("date", DESCENDING), ("id", DESCENDING)]),
+        # Müşteri cirosunun yeniden hesaplanması
+        IndexModel([("customer_key", ASCENDING)]),
+        # Delta sync
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "tombstones": [
+        # Silinen kayıtlar (delta sync) ve süresi dolanların TTL ile temizlenmesi
+        IndexModel([("collection", ASCENDING), ("deleted_at", ASCENDING)]),
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 86400),
+    ],
+    "customers": [
+        # En iyi müşteriler
+        IndexModel([("revenue", DESCENDING), ("_id", ASCENDING)]),
+        IndexModel([("completed_count", DESCENDING), ("_id", ASCENDING)]),
+        IndexModel([("appointment_count", DESCENDING), ("_id", ASCENDING)]),
+    ],
+    "sms_log": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+    ],
+    "reminder_jobs": [
+        IndexModel([("appointment_id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+    ],
+}
+
+# Unique index'ler bütünlüğü tek başına sağlar (çift rezervasyon, çift kasa kaydı):
+# kurulamazlarsa uygulama açılmaz
+REQUIRED_INDEXES = {
+    "appointments": ["appointment_date_1_appointment_time_1"],
+    "transactions": ["appointment_id_1"],
+}
+
+# Index options that must match for an existing index to count as "the same"
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+# OperationFailure codes
+_INDEX_OPTIONS_CONFLICT = 85
+_INDEX_KEY_SPECS_CONFLICT = 86
+_DUPLICATE_KEY = 11000
+
+
+def _same_index(existing: dict, declared: dict) -> bool:
+    if list(existing["key"].items()) != list(declared["key"].items()):
+        return False
+    return all(existing.get(opt) == declared.get(opt) for opt in _COMPARED_OPTIONS)
+
+
+async def _report_progress(db, collection: str, done: asyncio.Event, interval: float = 5.0):
+    """Log createIndexes progress for long builds (from $currentOp)."""
+    while not done.is_set():
+        try:
+            await asyncio.wait_for(done.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            ops = await db.client.admin.command(
+                {"currentOp": 1, "command.createIndexes": collection, "ns": {"$regex": f"^{db.name}\\."}}
+            )
+            for op in ops.get("inprog", []):
+                progress = op.get("progress") or {}
+                logger.info(f"Index build on {collection}: {op.get('msg', '')} "
+                            f"({progress.get('done', '?')}/{progress.get('total', '?')})")
+        except Exception as e:
+            logger.debug(f"Could not read index build progress: {e}")
+
+
+async def _create(db, collection: str, index: IndexModel):
+    done = asyncio.Event()
+    reporter = asyncio.create_task(_report_progress(db, collection, done))
+    try:
+        await db[collection].create_indexes([index])
+    finally:
+        done.set()
+        await reporter
+
+
+async def ensure_indexes(db, indexes: Dict[str, List[IndexModel]] = None) -> Dict[str, int]:
+    """Create missing indexes; rebuild ones whose options changed.
+
+    Never raises for a single failing index (e.g. a unique index over existing
+    duplicates); bootstrap_database checks REQUIRED_INDEXES afterwards.
+    Returns counts per outcome.
+    """
+    indexes = INDEXES if indexes is None else indexes
+    summary = {"existing": 0, "created": 0, "rebuilt": 0, "failed": 0}
+
+    for collection, models in indexes.items():
+        existing = {}
+        try:
+            async for info in db[collection].list_indexes():
+                existing[info["name"]] = info
+        except OperationFailure:
+            pass  # collection does not exist yet
+
+        for model in models:
+            declared = model.document
+            current = existing.get(declared["name"])
+            try:
+                if current is not None and _same_index(current, declared):
+                    summary["existing"] += 1
+                    continue
+                if current is not None:
+                    logger.warning(f"Index {collection}.{declared['name']} changed, rebuilding")
+                    await db[collection].drop_index(declared["name"])
+                    await _create(db, collection, model)
+                    summary["rebuilt"] += 1
+                else:
+                    logger.info(f"Creating index {collection}.{declared['name']}")
+                    await _create(db, collection, model)
+                    summary["created"] += 1
+            except OperationFailure as e:
+                summary["failed"] += 1
+                if e.code == _DUPLICATE_KEY:
+                    logger.error(f"Unique index {collection}.{declared['name']} could not be built, "
+                                 f"collection contains duplicates: {e}")
+                elif e.code in (_INDEX_OPTIONS_CONFLICT, _INDEX_KEY_SPECS_CONFLICT):
+                    logger.error(f"Index {collection}.{declared['name']} conflicts with an existing index: {e}")
+                else:
+                    logger.error(f"Index {collection}.{declared['name']} failed: {e}")
+
+    logger.info(f"Index bootstrap finished: {summary}")
+    return summary
+
+
+# === VERİ MİGRASYONLARI ===
+
+async def _backfill_slot_active(db):
+    # Partial unique slot index'i sadece slot_active=True olan randevuları kapsar
+    await db.appointments.update_many(
+        {"slot_active": {"$exists": False}},
+        [{"$set": {"slot_active": {"$ne": ["$status", "İptal"]}}}],
+    )
+
+
+async def backfill_batches(db, migration: str, collection: str, query: dict, projection: dict,
+                           compute: Callable[[dict], Optional[dict]],
+                           batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """$set `compute(doc)` on every matching document, in _id order and in batches.
+
+    The last processed _id is checkpointed in the migration's schema_migrations
+    document after every batch, so an interrupted run (restart, deploy, Ctrl-C)
+    resumes where it stopped. `compute` returns None to leave a document as is.
+    """
+    marker = await db.schema_migrations.find_one({"_id": migration}, {"checkpoints": 1}) or {}
+    last_id = marker.get("checkpoints", {}).get(collection)
+    updated = 0
+    while True:
+        batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        batch = await db[collection].find(
+            batch_query, {**projection, "_id": 1}
+        ).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return updated
+        writes = []
+        for doc in batch:
+            fields = compute(doc)
+            if fields is not None:
+                writes.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if writes:
+            await db[collection].bulk_write(writes, ordered=False)
+        updated += len(writes)
+        last_id = batch[-1]["_id"]
+        await db.schema_migrations.update_one(
+            {"_id": migration}, {"$set": {f"checkpoints.{collection}": last_id}}, upsert=True
+        )
+        logger.info(f"Migration {migration}: {collection} {updated} documents updated")
+
+
+def _created_at_fields(doc: dict) -> Optional[dict]:
+    try:
+        parsed = datetime.fromisoformat(doc["created_at"])
+    except ValueError:
+        logger.warning(f"{doc['_id']}: unparseable created_at {doc['created_at']!r}")
+        return None
+    return {"created_at": parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)}
+
+
+async def _created_at_to_datetime(db):
+    # İlk sürümler created_at'i isoformat string yazıyordu; listeler her satırı parse ediyordu
+    for collection in ("services", "appointments", "transactions"):
+        await backfill_batches(db, "created_at_to_datetime", collection,
+                               {"created_at": {"$type": "string"}}, {"created_at": 1}, _created_at_fields)
+
+
+def _starts_at_fields(doc: dict) -> dict:
+    try:
+        return {"starts_at": appointment_starts_at(doc["appointment_date"], doc["appointment_time"])}
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Appointment {doc['_id']}: cannot compute starts_at: {e}")
+        return {"starts_at": None}
+
+
+async def _backfill_starts_at(db):
+    # Tüm zaman kararları/aralık sorguları kanonik UTC starts_at üzerinden yapılır
+    await backfill_batches(db, "appointments_starts_at", "appointments", {"starts_at": {"$exists": False}},
+                           {"appointment_date": 1, "appointment_time": 1}, _starts_at_fields)
+
+
+def _updated_at_fields(doc: dict) -> dict:
+    # Önceki kayıtlar en son oluşturulduklarında değişmiş sayılır; created_at
+    # datetime değilse (eksik/bozuk metin) range sorgusu bulamaz, şimdiki zaman
+    created_at = doc.get("created_at")
+    return {"updated_at": created_at if isinstance(created_at, datetime) else datetime.now(timezone.utc)}
+
+
+async def _backfill_updated_at(db):
+    for collection in ("services", "appointments", "transactions"):
+        await backfill_batches(db, "updated_at_initial", collection, {"updated_at": {"$exists": False}},
+                               {"created_at": 1}, _updated_at_fields)
+
+
+def _search_keys_fields(doc: dict) -> Optional[dict]:
+    keys = search_keys(doc.get("customer_name"), doc.get("phone"))
+    return None if keys == doc.get("search_keys") else {"search_keys": keys}
+
+
+async def _refresh_phone_search_keys(db):
+    # Sabit hatlar "0384 212" gibi sıfırlı aramada bulunamıyordu; yalnız anahtarı
+    # değişen (mobil olmayan) randevular yazılır
+    await backfill_batches(db, "appointments_search_keys_landline", "appointments", {"phone": {"$exists": True}},
+                           {"customer_name": 1, "phone": 1, "search_keys": 1}, _search_keys_fields)
+
+
+async def _dedupe_transactions(db):
+    # Eski okuma yolundaki tamamlama aynı randevu için birden fazla kasa kaydı
+    # açabiliyordu; transactions.appointment_id unique index'i ancak temizlikten
+    # sonra kurulabilir. İlk (en eski) kayıt kalır, etkilenen günlük gelir
+    # kovaları ve müşteriler kaynaktan yeniden hesaplanır. Etkilenenler silmeden
+    # önce kaydedilir, yarıda kesilen çalışma tekrar hesaplamayı kaçırmaz.
+    migration = "transactions_dedupe_appointment_id"
+    marker = await db.schema_migrations.find_one({"_id": migration}, {"affected": 1}) or {}
+    affected = marker.get("affected") or {"dates": [], "keys": []}
+
+    duplicate_ids, dates, keys = [], set(affected["dates"]), set(affected["keys"])
+    async for group in db.transactions.aggregate([
+        {"$match": {"appointment_id": {"$ne": None}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": "$appointment_id", "keep": {"$first": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        async for extra in db.transactions.find(
+            {"appointment_id": group["_id"], "_id": {"$ne": group["keep"]}}, {"date": 1, "customer_key": 1}
+        ):
+            duplicate_ids.append(extra["_id"])
+            dates.add(extra.get("date"))
+            keys.add(extra.get("customer_key"))
+
+    if duplicate_ids:
+        logger.warning(f"Removing {len(duplicate_ids)} duplicate transactions (same appointment_id)")
+        dates.discard(None)
+        keys.discard(None)
+        await db.schema_migrations.update_one(
+            {"_id": migration}, {"$set": {"affected": {"dates": sorted(dates), "keys": sorted(keys)}}}, upsert=True
+        )
+        for start in range(0, len(duplicate_ids), MIGRATION_BATCH_SIZE):
+            await db.transactions.delete_many({"_id": {"$in": duplicate_ids[start:start + MIGRATION_BATCH_SIZE]}})
+
+    for day in sorted(dates):
+        await rebuild_rollups(db, day, day)
+    for key in sorted(keys):
+        await refresh_customer(db, key)
+
+
+async def _release_duplicate_slots(db):
+    # Slot index'i yokken aynı tarih/saate birden fazla aktif randevu yazılmış
+    # olabilir. En eski randevu slotu tutar; diğerleri iptal edilmeden slottan
+    # çıkarılır (slot_active=False) ve slot_conflict ile işaretlenir, müşteriyle
+    # yeni saat ayarlanabilsin diye durumları değişmez.
+    async for group in db.appointments.aggregate([
+        {"$match": {"slot_active": True}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": {"date": "$appointment_date", "time": "$appointment_time"},
+                    "keep": {"$first": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True):
+        query = {"appointment_date": group["_id"]["date"], "appointment_time": group["_id"]["time"],
+                 "slot_active": True, "_id": {"$ne": group["keep"]}}
+        released = [doc["id"] async for doc in db.appointments.find(query, {"_id": 0, "id": 1})]
+        await db.appointments.update_many(query, {"$set": {
+            "slot_active": False, "slot_conflict": True, "updated_at": datetime.now(timezone.utc)
+        }})
+        logger.warning(f"Slot {group['_id']['date']} {group['_id']['time']} was double booked, "
+                       f"released from slot: {released}")
+
+
+# (name, coroutine function) pairs, applied once and in order
+MIGRATIONS = [
+    ("appointments_slot_active", _backfill_slot_active),
+    ("revenue_daily_initial_build", rebuild_rollups),
+    ("customers_initial_build", rebuild_customers),
+    ("appointments_search_keys", backfill_search_keys),
+    ("created_at_to_datetime", _created_at_to_datetime),
+    ("appointments_starts_at", _backfill_starts_at),
+    ("updated_at_initial", _backfill_updated_at),
+    ("transactions_dedupe_appointment_id", _dedupe_transactions),
+    ("appointments_slot_dedupe", _release_duplicate_slots),
+    # Hatırlatma işleri gelmeden önce alınmış gelecekteki randevular
+    ("reminder_jobs_initial", backfill_reminders),
+    ("appointments_search_keys_landline", _refresh_phone_search_keys),
+]
+
+
+async def run_migrations(db, migrations=None) -> List[str]:
+    """Apply migrations not yet recorded in `schema_migrations`. Returns the applied names.
+
+    A migration counts as applied once `applied_at` is set; a document holding
+    only batch checkpoints means it was interrupted and is resumed.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = []
+    for name, migrate in migrations:
+        if await db.schema_migrations.find_one({"_id": name, "applied_at": {"$exists": True}}):
+            continue
+        logger.info(f"Running migration {name}")
+        await migrate(db)
+        await db.schema_migrations.update_one(
+            {"_id": name}, {"$set": {"applied_at": datetime.now(timezone.utc)}}, upsert=True
+        )
+        applied.append(name)
+    return applied
+
+
+async def verify_required_indexes(db, required: Dict[str, List[str]] = None):
+    """Raise RuntimeError unless every REQUIRED_INDEXES entry exists as declared."""
+    required = REQUIRED_INDEXES if required is None else required
+    missing = []
+    for collection, names in required.items():
+        declared = {model.document["name"]: model.document for model in INDEXES[collection]}
+        existing = {}
+        try:
+            async for info in db[collection].list_indexes():
+                existing[info["name"]] = info
+        except OperationFailure:
+            pass
+        missing += [f"{collection}.{name}" for name in names
+                    if name not in existing or not _same_index(existing[name], declared[name])]
+    if missing:
+        raise RuntimeError(f"Required unique indexes are missing: {missing}; "
+                           f"resolve the duplicates reported above and restart")
+
+
+async def _renew(lock: LeaderLock, done: asyncio.Event):
+    while not done.is_set():
+        try:
+            await asyncio.wait_for(done.wait(), timeout=lock.lease.total_seconds() / 3)
+        except asyncio.TimeoutError:
+            await lock.acquire()
+
+
+@asynccontextmanager
+async def migration_lock(db, wait: bool = True):
+    """Hold the schema_migrations lock, renewed in the background, for the block.
+
+    Yields False instead of waiting when `wait` is off and another worker
+    holds it. Migrations and full rebuilds of derived collections run under it.
+    """
+    lock = LeaderLock(db, "schema_migrations", lease_seconds=MIGRATION_LOCK_SECONDS)
+    if not await lock.acquire():
+        if not wait:
+            yield False
+            return
+        logger.info("Another worker is migrating the database, waiting")
+        while not await lock.acquire():
+            await asyncio.sleep(1)
+
+    done = asyncio.Event()
+    renewer = asyncio.create_task(_renew(lock, done))
+    try:
+        yield True
+    finally:
+        done.set()
+        await renewer
+        await lock.release()
+
+
+async def bootstrap_database(db):
+    """Startup entry point: data migrations first, then indexes.
+
+    Runs on one worker at a time (scheduler_locks); the others wait and then
+    find everything applied. Raises if a required unique index is missing.
+    """
+    async with migration_lock(db):
+        await run_migrations(db)
+        summary = await ensure_indexes(db)
+    await verify_required_indexes(db)
+    return summary
+
+
+# === explain() YARDIMCILARI ===
+
+def plan_stages(plan: dict) -> List[str]:
+    """Flatten all stage names of an explain() winning plan."""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        for key in ("inputStage", "queryPlan"):
+            if key in node:
+                stack.append(node[key])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+def winning_plan(explain: dict) -> dict:
+    planner = explain.get("queryPlanner", {})
+    return planner.get("winningPlan", {})
+
+
+async def uses_collscan(cursor) -> bool:
+    """True if the Motor cursor's winning plan contains a COLLSCAN stage."""
+    explain = await cursor.explain()
+    return "COLLSCAN" in plan_stages(winning_plan(explain))
+
+
+async def assert_indexed(cursor, description: str = "query"):
+    """Raise AssertionError if the query is answered by a collection scan (for tests)."""
+    if await uses_collscan(cursor):
+        raise AssertionError(f"{description} falls back to COLLSCAN")
+
+
+def query_checks(db) -> Dict[str, object]:
+    """Representative API queries that must be index backed."""
+    now = datetime.now(timezone.utc)
+    return {
+        "users by username": db.users.find({"username": "admin"}),
+        "service by id": db.services.find({"id": "x"}),
+        "appointment by id": db.appointments.find({"id": "x"}),
+        "slot conflict": db.appointments.find(
+            {"appointment_date": "2024-01-01", "appointment_time": "10:00", "status": {"$ne": "İptal"}}),
+        "availability range": db.appointments.find(
+            {"starts_at": {"$gte": now, "$lt": now + timedelta(days=31)}, "slot_active": True},
+            {"_id": 0, "starts_at": 1}),
+        "today's appointments": db.appointments.find(
+            {"starts_at": {"$gte": now, "$lt": now + timedelta(days=1)}, "status": "Tamamlandı"}),
+        "appointments page": db.appointments.find({}).sort([("appointment_date", -1), ("id", -1)]).limit(50),
+        "customer history": db.appointments.find({"customer_key": "5000000000"}).sort(
+            [("appointment_date", -1), ("id", -1)]),
+        "appointment search": db.appointments.find({"search_keys": {"$all": ["ayse", "545"]}}).sort(
+            [("appointment_date", -1), ("id", -1)]).limit(20),
+        "top customers": db.customers.find({}).sort([("revenue", -1), ("_id", 1)]).limit(20),
+        "due completions": db.appointments.find({"status": "Bekliyor", "starts_at": {"$lte": now}}),
+        "transactions range": db.transactions.find({"date": {"$gte": "2024-01-01", "$lte": "2024-01-31"}}),
+        "transaction by appointment": db.transactions.find({"appointment_id": "x"}),
+        "appointments changed since": db.appointments.find({"updated_at": {"$gt": now}}).sort("updated_at", 1),
+        "transactions changed since": db.transactions.find({"updated_at": {"$gt": now}}).sort("updated_at", 1),
+        "services changed since": db.services.find({"updated_at": {"$gt": now}}).sort("updated_at", 1),
+        "deleted since": db.tombstones.find({"collection": "appointments", "deleted_at": {"$gt": now}}),
+        "due sms": db.sms_log.find({"status": "queued", "next_attempt_at": {"$lte": now}}),
+        "due reminders": db.reminder_jobs.find({"status": "pending", "run_at": {"$lte": now}}),
+    }
+
+
+async def check_queries(db) -> List[str]:
+    """Return the names of representative queries that use a COLLSCAN."""
+    return [name for name, cursor in query_checks(db).items() if await uses_collscan(cursor)]
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    async def main():
+        scans = []
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ.get('DB_NAME', 'royal_koltuk')]
+        await bootstrap_database(db)
+        if "--check" in sys.argv:
+            scans = await check_queries(db)
+            for name in scans:
+                print(f"❌ COLLSCAN: {name}")
+            if not scans:
+                print("✅ Tüm sorgular index kullanıyor")
+        client.close()
+        return 1 if scans else 0
+
+    sys.exit(asyncio.run(main()))
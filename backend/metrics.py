@@ -0,0 +1,186 @@
+"""
+Prometheus Metrics Module
+
+Request latency per route template and status, Mongo command timings (from a
+pymongo CommandListener), cache hit ratios, rate-limit rejections, SMS
+provider latency/errors and event loop lag, exposed at /metrics.
+
+prometheus-client is optional: without it every helper here is a no-op and
+/metrics answers 503.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, REGISTRY, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+    logger.warning("prometheus_client module not found. Metrics will be disabled.")
+
+LOOP_LAG_INTERVAL = 0.5
+
+if METRICS_AVAILABLE:
+    REQUEST_LATENCY = Histogram(
+        "http_request_duration_seconds", "HTTP request latency",
+        ["method", "route", "status"],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    )
+    MONGO_LATENCY = Histogram(
+        "mongo_command_duration_seconds", "MongoDB command latency",
+        ["command", "collection", "outcome"],
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+    )
+    RATE_LIMIT_REJECTIONS = Counter(
+        "rate_limit_rejections_total", "Requests rejected by the rate limiter", ["route"],
+    )
+    SMS_LATENCY = Histogram(
+        "sms_provider_request_duration_seconds", "SMS provider request latency", ["endpoint"],
+        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+    SMS_ERRORS = Counter(
+        "sms_provider_errors_total", "Failed SMS provider requests", ["endpoint", "reason"],
+    )
+    LOOP_LAG = Histogram(
+        "event_loop_lag_seconds", "Delay of a scheduled event loop callback beyond its deadline",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    )
+
+
+def route_template(scope) -> str:
+    """"/api/appointments/{appointment_id}" instead of the raw path (bounded label set)."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware timing each HTTP request until its last body chunk."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_AVAILABLE:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(scope["method"], route_template(scope), str(status_code)).observe(
+                time.perf_counter() - started
+            )
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener recording the duration of every command (pass via event_listeners)."""
+
+    def __init__(self):
+        self._collections = {}
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[self._key(event)] = target if isinstance(target, str) else ""
+
+    def _record(self, event, outcome: str):
+        collection = self._collections.pop(self._key(event), "")
+        if METRICS_AVAILABLE:
+            MONGO_LATENCY.labels(event.command_name, collection, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._record(event, "ok")
+
+    def failed(self, event):
+        self._record(event, "error")
+
+
+class CacheCollector:
+    """Exposes the counters kept by cache.py at scrape time."""
+
+    def collect(self):
+        from cache import get_cache_stats
+
+        stats = get_cache_stats()
+        requests = CounterMetricFamily("cache_requests", "Cache lookups by result", labels=["prefix", "result"])
+        evictions = CounterMetricFamily("cache_l1_evictions", "In-process cache evictions", labels=["prefix"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hit ratio (L1 + L2)", labels=["prefix"])
+        for prefix, counters in stats["prefixes"].items():
+            for result in ("l1_hits", "l2_hits", "misses"):
+                requests.add_metric([prefix, result], counters.get(result, 0))
+            evictions.add_metric([prefix], counters.get("evictions", 0))
+            if counters.get("hit_ratio") is not None:
+                ratio.add_metric([prefix], counters["hit_ratio"])
+        yield requests
+        yield evictions
+        yield ratio
+        yield GaugeMetricFamily("cache_redis_up", "Redis (L2) reachable", value=1 if stats["redis"] else 0)
+        yield GaugeMetricFamily("cache_l1_entries", "Entries in the in-process cache", value=stats["l1_entries"])
+
+
+if METRICS_AVAILABLE:
+    REGISTRY.register(CacheCollector())
+
+
+def observe_rate_limited(scope):
+    if METRICS_AVAILABLE:
+        RATE_LIMIT_REJECTIONS.labels(route_template(scope)).inc()
+
+
+def observe_sms_request(endpoint: str, seconds: float, error: Optional[str] = None):
+    """Record one provider call; `error` is a short reason ("transport", "http_5xx", provider code)."""
+    if not METRICS_AVAILABLE:
+        return
+    SMS_LATENCY.labels(endpoint).observe(seconds)
+    if error:
+        SMS_ERRORS.labels(endpoint, error).inc()
+
+
+_lag_task: Optional[asyncio.Task] = None
+
+
+async def _measure_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        deadline = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - deadline))
+
+
+def start_loop_lag_monitor():
+    global _lag_task
+    if METRICS_AVAILABLE and _lag_task is None:
+        _lag_task = asyncio.create_task(_measure_loop_lag())
+
+
+async def stop_loop_lag_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        await asyncio.gather(_lag_task, return_exceptions=True)
+        _lag_task = None
+
+
+def render_metrics():
+    """(body, content type) for the /metrics endpoint"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,80 @@
+"""
+Keyset (Cursor) Pagination Helper Module
+
+Pages are ordered by a compound key such as (appointment_date, id) and the next
+page starts strictly after the last row of the previous one, so every page is
+one bounded index range scan regardless of how deep the client has paged.
+"""
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+PAGE_SIZE_DEFAULT = 1000
+PAGE_SIZE_MAX = 1000
+CURSOR_VALUE_TYPES = (str, int, float)
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """Raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {e}")
+    # Değerler doğrudan Mongo filtresine girer: {"$regex": ...} gibi operatör
+    # nesneleri (ve listeler) kabul edilmez
+    if not isinstance(values, list) or not all(
+        value is None or (isinstance(value, CURSOR_VALUE_TYPES) and not isinstance(value, bool))
+        for value in values
+    ):
+        raise ValueError("invalid cursor")
+    return values
+
+
+def keyset_filter(fields: Sequence[str], values: Sequence, direction: int = -1) -> dict:
+    """Build the "strictly after (values)" filter for a compound sort key.
+
+    For fields (a, b) in descending order this is:
+    {"$or": [{"a": {"$lt": va}}, {"a": va, "b": {"$lt": vb}}]}
+    """
+    if len(fields) != len(values):
+        raise ValueError("invalid cursor")
+    op = "$lt" if direction < 0 else "$gt"
+    clauses = []
+    for i, field in enumerate(fields):
+        clause = {f: values[j] for j, f in enumerate(fields[:i])}
+        clause[field] = {op: values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def fetch_page(collection, query: dict, fields: Sequence[str], limit: int,
+                     cursor: Optional[str] = None, projection: Optional[dict] = None,
+                     direction: int = -1) -> Tuple[List[dict], Optional[str]]:
+    """Return (rows, next_cursor); next_cursor is None on the last page."""
+    if cursor:
+        query = {"$and": [query, keyset_filter(fields, decode_cursor(cursor), direction)]}
+    if projection is None:
+        projection = {"_id": 0}
+
+    rows = await collection.find(query, projection).sort(
+        [(field, direction) for field in fields]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].get(field) for field in fields])
+    return rows, next_cursor
+
+
+def set_page_headers(response, next_cursor: Optional[str], total: Optional[int] = None):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
@@ -0,0 +1,164 @@
+"""
+Slow Request Profiling Module
+
+Opt-in (PROFILE_SLOW_REQUESTS=true). Every request collects the Mongo commands
+it issues: the trace list lives in a contextvar, which Motor copies into its
+executor threads, so the pymongo listener can attribute commands to the
+request that sent them. A sampled fraction of requests additionally runs
+under cProfile. Requests slower than PROFILE_THRESHOLD_MS are kept in a
+bounded ring buffer served by an admin endpoint.
+
+cProfile is per thread and only one profiler can be active, so at most one
+request is profiled at a time; concurrent requests on the event loop can show
+up in its profile as well.
+"""
+import cProfile
+import contextvars
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pymongo import monitoring
+
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.environ.get('PROFILE_SLOW_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', '500'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.1'))
+PROFILE_BUFFER_SIZE = int(os.environ.get('PROFILE_BUFFER_SIZE', '50'))
+PROFILE_TOP_FUNCTIONS = 30
+MAX_COMMANDS_PER_REQUEST = 200
+
+_trace: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_mongo_trace", default=None)
+_slow_requests = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiler_lock = threading.Lock()
+
+
+class MongoCommandRecorder(monitoring.CommandListener):
+    """Appends (command, collection, duration) to the current request's trace."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        trace = _trace.get()
+        if trace is None:
+            return
+        target = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = (trace, target if isinstance(target, str) else "")
+
+    def _record(self, event, ok: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        trace, collection = pending
+        if len(trace) < MAX_COMMANDS_PER_REQUEST:
+            trace.append({
+                "command": event.command_name,
+                "collection": collection,
+                "duration_ms": round(event.duration_micros / 1000, 3),
+                "ok": ok,
+            })
+
+    def succeeded(self, event):
+        self._record(event, True)
+
+    def failed(self, event):
+        self._record(event, False)
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int = PROFILE_TOP_FUNCTIONS) -> dict:
+    """Hottest functions by cumulative time (call paths) and by own time (hot loops)."""
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in pstats.Stats(profiler).stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    return {
+        "by_cumulative": sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:limit],
+        "by_own": sorted(rows, key=lambda row: row["own_ms"], reverse=True)[:limit],
+    }
+
+
+class SlowRequestProfiler:
+    """ASGI middleware recording requests slower than PROFILE_THRESHOLD_MS."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace: list = []
+        token = _trace.set(trace)
+        profiler = None
+        if random.random() < PROFILE_SAMPLE_RATE and _profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Başka bir profiler (ör. geliştirme aracı) zaten aktif
+                _profiler_lock.release()
+                profiler = None
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+            _trace.reset(token)
+            if elapsed_ms >= PROFILE_THRESHOLD_MS:
+                self._store(scope, status_code, elapsed_ms, trace, profiler)
+
+    @staticmethod
+    def _store(scope, status_code: int, elapsed_ms: float, trace: list, profiler):
+        try:
+            _slow_requests.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_template(scope),
+                "status": status_code,
+                "duration_ms": round(elapsed_ms, 1),
+                "mongo": {
+                    "count": len(trace),
+                    "total_ms": round(sum(cmd["duration_ms"] for cmd in trace), 3),
+                    "commands": trace,
+                },
+                "profile": _top_functions(profiler) if profiler is not None else None,
+            })
+        except Exception as e:
+            logger.error(f"Could not record slow request profile: {e}")
+
+
+def get_slow_requests() -> List[dict]:
+    """Recorded slow requests, newest first"""
+    return list(reversed(_slow_requests))
+
+
+def clear_slow_requests():
+    _slow_requests.clear()
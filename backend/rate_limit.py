@@ -1,33 +1,191 @@
 """
 Rate Limiting Module
+
+Limits are shared by every worker and replica through Redis (REDIS_URL, the
+cache connection): each limit/key pair is a sorted set of request timestamps
+and a Lua script trims, counts and records atomically, i.e. an exact sliding
+window.
+
+Every key also has an in-process token bucket with the same rate. It is
+checked first, so a client that is clearly over its limit is rejected without
+a Redis round trip, and while Redis is down (health tracked in the background
+by cache.py) it is the only check - an outage never adds latency, limits just
+become per worker.
+
+Keys are per authenticated user ("user:<name>") and otherwise per client IP;
+behind a reverse proxy list its address in RATE_LIMIT_TRUSTED_PROXIES so the
+client is taken from X-Forwarded-For.
 """
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi import Request
+import functools
+import logging
+import math
 import os
+import re
+import time
+import uuid
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from cache import LRUCache, get_redis, mark_redis_down
+from metrics import observe_rate_limited
 
-# Initialize limiter
-if os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true':
-    limiter = Limiter(key_func=get_remote_address)
-else:
-    # Create a dummy limiter when rate limiting is disabled
-    class DummyLimiter:
-        def limit(self, *args, **kwargs):
-            def decorator(func):
-                return func
-            return decorator
-    
-    limiter = DummyLimiter()
+logger = logging.getLogger(__name__)
 
 # Rate limit configuration
 RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_PREFIX = "royal:ratelimit"
+RATE_LIMIT_LOCAL_KEYS = int(os.environ.get('RATE_LIMIT_LOCAL_KEYS', '10000'))
+TRUSTED_PROXIES = {
+    ip.strip() for ip in os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '').split(',') if ip.strip()
+}
+
+# Common rate limit configurations
+LIMITS = {
+    'login': "5/minute",           # Login attempts
+    'register': "3/hour",          # Registration
+    'api': "100/minute",           # General API calls (every authenticated request)
+    'stats': "20/minute",          # Stats endpoints
+    'sms': "100/hour",             # SMS sending
+    'export': "10/minute",         # CSV/XLSX exports
+}
+
+_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$")
+
+# KEYS[1] = zset of timestamps; ARGV = now_ms, window_ms, limit, unique member
+# Returns {1, 0} when allowed, {0, retry_after_ms} when the window is full
+_SLIDING_WINDOW = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+if redis.call('ZCARD', key) < tonumber(ARGV[3]) then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, tonumber(oldest[2]) + window - now}
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: str, retry_after: float):
+        super().__init__(limit)
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+@lru_cache(maxsize=64)
+def parse_limit(limit: str) -> Tuple[int, float]:
+    """"5/minute", "100 per hour", "10/5 minutes" -> (count, window seconds)"""
+    match = _LIMIT_PATTERN.match(limit)
+    if not match:
+        raise ValueError(f"Invalid rate limit: {limit!r}")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _UNITS[unit]
+
+
+class TokenBucket:
+    """`capacity` tokens refilled evenly over `window` seconds."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 when a token was taken, otherwise seconds until the next one."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self):
+        # Boşta kalan bir kova pencere süresinde zaten dolar, TTL ile düşmesi sonucu değiştirmez
+        self._buckets = LRUCache(RATE_LIMIT_LOCAL_KEYS, ttl=max(_UNITS.values()))
+        self._script = None
+
+    def _sliding_window(self, client):
+        if self._script is None or self._script.registered_client is not client:
+            self._script = client.register_script(_SLIDING_WINDOW)
+        return self._script
+
+    async def hit(self, limit: str, key: str, scope: str):
+        """Count one request of `key` against `limit`; raises RateLimitExceeded."""
+        count, window = parse_limit(limit)
+        bucket_key = f"{scope}:{key}"
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = TokenBucket(count, window)
+        self._buckets.set(bucket_key, bucket, ttl=window)
+        wait = bucket.take()
+        if wait:
+            raise RateLimitExceeded(limit, wait)
+
+        client = get_redis()
+        if client is None:
+            return
+        now_ms = int(time.time() * 1000)
+        try:
+            allowed, retry_ms = await self._sliding_window(client)(
+                keys=[f"{RATE_LIMIT_PREFIX}:{bucket_key}"],
+                args=[now_ms, int(window * 1000), count, f"{now_ms}:{uuid.uuid4().hex[:8]}"],
+            )
+        except Exception as e:
+            mark_redis_down(e)
+            return
+        if not allowed:
+            raise RateLimitExceeded(limit, int(retry_ms) / 1000)
+
+    def reset(self):
+        """Forget the local buckets (Redis windows expire on their own)."""
+        self._buckets.clear()
+
+
+limiter = RateLimiter()
+
+
+def client_address(request: Optional[Request]) -> str:
+    """Client IP; X-Forwarded-For is only believed when the peer is a trusted proxy."""
+    if request is None or request.client is None:
+        return "unknown"
+    peer = request.client.host
+    if peer not in TRUSTED_PROXIES:
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in TRUSTED_PROXIES:
+            return hop
+    return peer
+
+
+def rate_limit_key(request: Optional[Request], current_user=None) -> str:
+    username = getattr(current_user, "username", None)
+    if username:
+        return f"user:{username}"
+    return f"ip:{client_address(request)}"
+
 
 # Rate limit decorator
 def rate_limit(times: str = "10/minute", per_method: bool = True):
     """
     Rate limit decorator
-    
+
+    Checked after FastAPI resolved the dependencies, so routes that take
+    `current_user` are limited per user and the others per client IP.
+
     Args:
         times: Rate limit string (e.g., "10/minute", "100/hour")
         per_method: Whether to limit per HTTP method
@@ -37,15 +195,34 @@ def rate_limit(times: str = "10/minute", per_method: bool = True):
         def noop_decorator(func):
             return func
         return noop_decorator
-    
-    return limiter.limit(times)
 
-# Common rate limit configurations
-LIMITS = {
-    'login': "5/minute",           # Login attempts
-    'register': "3/hour",          # Registration
-    'api': "100/minute",           # General API calls
-    'stats': "20/minute",          # Stats endpoints
-    'sms': "100/hour",             # SMS sending
-}
+    parse_limit(times)  # yazım hatası import sırasında patlasın
+
+    def decorator(func):
+        scope = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request = kwargs.get("request")
+            key = rate_limit_key(request, kwargs.get("current_user"))
+            method = request.method if per_method and request is not None else "*"
+            await limiter.hit(times, key, f"{scope}:{method}")
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def check_api_limit(username: str):
+    """The general 'api' limit, applied to every authenticated request."""
+    if RATE_LIMIT_ENABLED:
+        await limiter.hit(LIMITS['api'], f"user:{username}", "api")
+
 
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """429 with Retry-After, counting the rejection per route first"""
+    observe_rate_limited(request.scope)
+    return JSONResponse(
+        {"error": f"Rate limit exceeded: {exc.limit}"},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
@@ -0,0 +1,288 @@
+"""
+Real-time Change Feed Module
+
+Each worker opens ONE MongoDB change stream over appointments, transactions
+and services and fans compact deltas out to every WebSocket subscriber, so
+clients stop re-polling the list endpoints:
+
+    {"type": "change", "coll": "appointments", "op": "insert", "id": ..., "doc": {...}, "token": ...}
+    {"type": "change", "coll": "appointments", "op": "update", "id": ..., "fields": {...}, "removed": [...], "token": ...}
+    {"type": "change", "coll": "appointments", "op": "delete", "id": ..., "token": ...}
+    {"type": "resync", "coll": ... | null, "token": ...}     -> refetch over REST
+
+Only the API model fields are sent (search_keys, customer_key ... stay
+internal). Every change carries its resume token; a reconnecting client passes
+the last one back and gets what it missed, first from a per-worker replay
+buffer, otherwise from a short-lived change stream resumed at that token. When
+neither works (oplog rolled over, subscriber too slow) it gets "resync".
+
+Change streams need a replica set (a single node is enough:
+`mongod --replSet rs0` + `rs.initiate()`). Without one the feed reports
+itself unavailable and clients keep polling. Deletes carry the document id
+when change stream pre-images are enabled (MongoDB 6+, done at startup);
+otherwise a delete becomes a "resync" for its collection.
+
+A subscriber's session is re-checked every SESSION_RECHECK_SECONDS and at its
+token's expiry; the socket is closed with 1008 once it is no longer valid.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('REALTIME_QUEUE_SIZE', '256'))
+REPLAY_BUFFER_SIZE = int(os.environ.get('REALTIME_REPLAY_SIZE', '1000'))
+MAX_CATCH_UP_EVENTS = int(os.environ.get('REALTIME_MAX_CATCH_UP', '5000'))
+RETRY_SECONDS = 5
+SESSION_RECHECK_SECONDS = int(os.environ.get('REALTIME_SESSION_RECHECK', '60'))
+
+_OPERATIONS = ["insert", "update", "replace", "delete"]
+_NOT_REPLICA_SET = 40573
+_HISTORY_LOST = 286
+_PRE_IMAGES_MIN_VERSION = (6, 0)
+_POLICY_VIOLATION = 1008
+
+
+def _resync(collection: Optional[str] = None, token: Optional[str] = None) -> str:
+    return dumps({"type": "resync", "coll": collection, "token": token}).decode()
+
+
+class ChangeFeed:
+    """One shared change stream per worker with a bounded queue per subscriber."""
+
+    def __init__(self, db, fields: Dict[str, Iterable[str]]):
+        self.db = db
+        self.fields = {collection: frozenset(names) for collection, names in fields.items()}
+        self.available = True
+        # fullDocumentBeforeChange MongoDB 6.0'dan önce bilinmeyen seçenek hatası verir
+        self.pre_images = False
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._recent = deque(maxlen=REPLAY_BUFFER_SIZE)  # (token, message)
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _watch(self, resume_after=None):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.fields)}, "operationType": {"$in": _OPERATIONS}}}]
+        options = {"full_document_before_change": "whenAvailable"} if self.pre_images else {}
+        return self.db.watch(pipeline, full_document="updateLookup", resume_after=resume_after, **options)
+
+    async def _server_version(self) -> tuple:
+        try:
+            info = await self.db.client.server_info()
+        except PyMongoError as e:
+            logger.info(f"Could not read the MongoDB version: {e}")
+            return ()
+        return tuple(info.get("versionArray", ())[:2])
+
+    async def start(self):
+        self.pre_images = await self._server_version() >= _PRE_IMAGES_MIN_VERSION
+        for collection in self.fields if self.pre_images else ():
+            try:
+                await self.db.command("collMod", collection, changeStreamPreAndPostImages={"enabled": True})
+            except PyMongoError as e:
+                logger.info(f"Change stream pre-images not enabled for {collection}: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with self._watch(self._resume_token) as stream:
+                    logger.info("Change feed started")
+                    async for change in stream:
+                        self._resume_token = change["_id"]
+                        self._publish(*self.delta(change))
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == _NOT_REPLICA_SET:
+                    logger.warning("Change streams need a replica set. Real-time updates are disabled.")
+                    self.available = False
+                    self._publish(None, dumps({"type": "unavailable"}).decode())
+                    return
+                if self.pre_images and "fullDocumentBeforeChange" in str(e):
+                    # Sunucu seçeneği yine de reddetti: ön görüntüsüz devam
+                    logger.warning(f"Change stream pre-images unsupported, deletes will resync: {e}")
+                    self.pre_images = False
+                    continue
+                if e.code == _HISTORY_LOST:
+                    # Kaçırılan değişiklikler oplog'dan düşmüş: herkes REST'ten yeniden çeksin
+                    self._resume_token = None
+                    self._publish(None, _resync())
+                logger.error(f"Change feed failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Change feed interrupted: {e}. Resuming in {RETRY_SECONDS}s")
+            await asyncio.sleep(RETRY_SECONDS)
+
+    def delta(self, change: dict):
+        """(token, encoded message) for one change event; message is None when nothing public changed."""
+        token = change["_id"]["_data"]
+        collection = change["ns"]["coll"]
+        operation = change["operationType"]
+        allowed = self.fields.get(collection, frozenset())
+        doc = change.get("fullDocument") or change.get("fullDocumentBeforeChange") or {}
+        if doc.get("id") is None:
+            # Silinen dokümanın ön görüntüsü yok ya da güncellenen doküman artık yok
+            return token, _resync(collection, token)
+
+        message = {"type": "change", "coll": collection, "op": operation, "id": doc["id"], "token": token}
+        if operation in ("insert", "replace"):
+            message["doc"] = {key: value for key, value in doc.items() if key in allowed}
+        elif operation == "update":
+            description = change.get("updateDescription") or {}
+            message["fields"] = {key: value for key, value in (description.get("updatedFields") or {}).items()
+                                 if key.split(".")[0] in allowed}
+            message["removed"] = [key for key in description.get("removedFields") or []
+                                  if key.split(".")[0] in allowed]
+            if not message["fields"] and not message["removed"]:
+                return token, None
+        return token, dumps(message).decode()
+
+    def _publish(self, token: Optional[str], message: Optional[str]):
+        if message is None:
+            return
+        if token is not None:
+            self._recent.append((token, message))
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((token, message))
+            except asyncio.QueueFull:
+                # Yavaş istemci: birikeni at, yeniden senkron olsun
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait((None, _resync()))
+
+    def subscribe(self, resume: Optional[str] = None):
+        """(queue, backlog); backlog is None when `resume` is not in the replay buffer."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if not resume:
+            return queue, []
+        recent = list(self._recent)
+        for index, (token, _) in enumerate(recent):
+            if token == resume:
+                return queue, [message for _, message in recent[index + 1:]]
+        return queue, None
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def _catch_up(self, websocket, resume: str) -> Set[str]:
+        """Replay from `resume` with a private stream up to now; returns the tokens sent."""
+        sent = set()
+        try:
+            async with self._watch({"_data": resume}) as stream:
+                while len(sent) < MAX_CATCH_UP_EVENTS:
+                    change = await stream.try_next()
+                    if change is None:
+                        return sent
+                    token, message = self.delta(change)
+                    sent.add(token)
+                    if message is not None:
+                        await websocket.send_text(message)
+        except PyMongoError as e:
+            logger.info(f"Cannot resume change stream at {resume[:16]}...: {e}")
+        await websocket.send_text(_resync())
+        return sent
+
+    async def serve(self, websocket, resume: Optional[str] = None, expires_at: Optional[float] = None,
+                    still_valid: Optional[Callable[[], Awaitable[bool]]] = None):
+        """Stream deltas to an accepted WebSocket until the client disconnects or the session ends.
+
+        `expires_at` is the token expiry (epoch seconds); `still_valid` is
+        awaited every SESSION_RECHECK_SECONDS (e.g. revoked users).
+        """
+        if not self.available:
+            await websocket.send_text(dumps({"type": "unavailable"}).decode())
+            await websocket.close()
+            return
+
+        queue, backlog = self.subscribe(resume)
+
+        async def forward():
+            skip = set()
+            if backlog is None:
+                skip = await self._catch_up(websocket, resume)
+            else:
+                for message in backlog:
+                    await websocket.send_text(message)
+            while True:
+                token, message = await queue.get()
+                if token is None or token not in skip:
+                    await websocket.send_text(message)
+
+        tasks = {asyncio.create_task(forward()), asyncio.create_task(self._drain(websocket))}
+        if expires_at is not None or still_valid is not None:
+            tasks.add(asyncio.create_task(self._guard_session(websocket, expires_at, still_valid)))
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.unsubscribe(queue)
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def _guard_session(websocket, expires_at: Optional[float],
+                             still_valid: Optional[Callable[[], Awaitable[bool]]]):
+        while True:
+            wait = SESSION_RECHECK_SECONDS
+            if expires_at is not None:
+                wait = min(wait, expires_at - time.time())
+            await asyncio.sleep(max(0.0, wait))
+            expired = expires_at is not None and time.time() >= expires_at
+            if expired or (still_valid is not None and not await still_valid()):
+                logger.info("Closing real-time subscriber: session expired or revoked")
+                await websocket.close(code=_POLICY_VIOLATION)
+                return
+
+    @staticmethod
+    async def _drain(websocket):
+        # İstemciden mesaj beklenmiyor; döngü bağlantı kapanınca biter
+        async for _ in websocket.iter_text():
+            pass
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+change_feed: Optional[ChangeFeed] = None
+
+
+async def start_change_feed(db, fields: Dict[str, Iterable[str]]):
+    """Create and start the module level feed (call from app startup)"""
+    global change_feed
+    change_feed = ChangeFeed(db, fields)
+    await change_feed.start()
+
+
+async def stop_change_feed():
+    global change_feed
+    if change_feed is not None:
+        await change_feed.stop()
+        change_feed = None
+
+
+async def serve_subscriber(websocket, resume: Optional[str] = None, subprotocol: Optional[str] = None,
+                           expires_at: Optional[float] = None,
+                           still_valid: Optional[Callable[[], Awaitable[bool]]] = None):
+    """Accept an authenticated WebSocket and stream deltas to it"""
+    if change_feed is None:
+        await websocket.close(code=1013)  # try again later
+        return
+    await websocket.accept(subprotocol=subprotocol)
+    await change_feed.serve(websocket, resume, expires_at, still_valid)
@@ -0,0 +1,146 @@
+"""
+Appointment Reminder Module
+
+Every pending appointment gets one row in `reminder_jobs` with a precomputed
+UTC `run_at`. The scheduler finds due reminders with an indexed range query on
+(status, run_at) instead of parsing appointment strings.
+
+A job scheduled when its run_at has already passed (the appointment was booked
+or moved inside the reminder window) is stored as expired: the customer has
+just received the confirmation SMS. A job is marked sent only after its SMS
+was queued, so a failed enqueue is retried on the next tick.
+"""
+import logging
+import os
+import uuid
+from datetime import timezone, timedelta
+from typing import Callable
+
+from sms import enqueue_sms
+from timeutil import appointment_starts_at, utcnow
+
+logger = logging.getLogger(__name__)
+
+REMINDER_PENDING = "pending"
+REMINDER_SENT = "sent"
+REMINDER_CANCELLED = "cancelled"
+REMINDER_EXPIRED = "expired"
+
+def reminder_hours_before() -> float:
+    return float(os.environ.get('REMINDER_HOURS_BEFORE', '24'))
+
+
+def _job_fields(appointment: dict):
+    # starts_at kanonik alandır; olmayan (eski) kayıtlarda string'lerden hesaplanır
+    starts_at = appointment.get('starts_at') or appointment_starts_at(
+        appointment['appointment_date'], appointment['appointment_time'])
+    return {
+        "run_at": starts_at - timedelta(hours=reminder_hours_before()),
+        "starts_at": starts_at,
+        "phone": appointment['phone'],
+        "customer_name": appointment['customer_name'],
+        "appointment_date": appointment['appointment_date'],
+        "appointment_time": appointment['appointment_time'],
+    }
+
+
+def _initial_status(fields: dict, now) -> str:
+    # Hatırlatma penceresi içinde alınan randevu az önce onay SMS'i aldı
+    return REMINDER_PENDING if fields["run_at"] > now else REMINDER_EXPIRED
+
+
+async def schedule_reminder(db, appointment: dict, reset: bool = True):
+    """Create or reset the reminder for an appointment (call after create/reschedule).
+
+    With reset=False only a still pending job is refreshed (e.g. phone changed),
+    so an already sent reminder is not sent again.
+    """
+    try:
+        fields = _job_fields(appointment)
+    except (ValueError, TypeError, KeyError) as e:
+        logger.warning(f"Randevu {appointment.get('id')} için hatırlatma planlanamadı: {e}")
+        return
+
+    if fields["starts_at"] <= utcnow():
+        await cancel_reminder(db, appointment['id'])
+        return
+
+    now = utcnow()
+    if not reset:
+        await db.reminder_jobs.update_one(
+            {"appointment_id": appointment['id'], "status": REMINDER_PENDING},
+            {"$set": {**fields, "updated_at": now}},
+        )
+        return
+    await db.reminder_jobs.update_one(
+        {"appointment_id": appointment['id']},
+        {"$set": {**fields, "status": _initial_status(fields, now), "updated_at": now},
+         "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+        upsert=True,
+    )
+
+
+async def cancel_reminder(db, appointment_id: str):
+    await db.reminder_jobs.update_one(
+        {"appointment_id": appointment_id, "status": REMINDER_PENDING},
+        {"$set": {"status": REMINDER_CANCELLED, "updated_at": utcnow()}},
+    )
+
+
+async def backfill_reminders(db) -> int:
+    """Insert missing jobs for future pending appointments. Existing jobs are left untouched."""
+    created = 0
+    cursor = db.appointments.find(
+        {"status": "Bekliyor", "starts_at": {"$gt": utcnow()}},
+        {"_id": 0, "id": 1, "phone": 1, "customer_name": 1, "appointment_date": 1, "appointment_time": 1,
+         "starts_at": 1},
+    ).batch_size(1000)
+    async for appointment in cursor:
+        fields = _job_fields(appointment)
+        now = utcnow()
+        result = await db.reminder_jobs.update_one(
+            {"appointment_id": appointment['id']},
+            {"$setOnInsert": {**fields, "id": str(uuid.uuid4()), "appointment_id": appointment['id'],
+                              "status": _initial_status(fields, now), "created_at": now, "updated_at": now}},
+            upsert=True,
+        )
+        if result.upserted_id is not None:
+            created += 1
+    if created:
+        logger.info(f"Backfilled {created} appointment reminders")
+    return created
+
+
+async def dispatch_due_reminders(db, build_message: Callable[[dict], str], batch_size: int = 500) -> int:
+    """Queue SMS for every reminder whose run_at has passed. Returns the number sent."""
+    now = utcnow()
+    sent = 0
+    cursor = db.reminder_jobs.find(
+        {"status": REMINDER_PENDING, "run_at": {"$lte": now}}, {"_id": 0}
+    ).sort("run_at", 1).limit(batch_size)
+    async for job in cursor:
+        # Randevu saati geçtiyse hatırlatmanın anlamı yok
+        if job['starts_at'].replace(tzinfo=timezone.utc) <= now:
+            await db.reminder_jobs.update_one(
+                {"id": job['id'], "status": REMINDER_PENDING},
+                {"$set": {"status": REMINDER_EXPIRED, "updated_at": now}},
+            )
+            continue
+        sms_id = await enqueue_sms(job['phone'], build_message(job), kind="appointment_reminder")
+        if sms_id is None:
+            # Kuyruğa yazılamadı: iş bekliyor kalır, sonraki turda tekrar denenir
+            logger.warning(f"Reminder {job['id']} could not be queued, will retry")
+            continue
+        await db.reminder_jobs.update_one(
+            {"id": job['id'], "status": REMINDER_PENDING},
+            {"$set": {"status": REMINDER_SENT, "sms_id": sms_id, "updated_at": now}},
+        )
+        sent += 1
+    if sent:
+        logger.info(f"Queued {sent} appointment reminders")
+    return sent
+
+
+async def run_reminders(db, build_message: Callable[[dict], str]):
+    """Scheduler tick: dispatch due reminders (the backfill is a one-off migration)."""
+    await dispatch_due_reminders(db, build_message)
@@ -0,0 +1,69 @@
+"""
+Fast Response Module
+
+List endpoints return up to PAGE_SIZE_MAX documents that we wrote ourselves.
+Going through `response_model` makes FastAPI validate every row with pydantic,
+dump it again and encode it with the standard json module. For these trusted
+reads `TrustedRows` instead projects exactly the model's fields in Mongo,
+fills in the model's static defaults (what model_construct would do) and the
+rows go out through orjson, which encodes datetimes natively. The route keeps
+its `response_model` for the OpenAPI schema; returning a Response bypasses it.
+
+orjson is optional; without it the standard encoder is used.
+"""
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Type
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logger.warning("orjson module not found. Falling back to the standard json encoder.")
+
+
+def _json_default(value):
+    if isinstance(value, datetime) and value.utcoffset() == timedelta(0):
+        return value.isoformat().replace("+00:00", "Z")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """orjson encoding; UTC datetimes end in "Z" like pydantic's."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with `dumps`."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class TrustedRows:
+    """Projection and defaults for serving `model` documents without re-validation."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.projection = {"_id": 0, **{name: 1 for name in model.model_fields}}
+        self.defaults = {
+            name: field.default for name, field in model.model_fields.items()
+            if field.default is not PydanticUndefined
+        }
+
+    def rows(self, docs: Iterable[dict]) -> List[dict]:
+        if not self.defaults:
+            return list(docs)
+        return [{**self.defaults, **doc} for doc in docs]
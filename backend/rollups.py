@@ -0,0 +1,93 @@
+"""
+Revenue Rollup Module
+
+Keeps one `revenue_daily` bucket per transaction date ({_id: "YYYY-MM-DD",
+amount, count}). Buckets are updated incrementally on every transaction write,
+so dashboard totals are a handful of bucket reads regardless of history size.
+`rebuild_rollups` recomputes them from `transactions` with a $group aggregation.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+async def record_revenue(db, date: str, amount: float, count: int = 1):
+    """Add (or with negative values remove) revenue to the bucket of `date`."""
+    await db.revenue_daily.update_one(
+        {"_id": date},
+        {"$inc": {"amount": amount, "count": count},
+         "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def record_transactions(db, transactions: Iterable[dict]):
+    """Apply many inserted transaction documents with one bulk write."""
+    totals = defaultdict(lambda: [0.0, 0])
+    for trans in transactions:
+        totals[trans['date']][0] += trans['amount']
+        totals[trans['date']][1] += 1
+    if not totals:
+        return
+    now = datetime.now(timezone.utc)
+    await db.revenue_daily.bulk_write([
+        UpdateOne({"_id": date}, {"$inc": {"amount": amount, "count": count}, "$set": {"updated_at": now}},
+                  upsert=True)
+        for date, (amount, count) in totals.items()
+    ], ordered=False)
+
+
+async def revenue_between(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
+    """Sum the buckets in [start_date, end_date] (both optional, inclusive)."""
+    query = {}
+    if start_date:
+        query.setdefault('_id', {})['$gte'] = start_date
+    if end_date:
+        query.setdefault('_id', {})['$lte'] = end_date
+    amount, count = 0.0, 0
+    async for bucket in db.revenue_daily.find(query, {"amount": 1, "count": 1}):
+        amount += bucket.get('amount', 0)
+        count += bucket.get('count', 0)
+    return {"amount": amount, "count": count}
+
+
+async def rebuild_rollups(db, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+    """Recompute the buckets in a date range (or everything) from `transactions`.
+
+    Each day is replaced in place after the read; buckets in the range that no
+    transaction backs any more are removed afterwards. Callers outside the
+    migrations hold indexes.migration_lock.
+    """
+    match = {}
+    if start_date:
+        match.setdefault('date', {})['$gte'] = start_date
+    if end_date:
+        match.setdefault('date', {})['$lte'] = end_date
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$date", "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+    ]
+    # Damga okumadan önce alınır: hesaplama sürerken artımlı güncellenen
+    # günlerin updated_at'i daha yenidir, silinmezler
+    now = datetime.now(timezone.utc)
+    writes = [
+        ReplaceOne({"_id": bucket['_id']},
+                   {"amount": bucket['amount'], "count": bucket['count'], "updated_at": now}, upsert=True)
+        async for bucket in db.transactions.aggregate(pipeline)
+    ]
+    if writes:
+        await db.revenue_daily.bulk_write(writes, ordered=False)
+
+    stale = {"updated_at": {"$not": {"$gte": now}}}
+    if start_date or end_date:
+        stale["_id"] = match['date']
+    await db.revenue_daily.delete_many(stale)
+
+    logger.info(f"Rebuilt {len(writes)} revenue buckets")
+    return len(writes)
@@ -0,0 +1,89 @@
+"""
+Background Scheduler Module
+
+Periodic asyncio tasks started at app startup. Tasks that must run on a single
+uvicorn worker are guarded by a lease based leader lock stored in Mongo.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from timeutil import utcnow
+
+logger = logging.getLogger(__name__)
+
+_tasks = []
+
+
+class LeaderLock:
+    """Lease based lock; the holder must renew it before `lease_seconds` pass."""
+
+    def __init__(self, db, name: str, lease_seconds: float = 60):
+        self.db = db
+        self.name = name
+        self.lease = timedelta(seconds=lease_seconds)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    async def acquire(self) -> bool:
+        """Acquire or renew the lock. Returns True while this process is the leader."""
+        now = utcnow()
+        try:
+            await self.db.scheduler_locks.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + self.lease, "renewed_at": now}},
+                upsert=True,
+            )
+            leader = True
+        except DuplicateKeyError:
+            # Kilit başka bir worker'da ve süresi dolmamış
+            leader = False
+
+        if leader != self.is_leader:
+            logger.info(f"{'Acquired' if leader else 'Lost'} scheduler lock '{self.name}' ({self.owner})")
+        self.is_leader = leader
+        return leader
+
+    async def release(self):
+        if self.is_leader:
+            await self.db.scheduler_locks.delete_one({"_id": self.name, "owner": self.owner})
+            self.is_leader = False
+
+
+def start_periodic(name: str, interval: float, func: Callable[[], Awaitable[None]],
+                   lock: Optional[LeaderLock] = None):
+    """Run `func` every `interval` seconds (only on the lock holder when a lock is given)."""
+    async def runner():
+        while True:
+            try:
+                if lock is None or await lock.acquire():
+                    await func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Periodic task '{name}' failed: {e}")
+            await asyncio.sleep(interval)
+
+    task = asyncio.create_task(runner(), name=name)
+    _tasks.append((task, lock))
+    return task
+
+
+async def stop_periodic():
+    """Cancel every periodic task and release held locks"""
+    for task, _ in _tasks:
+        task.cancel()
+    await asyncio.gather(*(task for task, _ in _tasks), return_exceptions=True)
+    for _, lock in _tasks:
+        if lock is not None:
+            try:
+                await lock.release()
+            except Exception as e:
+                logger.warning(f"Could not release scheduler lock '{lock.name}': {e}")
+    _tasks.clear()
@@ -0,0 +1,89 @@
+"""
+Appointment Search Module
+
+Replaces unanchored, case-insensitive $regex scans with exact lookups on a
+precomputed multikey field. Every appointment stores `search_keys`: all
+prefixes of its folded name words plus all prefixes of its normalized phone
+number. A query matches when each of its tokens is one of those keys, so
+typeahead search is an index equality lookup no matter how many appointments
+exist, and user input never reaches the regex engine.
+
+Folding is Turkish aware ("İ" -> "i", "I" -> "ı") and then drops diacritics
+("Şahin", "ŞAHİN" and "sahin" all fold to "sahin").
+"""
+import re
+import unicodedata
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from customers import customer_key
+
+MAX_PREFIX_LEN = 20
+MAX_QUERY_LEN = 64
+MAX_QUERY_TOKENS = 5
+
+_TURKISH_UPPER = str.maketrans({"İ": "i", "I": "ı"})
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: Optional[str]) -> str:
+    """Lowercase with Turkish rules, then strip diacritics (ı -> i as well)."""
+    lowered = (text or "").translate(_TURKISH_UPPER).lower()
+    decomposed = unicodedata.normalize("NFKD", lowered)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).replace("ı", "i")
+
+
+def _prefixes(word: str) -> set:
+    return {word[:i] for i in range(1, min(len(word), MAX_PREFIX_LEN) + 1)}
+
+
+def _phone_token(digits: str) -> str:
+    """Phone digits without country code and trunk 0, the way normalize_phone strips them
+    ("0545 1" -> "5451", "0384 212" -> "384212")."""
+    if digits.startswith("90"):
+        digits = digits[2:]
+    if digits.startswith("0"):
+        digits = digits[1:]
+    return digits
+
+
+def search_keys(customer_name: Optional[str], phone: Optional[str]) -> List[str]:
+    keys = set()
+    for word in _WORD.findall(fold(customer_name)):
+        keys |= _prefixes(word)
+    phone_key = customer_key(phone)
+    if phone_key:
+        # customer_key sabit hatlarda başındaki 0'ı tutar; sorgu token'ı her
+        # zaman kırpılmış olduğundan kırpılmış hali de indekslenir
+        keys |= _prefixes(phone_key) | _prefixes(_phone_token(phone_key))
+    return sorted(keys)
+
+
+def search_filter(query: str) -> dict:
+    """Mongo filter for a free text query (name words and/or phone digits)."""
+    query = (query or "")[:MAX_QUERY_LEN]
+    tokens = {word[:MAX_PREFIX_LEN] for word in _WORD.findall(fold(re.sub(r"\d", " ", query)))}
+    digits = _phone_token("".join(re.findall(r"\d", query)))
+    if digits:
+        tokens.add(digits[:MAX_PREFIX_LEN])
+    if not tokens:
+        return {"search_keys": {"$in": []}}
+    # En uzun (en seçici) token önce: index sınırları ilk elemandan kurulur
+    ordered = sorted(tokens, key=len, reverse=True)[:MAX_QUERY_TOKENS]
+    return {"search_keys": {"$all": ordered}}
+
+
+async def backfill_search_keys(db, batch_size: int = 1000):
+    """Compute search_keys for appointments written before they existed."""
+    while True:
+        batch = await db.appointments.find(
+            {"search_keys": {"$exists": False}}, {"_id": 1, "customer_name": 1, "phone": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return
+        await db.appointments.bulk_write([
+            UpdateOne({"_id": doc["_id"]},
+                      {"$set": {"search_keys": search_keys(doc.get("customer_name"), doc.get("phone"))}})
+            for doc in batch
+        ], ordered=False)
@@ -1,59 +1,137 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, Response, Query, WebSocket
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
-import requests
+from datetime import date, datetime, timezone, timedelta
 from urllib.parse import quote
 from zoneinfo import ZoneInfo
-import re
-import xml.etree.ElementTree as ET
 
 # --- GÜVENLİK (SECURITY) İÇİN YENİ İMPORTLAR ---
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 
 # --- REDIS CACHE VE RATE LIMITİNG ---
-from cache import init_redis, invalidate_cache
-from rate_limit import limiter, rate_limit, LIMITS
-from slowapi.errors import RateLimitExceeded
-from slowapi import _rate_limit_exceeded_handler
+from cache import init_redis, close_redis, cache_result, invalidate_cache, get_cache_stats
+from user_cache import get_user_cached, invalidate_user
+from rate_limit import RateLimitExceeded, check_api_limit, rate_limit, rate_limit_exceeded_handler, LIMITS
+
+# --- METRİKLER (PROMETHEUS) ---
+from metrics import (
+    METRICS_AVAILABLE, MongoCommandMetrics, PrometheusMiddleware, render_metrics,
+    start_loop_lag_monitor, stop_loop_lag_monitor,
+)
+from profiling import (
+    PROFILING_ENABLED, MongoCommandRecorder, SlowRequestProfiler, clear_slow_requests, get_slow_requests,
+)
+
+# --- MONGO INDEX YÖNETİMİ ---
+from indexes import bootstrap_database, migration_lock
+
+# --- SMS KUYRUĞU ---
+from sms import start_sms_dispatcher, stop_sms_dispatcher, enqueue_sms, send_bulk_sms
+
+# --- ZAMANLANMIŞ İŞLER (HATIRLATMA) ---
+from scheduler import LeaderLock, start_periodic, stop_periodic
+from reminders import schedule_reminder, cancel_reminder, run_reminders
+from timeutil import TURKEY_TZ, appointment_starts_at, local_day_range
+
+# --- MÜSAİTLİK ---
+from availability import SlotGrid, busy_masks, free_days, query_range
+
+# --- DIŞA AKTARMA ---
+from export import (
+    APPOINTMENT_COLUMNS, CSV_MEDIA_TYPE, EXPORT_BATCH_SIZE, GZIP_MEDIA_TYPE, TRANSACTION_COLUMNS,
+    XLSX_AVAILABLE, XLSX_MEDIA_TYPE, stream_csv, stream_xlsx,
+)
+
+# --- HIZLI JSON YANITLARI ---
+from responses import FastJSONResponse, TrustedRows
+
+# --- KOŞULLU GET (ETag / 304) ---
+from etags import ConditionalGet, set_etag_headers
+
+# --- GERÇEK ZAMANLI GÜNCELLEMELER ---
+from realtime import serve_subscriber, start_change_feed, stop_change_feed
+
+# --- DELTA SYNC ---
+from sync import changes_since, parse_watermark, record_tombstone
+
+# --- GELİR ÖZETLERİ ---
+from rollups import record_revenue, record_transactions, revenue_between, rebuild_rollups
+from analytics import revenue_analytics
+
+# --- MÜŞTERİ DİZİNİ ---
+from customers import (
+    customer_key, record_customer, record_customers, refresh_customer, rebuild_customers, completion_deltas,
+)
+
+# --- ARAMA ---
+from search import search_filter, search_keys
+
+# --- SAYFALAMA ---
+from pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, fetch_page, set_page_headers
+
+# --- ROOT DİZİN VE .ENV YÜKLEME ---
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
 
 # --- GÜVENLİK AYARLARI ---
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'default_karmaşık_bir_secret_key_ekleyin_mutlaka') 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 gün geçerli token
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt maliyet faktörü değişirse eski hash'ler girişte yeniden hesaplanır
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# bcrypt CPU yoğun; event loop yerine sınırlı bir thread havuzunda çalışır.
+# Varsayılan bir çekirdeği event loop'a bırakır (bench_login.py)
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, max(1, (os.cpu_count() or 2) - 1)))))
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
-# --- ROOT DİZİN VE .ENV YÜKLEME ---
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL')
 if not mongo_url:
     raise ValueError("MONGO_URL environment variable is required!")
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: BSON tarihleri UTC olarak işaretli datetime döner (created_at, starts_at ...)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics(), MongoCommandRecorder()])
 db = client[os.environ.get('DB_NAME', 'royal_koltuk')]
 
-# İletimerkezi SMS API Configuration
-ILETIMERKEZI_API_KEY = os.environ.get('ILETIMERKEZI_API_KEY')
-ILETIMERKEZI_HASH = os.environ.get('ILETIMERKEZI_HASH')
-ILETIMERKEZI_SENDER = os.environ.get('ILETIMERKEZI_SENDER', 'FatihSenyuz')
-
 # SMS Content Configuration
 SUPPORT_PHONE = os.environ.get('SUPPORT_PHONE', '0545 595 3250')
 FEEDBACK_URL = os.environ.get('FEEDBACK_URL', 'https://bit.ly/royalyorum')
 COMPANY_SIGNATURE = os.environ.get('COMPANY_SIGNATURE', 'Royal Premium Care – Nevşehir')
-SMS_ENABLED = os.environ.get('SMS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Reminder Configuration
+REMINDERS_ENABLED = os.environ.get('REMINDERS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+REMINDER_POLL_SECONDS = int(os.environ.get('REMINDER_POLL_SECONDS', '60'))
+
+# Auto-completion Configuration (randevu saatinden 1 saat sonra "Tamamlandı")
+COMPLETION_DELAY_HOURS = 1
+COMPLETION_SWEEP_SECONDS = int(os.environ.get('COMPLETION_SWEEP_SECONDS', '60'))
+COMPLETION_BATCH_SIZE = 500
+
+# Availability Configuration (aylık takvim görünümü + pay)
+AVAILABILITY_MAX_DAYS = 62
+
+# Metrics Configuration (boşsa /metrics herkese açık; sadece iç ağdan erişilmeli)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Analytics Configuration ("facet": Mongo'da, "pandas": uygulamada vektörel)
+ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'facet')
 
 # Create the main app without a prefix
 app = FastAPI(
@@ -86,9 +164,24 @@ app = FastAPI(
     * Register: 3 istek/saat
     * Genel API: 100 istek/dakika
     
+    ### Koşullu İstekler (ETag):
+    
+    Hizmetler, ayarlar ve randevu/kasa listeleri `ETag` başlığı döner. İstek
+    `If-None-Match` ile tekrarlandığında veri değişmediyse gövdesiz
+    `304 Not Modified` gelir (Redis gerekir).
+    
     ### WebSocket Desteği:
     
-    Real-time güncellemeler için WebSocket desteği yakında eklenecek.
+    `/api/ws?token=<JWT>` randevu, kasa ve hizmet değişikliklerini anlık olarak
+    (sadece değişen alanlar) gönderir. Yeniden bağlanırken son mesajın `token`
+    değeri `resume` parametresiyle verilirse kaçırılan değişiklikler de gelir;
+    `resync` mesajı gelirse liste REST'ten yeniden çekilmelidir.
+    
+    ### Delta Senkronizasyon:
+    
+    `/api/sync?since=<watermark>` son senkronizasyondan beri değişen ve silinen
+    randevu, kasa ve hizmet kayıtlarını döner. Yanıttaki `watermark` bir sonraki
+    istekte kullanılır; `resync: true` ise listeler baştan çekilmelidir.
     """,
     version="1.0.0",
     contact={
@@ -101,11 +194,7 @@ app = FastAPI(
 )
 
 # Add rate limiter to app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Initialize Redis cache
-init_redis()
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -113,11 +202,14 @@ api_router = APIRouter(prefix="/api")
 
 # === YENİ GÜVENLİK YARDIMCI FONKSİYONLARI ===
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_and_update_password(plain_password, hashed_password):
+    """(geçerli_mi, yeni_hash) döner; yeni_hash sadece hash yenilenmesi gerekiyorsa doludur."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify_and_update, plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -125,7 +217,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -135,7 +227,11 @@ async def get_user_from_db(username: str):
         return UserInDB(**user)
     return None
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def load_user_fields(username: str):
+    return await db.users.find_one({"username": username}, {"_id": 0, "username": 1, "full_name": 1})
+
+async def authenticate_token(token: str) -> "User":
+    """JWT -> User; raises 401 HTTPException (HTTP bağımlılığı ve WebSocket ortak kullanır)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -149,61 +245,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_from_db(username)
+    # Kullanıcı bilgisi önbellekten (işlem içi + Redis) gelir, her istekte DB'ye gidilmez
+    user = await get_user_cached(username, payload.get("jti"), load_user_fields)
     if user is None:
         raise credentials_exception
+    return User(**user)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user = await authenticate_token(token)
+    # Genel 'api' limiti: korumalı her endpoint bu bağımlılıktan geçer
+    await check_api_limit(user.username)
     return user
 
 # === GÜVENLİK YARDIMCI FONKSİYONLARI SONU ===
 
 
-# SMS Helper Function (Değişiklik yok)
-def send_sms(to_phone: str, message: str):
-    try:
-        if not SMS_ENABLED:
-            logging.info("SMS sending is disabled via SMS_ENABLED env. Skipping.")
-            return True
-
-        clean_phone = re.sub(r'\D', '', to_phone)
-        if clean_phone.startswith('90'): clean_phone = clean_phone[2:]
-        if clean_phone.startswith('0'): clean_phone = clean_phone[1:]
-        if not clean_phone.startswith('5') or len(clean_phone) != 10:
-            logging.error(f"Invalid Turkish phone number format: {to_phone} -> {clean_phone}")
-            return False
-        
-        # Sanitize and cap message length to avoid URL length or provider issues
-        sanitized = re.sub(r"\s+", " ", message).strip()
-        MAX_LEN = 480  # conservative multi-part SMS cap
-        if len(sanitized) > MAX_LEN:
-            sanitized = sanitized[:MAX_LEN]
-
-        api_url = "https://api.iletimerkezi.com/v1/send-sms/get/"
-        params = {
-            'key': ILETIMERKEZI_API_KEY, 'hash': ILETIMERKEZI_HASH, 'text': sanitized,
-            'receipents': clean_phone, 'sender': ILETIMERKEZI_SENDER,
-            'iys': '1', 'iysList': 'BIREYSEL'
-        }
-        response = requests.get(api_url, params=params, timeout=10)
-        
-        try:
-            root = ET.fromstring(response.text)
-            status_code = root.find('.//status/code').text
-            status_message = root.find('.//status/message').text
-            
-            if status_code == '200':
-                logging.info(f"SMS sent successfully to {clean_phone}.")
-                return True
-            else:
-                logging.error(f"SMS failed to {clean_phone}. Code: {status_code}, Message: {status_message}")
-                return False
-        except ET.ParseError as e:
-            logging.error(f"Failed to parse İletimerkezi response (status={response.status_code}): {response.text} | Error: {str(e)}")
-            return False
-    except Exception as e:
-        logging.error(f"Failed to send SMS to {to_phone}: {str(e)}")
-        return False
-
-
 # === VERİ MODELLERİ ===
 
 class User(BaseModel):
@@ -282,9 +338,21 @@ class Transaction(BaseModel):
     date: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Liste endpoint'leri için: tam olarak modelin alanları + varsayılanlar, tekrar doğrulama yok
+TRUSTED_APPOINTMENTS = TrustedRows(Appointment)
+TRUSTED_TRANSACTIONS = TrustedRows(Transaction)
+TRUSTED_SERVICES = TrustedRows(Service)
+
 class TransactionUpdate(BaseModel):
     amount: float
 
+class BulkSmsRequest(BaseModel):
+    message: str
+    phones: Optional[List[str]] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    status: Optional[str] = None
+
 class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = "app_settings"
@@ -304,7 +372,7 @@ async def register_user(request: Request, user_in: UserCreate):
             detail="This username is already registered.",
         )
     
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash(user_in.password)
     user_db = UserInDB(
         username=user_in.username,
         hashed_password=hashed_password,
@@ -312,6 +380,7 @@ async def register_user(request: Request, user_in: UserCreate):
     )
     
     await db.users.insert_one(user_db.model_dump())
+    await invalidate_user(user_db.username)
     
     return User(username=user_db.username, full_name=user_db.full_name)
 
@@ -319,12 +388,19 @@ async def register_user(request: Request, user_in: UserCreate):
 @rate_limit(LIMITS['login'])
 async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     user = await get_user_from_db(form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    password_ok, new_hash = False, None
+    if user:
+        password_ok, new_hash = await verify_and_update_password(form_data.password, user.hashed_password)
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # BCRYPT_ROUNDS değişmiş; şifreyi yeni maliyetle sessizce güncelle
+        await db.users.update_one({"username": user.username}, {"$set": {"hashed_password": new_hash}})
+        await invalidate_user(user.username)
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -335,30 +411,50 @@ async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequ
 
 # === KORUMALI API ENDPOINT'LERİ ===
 
+# Dışa aktarma (muhasebe) yardımcıları
+def date_range_filter(field: str, start_date: Optional[str], end_date: Optional[str]) -> dict:
+    if start_date and end_date:
+        return {field: {'$gte': start_date, '$lte': end_date}}
+    if start_date:
+        return {field: {'$gte': start_date}}
+    if end_date:
+        return {field: {'$lte': end_date}}
+    return {}
+
+def export_response(cursor, columns: List[str], export_format: str, compress: bool, basename: str) -> StreamingResponse:
+    if export_format == "xlsx":
+        if not XLSX_AVAILABLE:
+            raise HTTPException(status_code=501, detail="XLSX dışa aktarma için XlsxWriter kurulu değil")
+        body, media_type, filename = stream_xlsx(cursor, columns), XLSX_MEDIA_TYPE, f"{basename}.xlsx"
+    elif compress:
+        body, media_type, filename = stream_csv(cursor, columns, compress=True), GZIP_MEDIA_TYPE, f"{basename}.csv.gz"
+    else:
+        body, media_type, filename = stream_csv(cursor, columns), CSV_MEDIA_TYPE, f"{basename}.csv"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 # Services Routes
 @api_router.post("/services", response_model=Service)
 async def create_service(service: ServiceCreate, current_user: User = Depends(get_current_user)):
     service_obj = Service(**service.model_dump())
     doc = service_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['updated_at'] = doc['created_at']
     await db.services.insert_one(doc)
+    await invalidate_cache("services")
     return service_obj
 
 @api_router.get("/services", response_model=List[Service])
-async def get_services(current_user: User = Depends(get_current_user)):
-    services = await db.services.find({}, {"_id": 0}).to_list(1000)
-    for service in services:
-        if isinstance(service['created_at'], str):
-            service['created_at'] = datetime.fromisoformat(service['created_at'])
-    return services
+@cache_result("services", ttl=300)
+async def get_services(current_user: User = Depends(get_current_user),
+                       etag: Optional[str] = Depends(ConditionalGet("services"))):
+    return await db.services.find({}, {"_id": 0}).to_list(1000)
 
 @api_router.get("/services/{service_id}", response_model=Service)
 async def get_service(service_id: str, current_user: User = Depends(get_current_user)):
     service = await db.services.find_one({"id": service_id}, {"_id": 0})
     if not service:
         raise HTTPException(status_code=404, detail="Hizmet bulunamadı")
-    if isinstance(service['created_at'], str):
-        service['created_at'] = datetime.fromisoformat(service['created_at'])
     return service
 
 @api_router.put("/services/{service_id}", response_model=Service)
@@ -369,11 +465,11 @@ async def update_service(service_id: str, service_update: ServiceUpdate, current
     
     update_data = {k: v for k, v in service_update.model_dump().items() if v is not None}
     if update_data:
+        update_data['updated_at'] = datetime.now(timezone.utc)
         await db.services.update_one({"id": service_id}, {"$set": update_data})
+        await invalidate_cache("services")
     
     updated_service = await db.services.find_one({"id": service_id}, {"_id": 0})
-    if isinstance(updated_service['created_at'], str):
-        updated_service['created_at'] = datetime.fromisoformat(updated_service['created_at'])
     return updated_service
 
 @api_router.delete("/services/{service_id}")
@@ -381,41 +477,35 @@ async def delete_service(service_id: str, current_user: User = Depends(get_curre
     result = await db.services.delete_one({"id": service_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Hizmet bulunamadı")
+    await record_tombstone(db, "services", service_id)
+    await invalidate_cache("services")
     return {"message": "Hizmet silindi"}
 
 
 # Appointments Routes
+def slot_taken_error(appointment_date: str, appointment_time: str) -> HTTPException:
+    # Randevu yazarken oluşabilecek tek unique ihlali slot index'idir (id'ler uuid)
+    return HTTPException(
+        status_code=400,
+        detail=f"{appointment_date} tarihinde {appointment_time} saatinde zaten bir randevu var. Lütfen başka bir saat seçin."
+    )
+
 @api_router.post("/appointments", response_model=Appointment)
 async def create_appointment(appointment: AppointmentCreate, current_user: User = Depends(get_current_user)):
     service = await db.services.find_one({"id": appointment.service_id}, {"_id": 0})
     if not service:
         raise HTTPException(status_code=404, detail="Hizmet bulunamadı")
     
-    existing = await db.appointments.find_one({
-        "appointment_date": appointment.appointment_date,
-        "appointment_time": appointment.appointment_time,
-        "status": {"$ne": "İptal"}
-    })
-    
-    if existing:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"{appointment.appointment_date} tarihinde {appointment.appointment_time} saatinde zaten bir randevu var. Lütfen başka bir saat seçin."
-        )
-    
     appointment_data = appointment.model_dump()
     appointment_data['service_name'] = service['name']
     appointment_data['service_price'] = service['price']
     
+    starts_at = None
     try:
-        turkey_tz = ZoneInfo("Europe/Istanbul")
-        now = datetime.now(turkey_tz)
-        dt_str = f"{appointment.appointment_date} {appointment.appointment_time}"
-        naive_dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-        appointment_dt = naive_dt.replace(tzinfo=turkey_tz)
-        completion_threshold = appointment_dt + timedelta(hours=1)
-        
-        if now >= completion_threshold:
+        starts_at = appointment_starts_at(appointment.appointment_date, appointment.appointment_time)
+        completion_threshold = starts_at + timedelta(hours=COMPLETION_DELAY_HOURS)
+
+        if datetime.now(timezone.utc) >= completion_threshold:
             appointment_data['status'] = 'Tamamlandı'
             appointment_data['completed_at'] = datetime.now(timezone.utc).isoformat()
         else:
@@ -427,8 +517,16 @@ async def create_appointment(appointment: AppointmentCreate, current_user: User
     
     appointment_obj = Appointment(**appointment_data)
     doc = appointment_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.appointments.insert_one(doc)
+    doc['starts_at'] = starts_at
+    doc['updated_at'] = doc['created_at']
+    doc['slot_active'] = True
+    doc['customer_key'] = customer_key(appointment.phone)
+    doc['search_keys'] = search_keys(appointment.customer_name, appointment.phone)
+    try:
+        # Aynı tarih/saatte aktif randevu varsa partial unique index yazmayı reddeder
+        await db.appointments.insert_one(doc)
+    except DuplicateKeyError:
+        raise slot_taken_error(appointment.appointment_date, appointment.appointment_time)
     
     if appointment_obj.status == 'Tamamlandı':
         transaction = Transaction(
@@ -437,8 +535,16 @@ async def create_appointment(appointment: AppointmentCreate, current_user: User
             date=appointment_obj.appointment_date
         )
         trans_doc = transaction.model_dump()
-        trans_doc['created_at'] = trans_doc['created_at'].isoformat()
+        trans_doc['customer_key'] = doc['customer_key']
+        trans_doc['updated_at'] = trans_doc['created_at']
         await db.transactions.insert_one(trans_doc)
+        await record_revenue(db, trans_doc['date'], trans_doc['amount'])
+        await record_customer(db, doc['customer_key'], name=appointment_obj.customer_name, appointments=1,
+                              completed=1, revenue=trans_doc['amount'], visit_date=appointment_obj.appointment_date)
+    else:
+        await schedule_reminder(db, doc)
+        await record_customer(db, doc['customer_key'], name=appointment_obj.customer_name, appointments=1)
+    await invalidate_cache("appointments", "transactions")
 
     # === SADECE YENİ RANDEVU SMS'İ (Oluşturma / Onay) ===
     sms_message = (
@@ -451,7 +557,7 @@ async def create_appointment(appointment: AppointmentCreate, current_user: User
         f"Bilgi veya değişiklik için: {SUPPORT_PHONE}\n\n"
         f"— {COMPANY_SIGNATURE}"
     )
-    send_sms(appointment.phone, sms_message)
+    await enqueue_sms(appointment.phone, sms_message, kind="appointment_created")
     
     return appointment_obj
 
@@ -460,81 +566,57 @@ async def get_appointments(
     date: Optional[str] = None,
     status: Optional[str] = None,
     search: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    current_user: User = Depends(get_current_user),
+    etag: Optional[str] = Depends(ConditionalGet("appointments", weak=True))
 ):
     query = {}
     if date: query['appointment_date'] = date
     if status: query['status'] = status
     if search:
-        query['$or'] = [
-            {'customer_name': {'$regex': search, '$options': 'i'}},
-            {'phone': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    appointments_from_db = await db.appointments.find(query, {"_id": 0}).sort("appointment_date", -1).to_list(1000)
+        # İsim kelimesi / telefon öneki; regex yok, search_keys index'i ile eşitlik araması
+        query.update(search_filter(search))
     
     try:
-        turkey_tz = ZoneInfo("Europe/Istanbul")
-        now = datetime.now(turkey_tz)
-    except Exception:
-        turkey_tz = timezone(timedelta(hours=3))
-        now = datetime.now(turkey_tz)
-
-    ids_to_update = [] 
-    transactions_to_create = [] 
-
-    for appt in appointments_from_db:
-        if isinstance(appt.get('created_at'), str):
-            appt['created_at'] = datetime.fromisoformat(appt['created_at'])
-
-        if appt.get('status') == 'Bekliyor':
-            try:
-                dt_str = f"{appt['appointment_date']} {appt['appointment_time']}"
-                naive_dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M")
-                appointment_dt = naive_dt.replace(tzinfo=turkey_tz)
-                completion_threshold = appointment_dt + timedelta(hours=1)
-                
-                if now >= completion_threshold:
-                    appt['status'] = 'Tamamlandı'
-                    completed_at_iso = datetime.now(timezone.utc).isoformat()
-                    appt['completed_at'] = completed_at_iso
-                    ids_to_update.append(appt['id'])
-                    
-                    transaction = Transaction(
-                        appointment_id=appt['id'], customer_name=appt['customer_name'],
-                        service_name=appt['service_name'], amount=appt['service_price'],
-                        date=appt['appointment_date']
-                    )
-                    trans_doc = transaction.model_dump()
-                    trans_doc['created_at'] = trans_doc['created_at'].isoformat()
-                    transactions_to_create.append(trans_doc)
-            
-            except (ValueError, TypeError) as e:
-                logging.warning(f"Randevu {appt['id']} için tarih ayrıştırılamadı: {e}")
-
-    if ids_to_update:
-        await db.appointments.update_many(
-            {"id": {"$in": ids_to_update}},
-            {"$set": {
-                "status": "Tamamlandı",
-                "completed_at": datetime.now(timezone.utc).isoformat()
-            }}
+        appointments_from_db, next_cursor = await fetch_page(
+            db.appointments, query, ["appointment_date", "id"], limit, cursor,
+            projection=TRUSTED_APPOINTMENTS.projection
         )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci (cursor)")
+    total = await db.appointments.count_documents(query) if include_total else None
     
-    if transactions_to_create:
-        # Otomatik tamamlamada SMS göndermiyoruz (müşteriyi rahatsız etmemek için)
-        # Sadece Kasa (Transaction) kaydı oluşturuyoruz
-        await db.transactions.insert_many(transactions_to_create)
-    
-    return appointments_from_db
+    # Kendi yazdığımız kayıtlar: pydantic ile tekrar doğrulamadan doğrudan orjson
+    response = FastJSONResponse(TRUSTED_APPOINTMENTS.rows(appointments_from_db))
+    set_page_headers(response, next_cursor, total)
+    set_etag_headers(response, etag)
+    return response
+
+@api_router.get("/appointments/export")
+@rate_limit(LIMITS['export'])
+async def export_appointments(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    gzip: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    query = date_range_filter('appointment_date', start_date, end_date)
+    if status: query['status'] = status
+    cursor = db.appointments.find(query, {"_id": 0}).sort(
+        [("appointment_date", 1), ("id", 1)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, APPOINTMENT_COLUMNS, format, gzip, "randevular")
 
 @api_router.get("/appointments/{appointment_id}", response_model=Appointment)
 async def get_appointment(appointment_id: str, current_user: User = Depends(get_current_user)):
     appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
     if not appointment:
         raise HTTPException(status_code=404, detail="Randevu bulunamadı")
-    if isinstance(appointment['created_at'], str):
-        appointment['created_at'] = datetime.fromisoformat(appointment['created_at'])
     return appointment
 
 # === === === === === === === === === === === ===
@@ -548,24 +630,26 @@ async def update_appointment(appointment_id: str, appointment_update: Appointmen
     
     update_data = {k: v for k, v in appointment_update.model_dump().items() if v is not None}
     
-    # Check if date/time changed and if there's a conflict
-    if 'appointment_date' in update_data or 'appointment_time' in update_data:
-        check_date = update_data.get('appointment_date', appointment['appointment_date'])
-        check_time = update_data.get('appointment_time', appointment['appointment_time'])
-        
-        existing = await db.appointments.find_one({
-            "id": {"$ne": appointment_id},
-            "appointment_date": check_date,
-            "appointment_time": check_time,
-            "status": {"$ne": "İptal"}
-        })
-        
-        if existing:
-            raise HTTPException(
-                status_code=400,
-                detail=f"{check_date} tarihinde {check_time} saatinde zaten bir randevu var. Lütfen başka bir saat seçin."
-            )
+    check_date = update_data.get('appointment_date', appointment['appointment_date'])
+    check_time = update_data.get('appointment_time', appointment['appointment_time'])
+
+    old_key = appointment.get('customer_key') or customer_key(appointment['phone'])
+    new_key = customer_key(update_data['phone']) if 'phone' in update_data else old_key
+    if 'phone' in update_data:
+        update_data['customer_key'] = new_key
+    if 'phone' in update_data or 'customer_name' in update_data:
+        update_data['search_keys'] = search_keys(
+            update_data.get('customer_name', appointment['customer_name']),
+            update_data.get('phone', appointment['phone'])
+        )
     
+    if 'appointment_date' in update_data or 'appointment_time' in update_data:
+        try:
+            update_data['starts_at'] = appointment_starts_at(check_date, check_time)
+        except (ValueError, TypeError) as e:
+            logging.warning(f"Randevu {appointment_id} için tarih ayrıştırılamadı: {e}")
+            update_data['starts_at'] = None
+
     # If service_id changed, update service details
     if 'service_id' in update_data:
         service = await db.services.find_one({"id": update_data['service_id']}, {"_id": 0})
@@ -574,15 +658,35 @@ async def update_appointment(appointment_id: str, appointment_update: Appointmen
             update_data['service_price'] = service['price']
     
 
-    # === YENİ SMS ve İŞLEM (TRANSACTION) MANTIĞI ===
-    
     new_status = update_data.get('status')
     old_status = appointment['status']
+
+    rescheduled = 'appointment_date' in update_data or 'appointment_time' in update_data
+    update = {}
+    if new_status is not None or rescheduled:
+        # Yeni saate taşınan randevu (çakışma yüzünden slottan çıkarılmış olsa
+        # bile) iptal değilse yeni slotu tutar
+        update_data['slot_active'] = (new_status or old_status) != 'İptal'
+    if rescheduled:
+        update['$unset'] = {'slot_conflict': ""}
+    if new_status == 'Tamamlandı' and old_status != 'Tamamlandı':
+        update_data['completed_at'] = datetime.now(timezone.utc).isoformat()
+
+    if update_data:
+        update_data['updated_at'] = datetime.now(timezone.utc)
+        update['$set'] = update_data
+        try:
+            # Çakışma kontrolü slot index'i ile tek yazmada yapılır
+            await db.appointments.update_one({"id": appointment_id}, update)
+        except DuplicateKeyError:
+            raise slot_taken_error(check_date, check_time)
+
+    # === YENİ SMS ve İŞLEM (TRANSACTION) MANTIĞI ===
     
+    completion_revenue = 0.0
+
     # Durum "Tamamlandı" olarak değiştiyse
     if new_status == 'Tamamlandı' and old_status != 'Tamamlandı':
-        update_data['completed_at'] = datetime.now(timezone.utc).isoformat()
-        
         # İşlem (Kasa) oluştur
         transaction = Transaction(
             appointment_id=appointment_id,
@@ -592,8 +696,15 @@ async def update_appointment(appointment_id: str, appointment_update: Appointmen
             date=appointment['appointment_date']
         )
         trans_doc = transaction.model_dump()
-        trans_doc['created_at'] = trans_doc['created_at'].isoformat()
-        await db.transactions.insert_one(trans_doc)
+        trans_doc['customer_key'] = new_key
+        trans_doc['updated_at'] = trans_doc['created_at']
+        try:
+            await db.transactions.insert_one(trans_doc)
+            await record_revenue(db, trans_doc['date'], trans_doc['amount'])
+            completion_revenue = trans_doc['amount']
+        except DuplicateKeyError:
+            # Otomatik tamamlama bu randevu için kaydı zaten oluşturmuş
+            logging.info(f"Randevu {appointment_id} için kasa kaydı zaten mevcut")
         
         # Müşteriye SMS GÖNDER (Tamamlandı)
         try:
@@ -605,7 +716,7 @@ async def update_appointment(appointment_id: str, appointment_update: Appointmen
                 f"Görüş bildirmek için: {FEEDBACK_URL}\n\n"
                 f"— {COMPANY_SIGNATURE}"
             )
-            send_sms(appointment['phone'], sms_message)
+            await enqueue_sms(appointment['phone'], sms_message, kind="appointment_completed")
         except Exception as e:
             logging.error(f"Tamamlandı SMS'i gönderilirken hata oluştu: {e}")
 
@@ -622,25 +733,51 @@ async def update_appointment(appointment_id: str, appointment_update: Appointmen
                 f"📞 İletişim: {SUPPORT_PHONE}\n\n"
                 f"— {COMPANY_SIGNATURE}"
             )
-            send_sms(appointment['phone'], sms_message)
+            await enqueue_sms(appointment['phone'], sms_message, kind="appointment_cancelled")
         except Exception as e:
             logging.error(f"İptal SMS'i gönderilirken hata oluştu: {e}")
             
     # === YENİ SMS MANTIĞI SONU ===
 
-    if update_data:
-        await db.appointments.update_one({"id": appointment_id}, {"$set": update_data})
-    
     updated_appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
-    if isinstance(updated_appointment['created_at'], str):
-        updated_appointment['created_at'] = datetime.fromisoformat(updated_appointment['created_at'])
+
+    # Müşteri özetleri: olağan geçişler artımlı, telefon/tarih değişikliği ve
+    # tamamlanmanın geri alınması müşteriyi baştan hesaplar
+    if new_key != old_key:
+        await db.transactions.update_many({"appointment_id": appointment_id}, {"$set": {"customer_key": new_key}})
+    if (new_key != old_key or (old_status == 'Tamamlandı' and updated_appointment['status'] != 'Tamamlandı')
+            or ('appointment_date' in update_data and updated_appointment['status'] == 'Tamamlandı')):
+        for key in {old_key, new_key}:
+            await refresh_customer(db, key)
+    elif new_status == 'Tamamlandı' and old_status != 'Tamamlandı':
+        await record_customer(db, new_key, name=updated_appointment['customer_name'], completed=1,
+                              revenue=completion_revenue, visit_date=updated_appointment['appointment_date'])
+    elif 'customer_name' in update_data:
+        await record_customer(db, new_key, name=update_data['customer_name'])
+
+    await invalidate_cache("appointments", "transactions")
+
+    # Hatırlatma SMS'ini randevunun yeni durumuna göre güncelle
+    if updated_appointment['status'] != 'Bekliyor':
+        await cancel_reminder(db, appointment_id)
+    elif 'appointment_date' in update_data or 'appointment_time' in update_data or old_status != 'Bekliyor':
+        await schedule_reminder(db, updated_appointment)
+    elif 'phone' in update_data or 'customer_name' in update_data:
+        await schedule_reminder(db, updated_appointment, reset=False)
+
     return updated_appointment
 
 @api_router.delete("/appointments/{appointment_id}")
 async def delete_appointment(appointment_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.appointments.delete_one({"id": appointment_id})
-    if result.deleted_count == 0:
+    appointment = await db.appointments.find_one_and_delete(
+        {"id": appointment_id}, projection={"_id": 0, "phone": 1, "customer_key": 1}
+    )
+    if not appointment:
         raise HTTPException(status_code=404, detail="Randevu bulunamadı")
+    await record_tombstone(db, "appointments", appointment_id)
+    await cancel_reminder(db, appointment_id)
+    await refresh_customer(db, appointment.get('customer_key') or customer_key(appointment.get('phone')))
+    await invalidate_cache("appointments")
     return {"message": "Randevu silindi"}
 
 
@@ -649,65 +786,94 @@ async def delete_appointment(appointment_id: str, current_user: User = Depends(g
 async def get_transactions(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    current_user: User = Depends(get_current_user),
+    etag: Optional[str] = Depends(ConditionalGet("transactions", weak=True))
+):
+    query = date_range_filter('date', start_date, end_date)
+
+    try:
+        transactions, next_cursor = await fetch_page(db.transactions, query, ["date", "id"], limit, cursor,
+                                                     projection=TRUSTED_TRANSACTIONS.projection)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci (cursor)")
+    total = await db.transactions.count_documents(query) if include_total else None
+
+    response = FastJSONResponse(TRUSTED_TRANSACTIONS.rows(transactions))
+    set_page_headers(response, next_cursor, total)
+    set_etag_headers(response, etag)
+    return response
+
+@api_router.get("/transactions/export")
+@rate_limit(LIMITS['export'])
+async def export_transactions(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    gzip: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    query = {}
-    if start_date and end_date:
-        query['date'] = {'$gte': start_date, '$lte': end_date}
-    elif start_date:
-        query['date'] = {'$gte': start_date}
-    elif end_date:
-        query['date'] = {'$lte': end_date}
-    
-    transactions = await db.transactions.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
-    for transaction in transactions:
-        if isinstance(transaction['created_at'], str):
-            transaction['created_at'] = datetime.fromisoformat(transaction['created_at'])
-    return transactions
+    query = date_range_filter('date', start_date, end_date)
+    cursor = db.transactions.find(query, {"_id": 0}).sort(
+        [("date", 1), ("id", 1)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+    return export_response(cursor, TRANSACTION_COLUMNS, format, gzip, "islemler")
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
 async def update_transaction(transaction_id: str, transaction_update: TransactionUpdate, current_user: User = Depends(get_current_user)):
-    transaction = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
-    if not transaction:
-        raise HTTPException(status_code=404, detail="İşlem bulunamadı")
-    
-    await db.transactions.update_one(
+    # Eski tutarı atomik olarak alıp günlük gelir özetini farkı kadar düzelt
+    transaction = await db.transactions.find_one_and_update(
         {"id": transaction_id},
-        {"$set": {"amount": transaction_update.amount}}
+        {"$set": {"amount": transaction_update.amount, "updated_at": datetime.now(timezone.utc)}},
+        projection={"_id": 0, "date": 1, "amount": 1, "customer_key": 1}
     )
+    if not transaction:
+        raise HTTPException(status_code=404, detail="İşlem bulunamadı")
+    await record_revenue(db, transaction['date'], transaction_update.amount - transaction['amount'], count=0)
+    await record_customer(db, transaction.get('customer_key'), revenue=transaction_update.amount - transaction['amount'])
+    await invalidate_cache("transactions")
     
     updated_transaction = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
-    if isinstance(updated_transaction['created_at'], str):
-        updated_transaction['created_at'] = datetime.fromisoformat(updated_transaction['created_at'])
     return updated_transaction
 
 @api_router.delete("/transactions/{transaction_id}")
 async def delete_transaction(transaction_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.transactions.delete_one({"id": transaction_id})
-    if result.deleted_count == 0:
+    transaction = await db.transactions.find_one_and_delete(
+        {"id": transaction_id}, projection={"_id": 0, "date": 1, "amount": 1, "customer_key": 1}
+    )
+    if not transaction:
         raise HTTPException(status_code=404, detail="İşlem bulunamadı")
+    await record_tombstone(db, "transactions", transaction_id)
+    await record_revenue(db, transaction['date'], -transaction['amount'], count=-1)
+    await record_customer(db, transaction.get('customer_key'), revenue=-transaction['amount'])
+    await invalidate_cache("transactions")
     return {"message": "İşlem silindi"}
 
 
 # Dashboard Stats
 @api_router.get("/stats/dashboard")
+@cache_result("stats", ttl=60, tags=("appointments", "transactions"))
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     turkey_tz = ZoneInfo("Europe/Istanbul")
-    today = datetime.now(turkey_tz).date().isoformat()
+    local_today = datetime.now(turkey_tz).date()
+    today = local_today.isoformat()
     
-    today_appointments = await db.appointments.count_documents({"appointment_date": today})
-    today_completed = await db.appointments.count_documents({"appointment_date": today, "status": "Tamamlandı"})
+    # Bugünün randevuları: yerel günün UTC sınırları arasında starts_at
+    today_range = local_day_range(local_today, local_today)
+    today_appointments = await db.appointments.count_documents({"starts_at": today_range})
+    today_completed = await db.appointments.count_documents({"starts_at": today_range, "status": "Tamamlandı"})
     
-    today_transactions = await db.transactions.find({"date": today}, {"_id": 0}).to_list(1000)
-    today_income = sum(t['amount'] for t in today_transactions)
+    # Gelirler günlük özet (revenue_daily) kovalarından okunur
+    today_income = (await revenue_between(db, today, today))['amount']
     
     week_start = (datetime.now(turkey_tz).date() - timedelta(days=7)).isoformat()
-    week_transactions = await db.transactions.find({"date": {"$gte": week_start}}, {"_id": 0}).to_list(1000)
-    week_income = sum(t['amount'] for t in week_transactions)
+    week_income = (await revenue_between(db, week_start))['amount']
     
     month_start = datetime.now(turkey_tz).date().replace(day=1).isoformat()
-    month_transactions = await db.transactions.find({"date": {"$gte": month_start}}, {"_id": 0}).to_list(1000)
-    month_income = sum(t['amount'] for t in month_transactions)
+    month_income = (await revenue_between(db, month_start))['amount']
     
     return {
         "today_appointments": today_appointments,
@@ -718,15 +884,51 @@ async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     }
 
 
+@api_router.get("/stats/analytics")
+@cache_result("analytics", ttl=300, tags=("appointments", "transactions"))
+async def get_revenue_analytics(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    engine: str = Query(ANALYTICS_ENGINE, pattern="^(facet|pandas)$"),
+    current_user: User = Depends(get_current_user)
+):
+    report = await revenue_analytics(db, start_date, end_date, engine)
+    return {"start_date": start_date, "end_date": end_date, **report}
+
+
+@api_router.post("/stats/rollups/rebuild")
+async def rebuild_revenue_rollups(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    async with migration_lock(db, wait=False) as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Başka bir migrasyon veya yeniden hesaplama sürüyor")
+        buckets = await rebuild_rollups(db, start_date, end_date)
+    await invalidate_cache("transactions")
+    return {"rebuilt_days": buckets}
+
+
+@api_router.get("/stats/cache")
+async def cache_statistics(current_user: User = Depends(get_current_user)):
+    return get_cache_stats()
+
+
 # Settings Routes
-@api_router.get("/settings", response_model=Settings)
-async def get_settings(current_user: User = Depends(get_current_user)):
+@cache_result("settings", ttl=3600)
+async def load_settings() -> dict:
     settings = await db.settings.find_one({"id": "app_settings"}, {"_id": 0})
     if not settings:
         default_settings = Settings()
         await db.settings.insert_one(default_settings.model_dump())
-        return default_settings
-    return Settings(**settings)
+        return default_settings.model_dump()
+    return Settings(**settings).model_dump()
+
+@api_router.get("/settings", response_model=Settings)
+async def get_settings(current_user: User = Depends(get_current_user),
+                       etag: Optional[str] = Depends(ConditionalGet("settings"))):
+    return Settings(**await load_settings())
 
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(settings: Settings, current_user: User = Depends(get_current_user)):
@@ -735,29 +937,207 @@ async def update_settings(settings: Settings, current_user: User = Depends(get_c
         {"$set": settings.model_dump()},
         upsert=True
     )
+    await invalidate_cache("settings")
     return settings
 
 
+# Müsaitlik (takvim görünümü için boş slotlar)
+@api_router.get("/availability")
+async def get_availability(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    current_user: User = Depends(get_current_user)
+):
+    now_local = datetime.now(TURKEY_TZ).replace(tzinfo=None)
+    try:
+        start_day = date.fromisoformat(from_date) if from_date else now_local.date()
+        end_day = date.fromisoformat(to_date) if to_date else start_day
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Tarihler YYYY-MM-DD formatında olmalı")
+    if end_day < start_day:
+        raise HTTPException(status_code=400, detail="'to' tarihi 'from' tarihinden önce olamaz")
+    if (end_day - start_day).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"En fazla {AVAILABILITY_MAX_DAYS} günlük aralık sorgulanabilir")
+
+    settings = Settings(**await load_settings())
+    try:
+        grid = SlotGrid(settings.work_start_hour, settings.work_end_hour, settings.appointment_interval)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Tek starts_at aralık taraması; satır başına tarih ayrıştırma yok
+    appointments = await db.appointments.find(
+        {"starts_at": query_range(grid, start_day, end_day), "slot_active": True},
+        {"_id": 0, "starts_at": 1}
+    ).to_list(None)
+
+    masks = busy_masks(grid, appointments, start_day, end_day, TURKEY_TZ)
+    return {
+        "interval": grid.interval,
+        "slots": grid.times,
+        "days": free_days(grid, masks, start_day, end_day, now_local),
+    }
+
+
+# Bulk SMS (Kampanya / Toplu Gönderim)
+@api_router.post("/sms/bulk")
+@rate_limit(LIMITS['sms'])
+async def send_bulk_campaign(request: Request, bulk: BulkSmsRequest, current_user: User = Depends(get_current_user)):
+    if not bulk.message.strip():
+        raise HTTPException(status_code=400, detail="Mesaj boş olamaz")
+
+    if bulk.phones is not None:
+        # Açıkça boş liste: filtresiz randevu sorgusuna düşüp herkese gitmesin
+        if not bulk.phones:
+            raise HTTPException(status_code=400, detail="Alıcı listesi boş olamaz")
+
+        async def recipients():
+            for phone in bulk.phones:
+                yield phone
+    else:
+        # Alıcı listesi randevulardan cursor ile akıtılır, belleğe toplanmaz
+        query = {}
+        if bulk.start_date or bulk.end_date:
+            try:
+                query['starts_at'] = local_day_range(
+                    date.fromisoformat(bulk.start_date) if bulk.start_date else None,
+                    date.fromisoformat(bulk.end_date) if bulk.end_date else None,
+                )
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Tarihler YYYY-MM-DD formatında olmalı")
+        if bulk.status: query['status'] = bulk.status
+
+        async def recipients():
+            async for appt in db.appointments.find(query, {"_id": 0, "phone": 1}).batch_size(1000):
+                yield appt['phone']
+
+    batches = await send_bulk_sms(recipients(), bulk.message, kind="campaign")
+    return {
+        "total_recipients": sum(b['recipients'] for b in batches),
+        "sent": sum(b['recipients'] for b in batches if b['status'] == 'sent'),
+        "failed": sum(b['recipients'] for b in batches if b['status'] == 'failed'),
+        "invalid": sum(b['invalid'] for b in batches),
+        "batches": batches
+    }
+
+
 # Customer History
+@api_router.get("/customers/top")
+async def get_top_customers(
+    by: str = Query("revenue", pattern="^(revenue|completed|appointments)$"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    sort_field = {"revenue": "revenue", "completed": "completed_count", "appointments": "appointment_count"}[by]
+    customers = await db.customers.find({}, {"updated_at": 0}).sort(
+        [(sort_field, -1), ("_id", 1)]
+    ).limit(limit).to_list(limit)
+    for customer in customers:
+        customer.pop('_id', None)
+    return customers
+
+@api_router.post("/customers/rebuild")
+async def rebuild_customer_directory(current_user: User = Depends(get_current_user)):
+    async with migration_lock(db, wait=False) as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="Başka bir migrasyon veya yeniden hesaplama sürüyor")
+        return {"customers": await rebuild_customers(db)}
+
 @api_router.get("/customers/{phone}/history")
-async def get_customer_history(phone: str, current_user: User = Depends(get_current_user)):
-    appointments = await db.appointments.find(
-        {"phone": phone},
-        {"_id": 0}
-    ).sort("appointment_date", -1).to_list(1000)
-    
-    for appointment in appointments:
-        if isinstance(appointment['created_at'], str):
-            appointment['created_at'] = datetime.fromisoformat(appointment['created_at'])
-    
-    total_completed = len([a for a in appointments if a['status'] == 'Tamamlandı'])
+async def get_customer_history(
+    phone: str,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    # "0545...", "+90545..." ve "545..." aynı müşteridir
+    key = customer_key(phone)
+    customer = await db.customers.find_one({"_id": key}, {"_id": 0, "updated_at": 0}) if key else None
+
+    appointments, next_cursor = [], None
+    if customer:
+        try:
+            appointments, next_cursor = await fetch_page(
+                db.appointments, {"customer_key": key}, ["appointment_date", "id"], limit, cursor,
+                projection=TRUSTED_APPOINTMENTS.projection
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci (cursor)")
     
-    return {
+    return FastJSONResponse({
         "phone": phone,
-        "total_appointments": len(appointments),
-        "completed_appointments": total_completed,
-        "appointments": appointments
-    }
+        "customer": customer,
+        "total_appointments": customer['appointment_count'] if customer else 0,
+        "completed_appointments": customer['completed_count'] if customer else 0,
+        "appointments": TRUSTED_APPOINTMENTS.rows(appointments),
+        "limit": limit,
+        "next_cursor": next_cursor
+    })
+
+
+# Delta senkronizasyon: updated_at ve silinme kayıtları üzerinden indexli aralık sorguları
+@api_router.get("/sync")
+async def sync_changes(since: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    try:
+        since_at = parse_watermark(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Geçersiz watermark (since)")
+    return FastJSONResponse(await changes_since(db, since_at, {
+        "appointments": TRUSTED_APPOINTMENTS,
+        "transactions": TRUSTED_TRANSACTIONS,
+        "services": TRUSTED_SERVICES,
+    }))
+
+
+# Gerçek zamanlı güncellemeler (change stream -> WebSocket)
+WS_AUTH_SUBPROTOCOL = "bearer"
+
+
+def websocket_token(websocket: WebSocket) -> str:
+    """JWT from the Sec-WebSocket-Protocol header: new WebSocket(url, ["bearer", token])"""
+    # Tarayıcı WebSocket'i Authorization header'ı gönderemez; sorgu parametresi
+    # ise erişim loglarına düşer
+    offered = [value.strip() for value in websocket.headers.get("sec-websocket-protocol", "").split(",")]
+    if len(offered) == 2 and offered[0] == WS_AUTH_SUBPROTOCOL:
+        return offered[1]
+    return ""
+
+
+@api_router.websocket("/ws")
+async def realtime_updates(websocket: WebSocket, resume: Optional[str] = None):
+    token = websocket_token(websocket)
+    try:
+        user = await authenticate_token(token)
+        await check_api_limit(user.username)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    except RateLimitExceeded:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    async def still_valid() -> bool:
+        # Silinen kullanıcı ya da iptal edilen token: önbellek invalidasyonu ile görülür
+        try:
+            await authenticate_token(token)
+        except HTTPException:
+            return False
+        return True
+
+    expires_at = jwt.get_unverified_claims(token).get("exp")
+    await serve_subscriber(websocket, resume, subprotocol=WS_AUTH_SUBPROTOCOL,
+                           expires_at=expires_at, still_valid=still_valid)
+
+
+# Yavaş istek profilleri (son PROFILE_BUFFER_SIZE kayıt)
+@api_router.get("/admin/slow-requests")
+async def list_slow_requests(current_user: User = Depends(get_current_user)):
+    return {"enabled": PROFILING_ENABLED, "requests": get_slow_requests()}
+
+@api_router.delete("/admin/slow-requests")
+async def reset_slow_requests(current_user: User = Depends(get_current_user)):
+    clear_slow_requests()
+    return {"message": "Profil kayıtları silindi"}
 
 
 # Include the router in the main app
@@ -770,8 +1150,24 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],
 )
 
+# Yavaş istek profili (PROFILE_SLOW_REQUESTS=true ile açılır)
+app.add_middleware(SlowRequestProfiler)
+
+# Prometheus: en dışta, CORS dahil tüm isteği ölçer
+app.add_middleware(PrometheusMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    if not METRICS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="prometheus_client kurulu değil")
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Configure logging (Değişiklik yok)
 logging.basicConfig(
     level=logging.INFO,
@@ -779,6 +1175,143 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# === OTOMATİK TAMAMLAMA (ARKA PLAN) ===
+
+async def complete_due_appointments() -> int:
+    """Saati (COMPLETION_DELAY_HOURS) geçmiş bekleyen randevuları tamamlar ve kasa kaydı açar.
+
+    Sadece indexli (status, starts_at) aralık sorgusu kullanır; transactions.appointment_id
+    unique index'i sayesinde aynı randevu için ikinci kasa kaydı oluşamaz. Eski
+    kayıtların starts_at alanı "appointments_starts_at" migrasyonu ile doldurulur.
+    """
+    threshold = datetime.now(timezone.utc) - timedelta(hours=COMPLETION_DELAY_HOURS)
+    completed = 0
+    while True:
+        due = await db.appointments.find(
+            {"status": "Bekliyor", "starts_at": {"$lte": threshold}},
+            {"_id": 0, "id": 1, "customer_name": 1, "service_name": 1, "service_price": 1, "appointment_date": 1,
+             "phone": 1, "customer_key": 1}
+        ).sort("starts_at", 1).limit(COMPLETION_BATCH_SIZE).to_list(COMPLETION_BATCH_SIZE)
+        if not due:
+            break
+
+        # Otomatik tamamlamada SMS göndermiyoruz (müşteriyi rahatsız etmemek için)
+        # Sadece Kasa (Transaction) kaydı oluşturuyoruz. Kayıtlar durumdan önce
+        # yazılır: arada çökerse randevu "Bekliyor" kalır, sonraki tur tekrar
+        # dener ve unique appointment_id index'i ikinci kaydı engeller.
+        ids = [appt['id'] for appt in due]
+        transactions_to_create = []
+        for appt in due:
+            appt['customer_key'] = appt.get('customer_key') or customer_key(appt.get('phone'))
+            transaction = Transaction(
+                appointment_id=appt['id'], customer_name=appt['customer_name'],
+                service_name=appt['service_name'], amount=appt['service_price'],
+                date=appt['appointment_date']
+            )
+            trans_doc = transaction.model_dump()
+            trans_doc['customer_key'] = appt['customer_key']
+            trans_doc['updated_at'] = trans_doc['created_at']
+            transactions_to_create.append(trans_doc)
+        inserted = transactions_to_create
+        try:
+            await db.transactions.insert_many(transactions_to_create, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+            failed = {err['index'] for err in e.details.get('writeErrors', [])}
+            inserted = [t for i, t in enumerate(transactions_to_create) if i not in failed]
+
+        completed_now = datetime.now(timezone.utc)
+        completed_at_iso = completed_now.isoformat()
+        await db.appointments.update_many(
+            {"id": {"$in": ids}, "status": "Bekliyor"},
+            {"$set": {
+                "status": "Tamamlandı",
+                "completed_at": completed_at_iso,
+                "updated_at": completed_now
+            }}
+        )
+        confirmed = {
+            appt['id'] async for appt in db.appointments.find(
+                {"id": {"$in": ids}, "completed_at": completed_at_iso}, {"_id": 0, "id": 1}
+            )
+        }
+        completed_appts = [appt for appt in due if appt['id'] in confirmed]
+
+        # Ciroya: bu turda tamamlananların kasa kayıtları (yarım kalmış önceki
+        # turun yazdıkları dahil) ve arada elle tamamlanan randevular için bizim
+        # yazdığımız kayıt (elle tamamlama o durumda duplicate alıp saymaz).
+        # Tarama LeaderLock altında tek worker'da çalışır.
+        others = [t for t in inserted if t['appointment_id'] not in confirmed]
+        manually_completed = {
+            appt['id'] async for appt in db.appointments.find(
+                {"id": {"$in": [t['appointment_id'] for t in others]}, "status": "Tamamlandı"}, {"_id": 0, "id": 1}
+            )
+        } if others else set()
+        counted = await db.transactions.find(
+            {"appointment_id": {"$in": list(confirmed)}}, {"_id": 0}
+        ).to_list(None) if confirmed else []
+        counted += [t for t in others if t['appointment_id'] in manually_completed]
+        # Arada iptal edilen / değiştirilen randevular için açılan kayıtları geri al
+        stale = [t['id'] for t in others if t['appointment_id'] not in manually_completed]
+        if stale:
+            await db.transactions.delete_many({"id": {"$in": stale}})
+
+        await record_transactions(db, counted)
+        await record_customers(db, completion_deltas(completed_appts, counted))
+
+        completed += len(confirmed)
+        if len(due) < COMPLETION_BATCH_SIZE:
+            break
+
+    if completed:
+        await invalidate_cache("appointments", "transactions")
+        logging.info(f"{completed} randevu otomatik olarak tamamlandı")
+    return completed
+
+def build_reminder_message(job: dict) -> str:
+    return (
+        f"Sayın {job['customer_name']},\n\n"
+        f"Royal Koltuk Yıkama randevunuzu hatırlatmak isteriz.\n\n"
+        f"Tarih: {job['appointment_date']}\n"
+        f"Saat: {job['appointment_time']}\n\n"
+        f"Bilgi veya değişiklik için: {SUPPORT_PHONE}\n\n"
+        f"— {COMPANY_SIGNATURE}"
+    )
+
+@app.on_event("startup")
+async def start_background_workers():
+    # Initialize Redis cache
+    await init_redis()
+    start_loop_lag_monitor()
+    await bootstrap_database(db)
+    await start_sms_dispatcher(db)
+    # Worker başına tek change stream; WebSocket abonelerine dağıtılır
+    await start_change_feed(db, {
+        "appointments": Appointment.model_fields,
+        "transactions": Transaction.model_fields,
+        "services": Service.model_fields,
+    })
+
+    start_periodic(
+        "appointment_completion", COMPLETION_SWEEP_SECONDS, complete_due_appointments,
+        lock=LeaderLock(db, "appointment_completion", lease_seconds=COMPLETION_SWEEP_SECONDS * 3),
+    )
+
+    if REMINDERS_ENABLED:
+        # Birden fazla uvicorn worker'ında hatırlatmaları sadece kilidi tutan gönderir
+        start_periodic(
+            "appointment_reminders", REMINDER_POLL_SECONDS,
+            lambda: run_reminders(db, build_reminder_message),
+            lock=LeaderLock(db, "appointment_reminders", lease_seconds=REMINDER_POLL_SECONDS * 3),
+        )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await stop_periodic()
+    await stop_change_feed()
+    await stop_loop_lag_monitor()
+    await stop_sms_dispatcher()
+    password_executor.shutdown(wait=False)
+    await close_redis()
+    client.close()
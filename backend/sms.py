@@ -0,0 +1,339 @@
+"""
+SMS Dispatch Module
+
+Request handlers only enqueue messages into the `sms_log` collection; a bounded
+pool of background workers claims due messages, sends them to İletimerkezi over
+a pooled aiohttp session and records the outcome on the same document.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterable, List, Optional, Tuple
+
+import aiohttp
+from pymongo import ReturnDocument
+
+from metrics import observe_sms_request
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LEN = 480  # conservative multi-part SMS cap
+
+# sms_log durumları
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+BULK_BATCH_SIZE = 500  # recipients per provider POST request
+
+dispatcher = None
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """Return the 10 digit Turkish mobile number (5XXXXXXXXX) or None if invalid."""
+    clean_phone = re.sub(r'\D', '', phone or '')
+    if clean_phone.startswith('90'): clean_phone = clean_phone[2:]
+    if clean_phone.startswith('0'): clean_phone = clean_phone[1:]
+    if not clean_phone.startswith('5') or len(clean_phone) != 10:
+        return None
+    return clean_phone
+
+
+def sanitize_message(message: str) -> str:
+    """Collapse whitespace and cap the length to avoid provider issues."""
+    sanitized = re.sub(r"\s+", " ", message).strip()
+    if len(sanitized) > MAX_MESSAGE_LEN:
+        sanitized = sanitized[:MAX_MESSAGE_LEN]
+    return sanitized
+
+
+def parse_provider_response(text: str) -> Tuple[str, str]:
+    """Extract (status code, status message) from an İletimerkezi XML response."""
+    root = ET.fromstring(text)
+    return root.find('.//status/code').text, root.find('.//status/message').text
+
+
+async def iter_recipient_batches(phones: AsyncIterable[str], batch_size: int = BULK_BATCH_SIZE):
+    """Normalize and de-duplicate a stream of phone numbers into fixed size batches.
+
+    Yields (batch, invalid) tuples; `invalid` is the list of raw numbers that
+    were rejected since the previous batch.
+    """
+    seen = set()
+    batch, invalid = [], []
+    async for raw in phones:
+        phone = normalize_phone(raw)
+        if phone is None:
+            invalid.append(raw)
+            continue
+        if phone in seen:
+            continue
+        seen.add(phone)
+        batch.append(phone)
+        if len(batch) >= batch_size:
+            yield batch, invalid
+            batch, invalid = [], []
+    if batch or invalid:
+        yield batch, invalid
+
+
+class SmsDispatcher:
+    """Background worker pool draining the Mongo backed SMS queue."""
+
+    def __init__(self, db, workers: int = 4, max_attempts: int = 5,
+                 retry_base_seconds: float = 5.0, http_timeout: float = 10.0):
+        self.db = db
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.http_timeout = http_timeout
+        self.enabled = os.environ.get('SMS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+        self.api_url = os.environ.get('ILETIMERKEZI_API_URL', 'https://api.iletimerkezi.com').rstrip('/')
+        self.api_key = os.environ.get('ILETIMERKEZI_API_KEY')
+        self.api_hash = os.environ.get('ILETIMERKEZI_HASH')
+        self.sender = os.environ.get('ILETIMERKEZI_SENDER', 'FatihSenyuz')
+        self.poll_interval = 5.0
+        # A claimed message whose worker died is picked up again after the lease expires
+        self.lease = timedelta(seconds=http_timeout * 3)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.workers),
+            timeout=aiohttp.ClientTimeout(total=self.http_timeout),
+        )
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"SMS dispatcher started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def enqueue(self, to_phone: str, message: str, kind: str = "generic") -> Optional[str]:
+        """Persist a message in sms_log and wake up a worker. Never raises."""
+        try:
+            now = datetime.now(timezone.utc)
+            doc = {
+                "id": str(uuid.uuid4()),
+                "kind": kind,
+                "raw_phone": to_phone,
+                "phone": normalize_phone(to_phone),
+                "message": sanitize_message(message),
+                "status": STATUS_QUEUED,
+                "attempts": 0,
+                "last_error": None,
+                "provider_code": None,
+                "created_at": now,
+                "updated_at": now,
+                "next_attempt_at": now,
+                "sent_at": None,
+            }
+            if not self.enabled:
+                logger.info("SMS sending is disabled via SMS_ENABLED env. Skipping.")
+                doc["status"] = STATUS_SKIPPED
+            elif doc["phone"] is None:
+                logger.error(f"Invalid Turkish phone number format: {to_phone}")
+                doc["status"] = STATUS_FAILED
+                doc["last_error"] = "invalid_phone"
+
+            await self.db.sms_log.insert_one(doc)
+            if doc["status"] == STATUS_QUEUED:
+                self._wakeup.set()
+            return doc["id"]
+        except Exception as e:
+            logger.error(f"Failed to enqueue SMS to {to_phone}: {str(e)}")
+            return None
+
+    async def _claim(self):
+        now = datetime.now(timezone.utc)
+        return await self.db.sms_log.find_one_and_update(
+            {"$or": [
+                {"status": STATUS_QUEUED, "next_attempt_at": {"$lte": now}},
+                {"status": STATUS_SENDING, "next_attempt_at": {"$lte": now - self.lease}},
+            ]},
+            {"$set": {"status": STATUS_SENDING, "next_attempt_at": now, "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job = await self._claim()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SMS worker {index} error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _process(self, job: dict):
+        try:
+            ok, retryable, code, error = await self._deliver(job["phone"], job["message"])
+        except Exception as e:
+            ok, retryable, code, error = False, True, None, str(e)
+        now = datetime.now(timezone.utc)
+        update = {"provider_code": code, "last_error": error, "updated_at": now}
+
+        if ok:
+            update.update({"status": STATUS_SENT, "sent_at": now})
+            logger.info(f"SMS sent successfully to {job['phone']}.")
+        elif retryable and job["attempts"] < self.max_attempts:
+            delay = self.retry_base_seconds * (2 ** (job["attempts"] - 1))
+            delay += random.uniform(0, self.retry_base_seconds)
+            update.update({"status": STATUS_QUEUED, "next_attempt_at": now + timedelta(seconds=delay)})
+            logger.warning(f"SMS to {job['phone']} failed ({error}), retrying in {delay:.0f}s")
+        else:
+            update["status"] = STATUS_FAILED
+            logger.error(f"SMS failed to {job['phone']}. Code: {code}, Error: {error}")
+
+        await self.db.sms_log.update_one({"id": job["id"]}, {"$set": update})
+
+    async def _deliver(self, phone: str, message: str):
+        """Send one message. Returns (ok, retryable, provider_code, error)."""
+        params = {
+            'key': self.api_key or '', 'hash': self.api_hash or '', 'text': message,
+            'receipents': phone, 'sender': self.sender,
+            'iys': '1', 'iysList': 'BIREYSEL'
+        }
+        started = time.perf_counter()
+        try:
+            async with self.session.get(f"{self.api_url}/v1/send-sms/get/", params=params) as response:
+                text = await response.text()
+                http_status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            observe_sms_request("single", time.perf_counter() - started, "transport")
+            return False, True, None, f"transport: {e.__class__.__name__} {e}"
+        result = self._parse_result(text, http_status)
+        observe_sms_request("single", time.perf_counter() - started, None if result[0] else result[2] or "unparseable")
+        return result
+
+    async def send_bulk(self, phones: List[str], message: str):
+        """Send one message to many normalized numbers in a single POST request.
+
+        Returns (ok, retryable, provider_code, error) like a single delivery.
+        """
+        root = ET.Element('request')
+        auth = ET.SubElement(root, 'authentication')
+        ET.SubElement(auth, 'key').text = self.api_key or ''
+        ET.SubElement(auth, 'hash').text = self.api_hash or ''
+        order = ET.SubElement(root, 'order')
+        ET.SubElement(order, 'sender').text = self.sender
+        ET.SubElement(order, 'sendDateTime').text = ''
+        ET.SubElement(order, 'iys').text = '1'
+        ET.SubElement(order, 'iysList').text = 'BIREYSEL'
+        msg = ET.SubElement(order, 'message')
+        ET.SubElement(msg, 'text').text = message
+        receipents = ET.SubElement(msg, 'receipents')
+        for phone in phones:
+            ET.SubElement(receipents, 'number').text = phone
+        body = ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.api_url}/v1/send-sms", data=body,
+                                         headers={'Content-Type': 'text/xml; charset=utf-8'}) as response:
+                text = await response.text()
+                http_status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            observe_sms_request("bulk", time.perf_counter() - started, "transport")
+            return False, True, None, f"transport: {e.__class__.__name__} {e}"
+        result = self._parse_result(text, http_status)
+        observe_sms_request("bulk", time.perf_counter() - started, None if result[0] else result[2] or "unparseable")
+        return result
+
+    @staticmethod
+    def _parse_result(text: str, http_status: int):
+        try:
+            status_code, status_message = parse_provider_response(text)
+        except (ET.ParseError, AttributeError) as e:
+            return False, http_status >= 500, None, f"unparseable response (status={http_status}): {e}"
+
+        if status_code == '200':
+            return True, False, status_code, None
+        # 5xx kodları sağlayıcı tarafı geçici hatalar, tekrar denenebilir
+        return False, status_code.startswith('5'), status_code, status_message
+
+
+async def start_sms_dispatcher(db):
+    """Create and start the module level dispatcher (call from app startup)"""
+    global dispatcher
+    dispatcher = SmsDispatcher(
+        db,
+        workers=int(os.environ.get('SMS_WORKERS', '4')),
+        max_attempts=int(os.environ.get('SMS_MAX_ATTEMPTS', '5')),
+        retry_base_seconds=float(os.environ.get('SMS_RETRY_BASE_SECONDS', '5')),
+        http_timeout=float(os.environ.get('SMS_HTTP_TIMEOUT', '10')),
+    )
+    await dispatcher.start()
+
+
+async def stop_sms_dispatcher():
+    global dispatcher
+    if dispatcher is not None:
+        await dispatcher.stop()
+        dispatcher = None
+
+
+async def enqueue_sms(to_phone: str, message: str, kind: str = "generic") -> Optional[str]:
+    """Queue an SMS for background delivery. Returns the sms_log id (or None)."""
+    if dispatcher is None:
+        logger.error("SMS dispatcher is not running. Message dropped.")
+        return None
+    return await dispatcher.enqueue(to_phone, message, kind)
+
+
+async def send_bulk_sms(phones: AsyncIterable[str], message: str, kind: str = "bulk",
+                        batch_size: int = BULK_BATCH_SIZE) -> List[dict]:
+    """Send `message` to every number in `phones` using the provider's bulk API.
+
+    Numbers are consumed lazily, so callers can pass a Mongo cursor. Each batch
+    is recorded in sms_log and reported back with its own result.
+    """
+    if dispatcher is None:
+        raise RuntimeError("SMS dispatcher is not running")
+
+    message = sanitize_message(message)
+    results = []
+    async for batch, invalid in iter_recipient_batches(phones, batch_size):
+        result = {"batch": len(results) + 1, "recipients": len(batch), "invalid": len(invalid),
+                  "status": STATUS_SKIPPED, "provider_code": None, "error": None}
+        if batch and dispatcher.enabled:
+            ok, _, code, error = await dispatcher.send_bulk(batch, message)
+            result.update({"status": STATUS_SENT if ok else STATUS_FAILED,
+                           "provider_code": code, "error": error})
+
+        now = datetime.now(timezone.utc)
+        await dispatcher.db.sms_log.insert_one({
+            "id": str(uuid.uuid4()), "kind": kind, "phones": batch, "message": message,
+            "status": result["status"], "attempts": 1 if batch else 0,
+            "last_error": result["error"], "provider_code": result["provider_code"],
+            "created_at": now, "updated_at": now,
+            "sent_at": now if result["status"] == STATUS_SENT else None,
+        })
+        results.append(result)
+    return results
@@ -0,0 +1,133 @@
+"""
+Test fixtures
+
+The app runs against an in-memory Mongo (mongomock_motor) and, for the tests
+that need shared state across workers, an in-memory Redis (fakeredis). No
+external service is required.
+
+Kullanım:
+    cd backend && python -m pytest -q
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server import edilmeden önce: Motor bağlanmadan oluşturulur, .env değerlerini ezer
+os.environ['MONGO_URL'] = 'mongodb://localhost:27017'
+os.environ['DB_NAME'] = 'royal_test'
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret')
+
+import fakeredis  # noqa: E402
+import httpx  # noqa: E402
+import mongomock  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+import cache  # noqa: E402
+import server  # noqa: E402
+import user_cache  # noqa: E402
+from indexes import INDEXES  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+
+TEST_USER = server.User(username="tester")
+
+_find_and_modify = mongomock.Collection._find_and_modify
+
+
+def _find_and_modify_by_id(self, query, projection=None, update=None, upsert=False, sort=None, *args, **kwargs):
+    # mongomock tekrar _id ile arar: {"_id": 0} projeksiyonunda AFTER None döner
+    # ve sort'a rağmen ilk eşleşen güncellenir. Önce hedefin _id'sini bul.
+    target = self.find_one(query, projection={"_id": 1}, sort=sort)
+    if target is not None:
+        query = {"_id": target["_id"]}
+    return _find_and_modify(self, query, projection, update, upsert, sort, *args, **kwargs)
+
+
+mongomock.Collection._find_and_modify = _find_and_modify_by_id
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    """Process wide caches and limiter buckets must not leak between tests"""
+    cache._l1.clear()
+    cache._local_versions.clear()
+    user_cache._principals.clear()
+    limiter.reset()
+    monkeypatch.setattr(cache, "_redis_ok", False)
+    yield
+    server.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient(tz_aware=True)["royal_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+async def create_index_model(database, collection: str, model):
+    """create_indexes() replacement; mongomock drops partialFilterExpression there"""
+    document = dict(model.document)
+    keys = list(document.pop("key").items())
+    await database[collection].create_index(keys, **document)
+
+
+async def create_declared_indexes(database):
+    for collection, models in INDEXES.items():
+        for model in models:
+            await create_index_model(database, collection, model)
+
+
+@pytest.fixture
+async def indexed_db(db):
+    await create_declared_indexes(db)
+    return db
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(cache, "redis_client", client)
+    monkeypatch.setattr(cache, "_redis_ok", True)
+    return client
+
+
+@pytest.fixture
+def authenticated():
+    """Skip JWT and the per-user API limit for tests that are not about them"""
+    server.app.dependency_overrides[server.get_current_user] = lambda: TEST_USER
+
+
+@pytest.fixture
+def client(db, authenticated):
+    return TestClient(server.app)
+
+
+@pytest.fixture
+async def async_client(db, authenticated):
+    """Requests served on the test's own event loop (for concurrency tests)"""
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as http:
+        yield http
+
+
+async def create_service(database, service_id="koltuk", price=750.0):
+    await database.services.insert_one({"id": service_id, "name": "Koltuk Yıkama", "price": price})
+    return service_id
+
+
+def appointment_body(service_id="koltuk", day="2099-01-01", time="10:00", phone="05455953250", name="Ayşe Yılmaz"):
+    return {
+        "customer_name": name, "phone": phone, "address": "Nevşehir", "service_id": service_id,
+        "appointment_date": day, "appointment_time": time,
+    }
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+import analytics
+from customers import customer_key
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed(database):
+    await database.transactions.insert_many([
+        {"id": f"t{i}", "appointment_id": f"a{i}", "date": f"2024-05-{i % 3 + 1:02d}",
+         "amount": 100.0 * (i + 1), "service_name": "Koltuk" if i % 2 else "Halı"}
+        for i in range(6)
+    ])
+    await database.appointments.insert_many([
+        {"id": f"a{i}", "appointment_date": "2024-05-01", "phone": f"0545{i % 2}", "status": status}
+        for i, status in enumerate(["Tamamlandı", "Tamamlandı", "İptal", "Bekliyor"])
+    ])
+
+
+async def test_pandas_engine_groups_off_the_event_loop(db, monkeypatch):
+    await seed(db)
+    threads = []
+    report = analytics._pandas_report
+
+    def recording_report(tx, appts):
+        threads.append(threading.current_thread())
+        return report(tx, appts)
+
+    monkeypatch.setattr(analytics, "_pandas_report", recording_report)
+
+    result = await analytics.revenue_analytics(db, "2024-05-01", "2024-05-31", engine="pandas")
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert result["revenue"] == {"total": 2100.0, "count": 6, "average_ticket": 350.0}
+    assert [row["period"] for row in result["by_day"]] == ["2024-05-01", "2024-05-02", "2024-05-03"]
+    assert result["appointments"] == {"total": 4, "cancelled": 1, "cancellation_rate": 0.25}
+    assert result["customers"] == {"total": 2, "repeat": 1, "repeat_ratio": 0.5}
+
+
+
+async def seed_customer_formats(database):
+    # Aynı müşteri üç farklı yazımla; anahtarı olmayan eski kayıt ham telefonla sayılır
+    await database.appointments.insert_many([
+        {"id": "f1", "appointment_date": "2024-05-01", "phone": "0545 595 32 50",
+         "customer_key": customer_key("0545 595 32 50"), "status": "Tamamlandı"},
+        {"id": "f2", "appointment_date": "2024-05-02", "phone": "+90 545 595 3250",
+         "customer_key": customer_key("+90 545 595 3250"), "status": "Bekliyor"},
+        {"id": "f3", "appointment_date": "2024-05-03", "phone": "5455953250",
+         "customer_key": customer_key("5455953250"), "status": "İptal"},
+        {"id": "f4", "appointment_date": "2024-05-03", "phone": "0532 111 22 33",
+         "customer_key": customer_key("0532 111 22 33"), "status": "Tamamlandı"},
+        {"id": "f5", "appointment_date": "2024-05-03", "phone": "legacy", "status": "Tamamlandı"},
+    ])
+
+
+async def test_pandas_engine_counts_repeat_customers_by_customer_key(db):
+    await seed_customer_formats(db)
+
+    result = await analytics.revenue_analytics(db, "2024-05-01", "2024-05-31", engine="pandas")
+
+    assert result["customers"] == {"total": 3, "repeat": 1, "repeat_ratio": round(1 / 3, 4)}
+
+
+async def test_facet_customer_grouping_uses_customer_key(db):
+    # Tam facet motoru mongomock'ta çalışmaz ($convert yok); randevu pipeline'ı çalışır
+    await seed_customer_formats(db)
+
+    facet = (await db.appointments.aggregate(analytics._appointments_pipeline("2024-05-01", "2024-05-31"))
+             .to_list(1))[0]
+
+    assert facet["customers"] == [{"_id": None, "customers": 3, "repeat": 1}]
@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+
+import server
+from timeutil import appointment_starts_at
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Recipients of each send_bulk_sms call (the provider is not contacted)"""
+    calls = []
+
+    async def send_bulk_sms(phones, message, kind="bulk"):
+        recipients = [phone async for phone in phones]
+        calls.append(recipients)
+        return [{"batch": 1, "recipients": len(recipients), "invalid": 0, "status": "sent",
+                 "provider_code": "200", "error": None}]
+
+    monkeypatch.setattr(server, "send_bulk_sms", send_bulk_sms)
+    return calls
+
+
+@pytest.fixture
+async def booked(db):
+    rows = [("05000000001", "2099-01-01", "Bekliyor"), ("05000000002", "2099-01-02", "Tamamlandı"),
+            ("05000000003", "2099-01-03", "Bekliyor"), ("05000000004", "2099-02-01", "İptal")]
+    await db.appointments.insert_many([{
+        "id": str(uuid.uuid4()), "phone": phone, "appointment_date": day, "appointment_time": "10:00",
+        "status": status, "starts_at": appointment_starts_at(day, "10:00"),
+    } for phone, day, status in rows])
+
+
+async def bulk(async_client, **body):
+    return await async_client.post("/api/sms/bulk", json={"message": "Kampanya", **body})
+
+
+async def test_explicit_phone_list(async_client, booked, outbox):
+    response = await bulk(async_client, phones=["05551112233", "05551112244"])
+    assert response.status_code == 200
+    assert response.json()["total_recipients"] == 2
+    assert outbox == [["05551112233", "05551112244"]]
+
+
+async def test_empty_phone_list_is_rejected(async_client, booked, outbox):
+    response = await bulk(async_client, phones=[])
+    assert response.status_code == 400
+    assert outbox == []
+
+
+async def test_date_and_status_filters(async_client, booked, outbox):
+    await bulk(async_client, start_date="2099-01-02", end_date="2099-01-03")
+    await bulk(async_client, status="Bekliyor")
+    await bulk(async_client, start_date="2099-01-01", end_date="2099-01-31", status="Bekliyor")
+    await bulk(async_client)
+
+    assert [sorted(call) for call in outbox] == [
+        ["05000000002", "05000000003"],
+        ["05000000001", "05000000003"],
+        ["05000000001", "05000000003"],
+        ["05000000001", "05000000002", "05000000003", "05000000004"],
+    ]
+
+
+@pytest.mark.parametrize("dates", [{"start_date": "01.01.2099"}, {"end_date": "2099-13-01"}])
+async def test_malformed_dates_are_rejected(async_client, booked, outbox, dates):
+    assert (await bulk(async_client, **dates)).status_code == 400
+    assert outbox == []
+
+
+async def test_blank_message_is_rejected(async_client, outbox):
+    response = await async_client.post("/api/sms/bulk", json={"message": "  ", "phones": ["05551112233"]})
+    assert response.status_code == 400
@@ -0,0 +1,140 @@
+"""Completion creates exactly one transaction per appointment"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import indexes
+import server
+from customers import customer_key, rebuild_customers
+from rollups import rebuild_rollups
+
+pytestmark = pytest.mark.anyio
+
+
+async def insert_due(database, count: int, price: float = 750.0) -> list:
+    starts_at = datetime.now(timezone.utc) - timedelta(days=2)
+    docs = [{
+        "id": str(uuid.uuid4()), "customer_name": f"Müşteri {i}", "phone": f"0545595{i:04d}", "address": "-",
+        "service_id": "koltuk", "service_name": "Koltuk Yıkama", "service_price": price,
+        "appointment_date": "2024-05-01", "appointment_time": f"{8 + i % 10:02d}:{i // 10:02d}",
+        "status": "Bekliyor", "slot_active": True, "starts_at": starts_at,
+        "customer_key": customer_key(f"0545595{i:04d}"), "created_at": starts_at,
+    } for i in range(count)]
+    await database.appointments.insert_many(docs)
+    return docs
+
+
+async def test_completion_sweep_is_idempotent(indexed_db):
+    await insert_due(indexed_db, 5)
+
+    assert await server.complete_due_appointments() == 5
+    assert await server.complete_due_appointments() == 0
+
+    assert await indexed_db.transactions.count_documents({}) == 5
+    bucket = await indexed_db.revenue_daily.find_one({"_id": "2024-05-01"})
+    assert (bucket["amount"], bucket["count"]) == (3750.0, 5)
+
+
+async def test_concurrent_sweeps_create_one_transaction_each(indexed_db):
+    appointments = await insert_due(indexed_db, 30)
+
+    await asyncio.gather(*(server.complete_due_appointments() for _ in range(4)))
+
+    for appointment in appointments:
+        assert await indexed_db.transactions.count_documents({"appointment_id": appointment["id"]}) == 1
+    bucket = await indexed_db.revenue_daily.find_one({"_id": "2024-05-01"})
+    assert bucket["count"] == 30
+
+
+async def test_dedupe_migration_collapses_duplicates_and_fixes_rollups(db):
+    appointments = await insert_due(db, 3, price=500.0)
+    created = datetime.now(timezone.utc)
+    for appointment in appointments:
+        await db.appointments.update_one({"id": appointment["id"]}, {"$set": {"status": "Tamamlandı"}})
+    transactions = []
+    for copy in range(3):
+        for appointment in appointments[:2]:
+            transactions.append({
+                "id": str(uuid.uuid4()), "appointment_id": appointment["id"], "customer_name": "-",
+                "service_name": "Koltuk Yıkama", "amount": 500.0, "date": "2024-05-01",
+                "customer_key": appointment["customer_key"], "created_at": created + timedelta(seconds=copy),
+            })
+    transactions.append({
+        "id": str(uuid.uuid4()), "appointment_id": appointments[2]["id"], "customer_name": "-",
+        "service_name": "Koltuk Yıkama", "amount": 500.0, "date": "2024-05-01",
+        "customer_key": appointments[2]["customer_key"], "created_at": created,
+    })
+    await db.transactions.insert_many(transactions)
+    await rebuild_rollups(db)
+    await rebuild_customers(db)
+    assert (await db.revenue_daily.find_one({"_id": "2024-05-01"}))["count"] == 7
+
+    await indexes._dedupe_transactions(db)
+    await indexes._dedupe_transactions(db)
+
+    remaining = await db.transactions.find({}, {"_id": 0, "id": 1, "appointment_id": 1}).to_list(None)
+    assert len(remaining) == 3
+    # En eski kayıt kalır
+    kept = {t["id"] for t in transactions if t["created_at"] == created}
+    assert {t["id"] for t in remaining} == kept
+    bucket = await db.revenue_daily.find_one({"_id": "2024-05-01"})
+    assert (bucket["amount"], bucket["count"]) == (1500.0, 3)
+    customer = await db.customers.find_one({"_id": appointments[0]["customer_key"]})
+    assert customer["revenue"] == 500.0
+
+    # Artık unique index kurulabilir
+    await db.transactions.create_index("appointment_id", unique=True)
+
+
+def patch_collection(monkeypatch, database, name: str, method: str, replacement):
+    """Motor hands out a new collection object per attribute access, so patch the class"""
+    collection_type = type(database[name])
+    original = getattr(collection_type, method)
+
+    def dispatch(self, *args, **kwargs):
+        if self.name == name:
+            return replacement(original.__get__(self), *args, **kwargs)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(collection_type, method, dispatch)
+
+
+async def test_sweep_interrupted_before_the_status_update_is_repaired(indexed_db, monkeypatch):
+    appointments = await insert_due(indexed_db, 3)
+
+    async def crash(update_many, *args, **kwargs):
+        raise ConnectionError("mongo went away")
+
+    with monkeypatch.context() as patched:
+        patch_collection(patched, indexed_db, "appointments", "update_many", crash)
+        with pytest.raises(ConnectionError):
+            await server.complete_due_appointments()
+    assert await indexed_db.transactions.count_documents({}) == 3
+    assert await indexed_db.appointments.count_documents({"status": "Bekliyor"}) == 3
+
+    assert await server.complete_due_appointments() == 3
+
+    for appointment in appointments:
+        assert await indexed_db.transactions.count_documents({"appointment_id": appointment["id"]}) == 1
+    bucket = await indexed_db.revenue_daily.find_one({"_id": "2024-05-01"})
+    assert (bucket["amount"], bucket["count"]) == (2250.0, 3)
+    customer = await indexed_db.customers.find_one({"_id": appointments[0]["customer_key"]})
+    assert (customer["completed_count"], customer["revenue"]) == (1, 750.0)
+
+
+async def test_appointment_cancelled_during_the_sweep_keeps_no_transaction(indexed_db, monkeypatch):
+    appointments = await insert_due(indexed_db, 2)
+
+    async def cancel_then_insert(insert_many, docs, **kwargs):
+        # Kasa kaydı yazılırken personel ilk randevuyu iptal ediyor
+        await indexed_db.appointments.update_one({"id": appointments[0]["id"]}, {"$set": {"status": "İptal"}})
+        return await insert_many(docs, **kwargs)
+
+    patch_collection(monkeypatch, indexed_db, "transactions", "insert_many", cancel_then_insert)
+    assert await server.complete_due_appointments() == 1
+
+    assert await indexed_db.transactions.count_documents({"appointment_id": appointments[0]["id"]}) == 0
+    assert await indexed_db.transactions.count_documents({"appointment_id": appointments[1]["id"]}) == 1
+    assert (await indexed_db.revenue_daily.find_one({"_id": "2024-05-01"}))["count"] == 1
@@ -0,0 +1,98 @@
+"""Customer directory: incremental totals, single-customer refreshes and full rebuilds"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import customers
+from conftest import appointment_body, create_service
+from customers import customer_key, rebuild_customers
+from scheduler import LeaderLock
+
+pytestmark = pytest.mark.anyio
+
+PHONE = "05455953250"
+NEW_PHONE = "05321112233"
+
+
+async def totals(database, phone):
+    customer = await database.customers.find_one({"_id": customer_key(phone)})
+    if customer is None:
+        return None
+    return customer["appointment_count"], customer["completed_count"], customer["revenue"]
+
+
+@pytest.fixture
+async def completed(indexed_db, async_client):
+    await create_service(indexed_db)
+    appointment = (await async_client.post("/api/appointments", json=appointment_body(phone=PHONE))).json()
+    await async_client.post("/api/appointments", json=appointment_body(phone=PHONE, time="11:00"))
+    response = await async_client.put(f"/api/appointments/{appointment['id']}", json={"status": "Tamamlandı"})
+    assert response.status_code == 200
+    assert await totals(indexed_db, PHONE) == (2, 1, 750.0)
+    return appointment
+
+
+async def test_phone_change_moves_history_to_the_new_customer(indexed_db, async_client, completed):
+    await async_client.put(f"/api/appointments/{completed['id']}", json={"phone": NEW_PHONE})
+
+    assert await totals(indexed_db, PHONE) == (1, 0, 0.0)
+    assert await totals(indexed_db, NEW_PHONE) == (1, 1, 750.0)
+    transaction = await indexed_db.transactions.find_one({"appointment_id": completed["id"]})
+    assert transaction["customer_key"] == customer_key(NEW_PHONE)
+
+
+async def test_deleting_the_last_appointment_removes_the_customer(indexed_db, async_client, completed):
+    other = await indexed_db.appointments.find_one({"id": {"$ne": completed["id"]}})
+    await async_client.delete(f"/api/appointments/{other['id']}")
+    assert (await totals(indexed_db, PHONE))[:2] == (1, 1)
+
+    await indexed_db.transactions.delete_many({})
+    await async_client.delete(f"/api/appointments/{completed['id']}")
+    assert await totals(indexed_db, PHONE) is None
+
+
+async def test_uncompleting_recomputes_the_customer(indexed_db, async_client, completed):
+    await async_client.put(f"/api/appointments/{completed['id']}", json={"status": "Bekliyor"})
+
+    customer = await indexed_db.customers.find_one({"_id": customer_key(PHONE)})
+    assert (customer["appointment_count"], customer["completed_count"]) == (2, 0)
+    assert customer["last_visit"] is None
+
+
+async def test_rebuild_replaces_in_place_and_drops_only_absent_customers(indexed_db, async_client, completed):
+    stale = datetime.now(timezone.utc) - timedelta(hours=1)
+    await indexed_db.customers.update_one({"_id": customer_key(PHONE)}, {"$set": {"revenue": 1.0}})
+    await indexed_db.customers.insert_one({"_id": "5000000000", "phone": "5000000000", "updated_at": stale})
+
+    response = await async_client.post("/api/customers/rebuild")
+
+    assert response.json() == {"customers": 1}
+    assert await totals(indexed_db, PHONE) == (2, 1, 750.0)
+    assert await indexed_db.customers.count_documents({}) == 1
+
+
+async def test_rebuild_keeps_customers_written_while_it_runs(indexed_db, completed, monkeypatch):
+    aggregate = customers._aggregate_customers
+
+    async def with_concurrent_booking(database, key=None):
+        result = await aggregate(database, key)
+        await customers.record_customer(database, customer_key(NEW_PHONE), name="Yeni", appointments=1)
+        return result
+
+    monkeypatch.setattr(customers, "_aggregate_customers", with_concurrent_booking)
+    await rebuild_customers(indexed_db)
+
+    assert await totals(indexed_db, NEW_PHONE) == (1, 0, 0.0)
+    assert await totals(indexed_db, PHONE) == (2, 1, 750.0)
+
+
+async def test_rebuild_refuses_while_a_migration_holds_the_lock(indexed_db, async_client):
+    lock = LeaderLock(indexed_db, "schema_migrations")
+    assert await lock.acquire()
+
+    response = await async_client.post("/api/customers/rebuild")
+
+    assert response.status_code == 409
+    await lock.release()
+    assert (await async_client.post("/api/customers/rebuild")).status_code == 200
+    assert await indexed_db.scheduler_locks.count_documents({}) == 0
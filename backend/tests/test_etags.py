@@ -0,0 +1,75 @@
+import pytest
+
+import cache
+import server
+from conftest import create_service
+from etags import etag_matches
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_no_etag_without_redis(db, async_client):
+    response = await async_client.get("/api/services")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+async def test_matching_etag_answers_304_until_the_collection_changes(db, redis, async_client):
+    await create_service(db)
+    first = await async_client.get("/api/services")
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    cached = await async_client.get("/api/services", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+    await async_client.post("/api/services", json={"name": "Halı Yıkama", "price": 300.0})
+    changed = await async_client.get("/api/services", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()) == 2
+
+
+async def test_etag_never_goes_out_with_an_older_l1_body(db, redis, async_client):
+    await create_service(db)
+    first = await async_client.get("/api/services")
+    l1_hits = cache.cache_stats["services"]["l1_hits"]
+    assert (await async_client.get("/api/services")).headers["ETag"] == first.headers["ETag"]
+    assert cache.cache_stats["services"]["l1_hits"] == l1_hits + 1
+
+    # Başka bir worker yazdı: Redis versiyonu arttı, pub/sub mesajı henüz gelmedi
+    await db.services.insert_one({"id": "hali", "name": "Halı Yıkama", "price": 300.0})
+    await redis.incr(cache.get_version_key("services"))
+
+    response = await async_client.get("/api/services", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != first.headers["ETag"]
+    assert [service["id"] for service in response.json()] == ["koltuk", "hali"]
+
+
+async def test_weak_etag_depends_on_the_query(db, redis, async_client):
+    all_rows = await async_client.get("/api/appointments")
+    one_day = await async_client.get("/api/appointments", params={"date": "2099-01-01"})
+    assert all_rows.headers["ETag"].startswith('W/"')
+    assert all_rows.headers["ETag"] != one_day.headers["ETag"]
+
+    revalidated = await async_client.get("/api/appointments", params={"date": "2099-01-01"},
+                                         headers={"If-None-Match": one_day.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+async def test_unauthenticated_requests_never_get_304(db, redis, async_client):
+    etag = (await async_client.get("/api/services")).headers["ETag"]
+    server.app.dependency_overrides.clear()
+    response = await async_client.get("/api/services", headers={"If-None-Match": etag})
+    assert response.status_code == 401
+
+
+def test_if_none_match_comparison():
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"services-1"', '"x", "services-1"')
+    assert etag_matches('"services-1"', "*")
+    assert not etag_matches('"services-1"', '"services-2"')
+    assert not etag_matches('"services-1"', None)
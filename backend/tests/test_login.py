@@ -0,0 +1,75 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+import pytest
+from passlib.context import CryptContext
+
+import server
+from rate_limit import limiter
+
+pytestmark = pytest.mark.anyio
+
+PASSWORD = "s3cret-pass"
+STORM_ROUNDS = 10
+
+
+@pytest.fixture
+async def http(db, monkeypatch):
+    async def unlimited(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(limiter, "hit", unlimited)
+    await db.services.insert_one({"id": "koltuk", "name": "Koltuk Yıkama", "price": 750.0})
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+
+
+async def login(http, password=PASSWORD):
+    return await http.post("/api/token", data={"username": "tester", "password": password})
+
+
+async def test_login_issues_token(db, http):
+    await db.users.insert_one({"username": "tester", "hashed_password": await server.get_password_hash(PASSWORD)})
+
+    assert (await login(http, "wrong")).status_code == 401
+    token = (await login(http)).json()["access_token"]
+    response = await http.get("/api/services", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+
+async def test_login_rehashes_below_cost_factor(db, http, monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"]).hash(PASSWORD, rounds=4)
+    await db.users.insert_one({"username": "tester", "hashed_password": old_hash})
+    monkeypatch.setattr(server, "pwd_context", CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5, bcrypt__min_rounds=5))
+
+    assert (await login(http)).status_code == 200
+
+    stored = (await db.users.find_one({"username": "tester"}))["hashed_password"]
+    assert stored.startswith("$2b$05$")
+    assert (await login(http)).status_code == 200
+
+
+async def test_other_endpoints_stay_responsive_during_login_storm(db, http):
+    hashed = CryptContext(schemes=["bcrypt"]).hash(PASSWORD, rounds=STORM_ROUNDS)
+    await db.users.insert_one({"username": "tester", "hashed_password": hashed})
+    started = time.perf_counter()
+    server.pwd_context.verify(PASSWORD, hashed)
+    hash_seconds = time.perf_counter() - started
+
+    headers = {"Authorization": f"Bearer {server.create_access_token({'sub': 'tester'})}"}
+    latencies = []
+    storm = asyncio.gather(*(login(http) for _ in range(3 * server.PASSWORD_HASH_WORKERS + 3)))
+    while not storm.done():
+        probe_started = time.perf_counter()
+        assert (await http.get("/api/services", headers=headers)).status_code == 200
+        latencies.append(time.perf_counter() - probe_started)
+        await asyncio.sleep(0.005)
+    assert all(response.status_code == 200 for response in await storm)
+
+    # Hash'ler event loop'ta çalışsaydı her probe en az bir hash süresi beklerdi
+    assert len(latencies) >= 5
+    assert statistics.median(latencies) < hash_seconds / 2
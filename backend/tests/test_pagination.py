@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+
+def seed(db, count: int) -> list:
+    docs = [{
+        "id": str(uuid.uuid4()), "customer_name": f"Müşteri {i}", "phone": "05455953250", "address": "-",
+        "service_id": "koltuk", "service_name": "Koltuk Yıkama", "service_price": 750.0,
+        "appointment_date": f"2099-01-{i % 5 + 1:02d}", "appointment_time": f"{8 + i // 5:02d}:00",
+        "notes": "", "status": "Bekliyor", "slot_active": True,
+    } for i in range(count)]
+    asyncio.run(db.appointments.insert_many(docs))
+    return docs
+
+
+def test_cursor_pages_cover_every_row_once(client, db):
+    docs = seed(db, 23)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/appointments", params=params)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "23"
+        seen.extend(row["id"] for row in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(doc["id"] for doc in docs)
+    keys = [(doc["appointment_date"], doc["id"]) for doc in docs]
+    assert seen == [key[1] for key in sorted(keys, reverse=True)]
+
+
+@pytest.mark.parametrize("values", [
+    ["2099-01-01", {"$regex": ".*"}],
+    [{"$gt": ""}, "x"],
+    ["2099-01-01", ["a"]],
+    ["2099-01-01", True],
+])
+def test_operator_cursor_is_rejected(client, db, values):
+    seed(db, 3)
+    response = client.get("/api/appointments", params={"cursor": encode_cursor(values)})
+    assert response.status_code == 400
+
+
+def test_decode_cursor_accepts_scalars():
+    assert decode_cursor(encode_cursor(["2099-01-01", 3, 1.5, None])) == ["2099-01-01", 3, 1.5, None]
+    with pytest.raises(ValueError):
+        decode_cursor("not-base64-json")
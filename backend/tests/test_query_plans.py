@@ -0,0 +1,62 @@
+"""explain() checks: every representative API query must be index backed
+
+The plan helpers are tested against canned explain() output; mongomock has no
+query planner, so the real check runs only against a MongoDB server:
+
+    MONGO_TEST_URL=mongodb://localhost:27017 python -m pytest -q tests/test_query_plans.py
+"""
+import os
+import uuid
+
+import pytest
+
+from indexes import assert_indexed, bootstrap_database, check_queries, plan_stages, uses_collscan
+
+pytestmark = pytest.mark.anyio
+
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")
+
+IXSCAN_EXPLAIN = {"queryPlanner": {"winningPlan": {
+    "stage": "LIMIT", "inputStage": {
+        "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "appointment_date_-1_id_-1"}}}}}
+COLLSCAN_EXPLAIN = {"queryPlanner": {"winningPlan": {
+    "stage": "SORT", "inputStage": {"stage": "COLLSCAN", "direction": "forward"}}}}
+# Mongo 7 slot-based engine: plan altında queryPlan
+SBE_OR_EXPLAIN = {"queryPlanner": {"winningPlan": {"queryPlan": {
+    "stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+        {"stage": "IXSCAN"}, {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}}]}}}}}
+
+
+class CannedCursor:
+    def __init__(self, explain: dict):
+        self._explain = explain
+
+    async def explain(self):
+        return self._explain
+
+
+def test_plan_stages_walks_nested_plans():
+    assert plan_stages(IXSCAN_EXPLAIN["queryPlanner"]["winningPlan"]) == ["LIMIT", "FETCH", "IXSCAN"]
+    assert "COLLSCAN" in plan_stages(SBE_OR_EXPLAIN["queryPlanner"]["winningPlan"])
+
+
+async def test_uses_collscan():
+    assert not await uses_collscan(CannedCursor(IXSCAN_EXPLAIN))
+    assert await uses_collscan(CannedCursor(COLLSCAN_EXPLAIN))
+    assert await uses_collscan(CannedCursor(SBE_OR_EXPLAIN))
+    with pytest.raises(AssertionError, match="COLLSCAN"):
+        await assert_indexed(CannedCursor(COLLSCAN_EXPLAIN), "appointments page")
+
+
+@pytest.mark.skipif(not MONGO_TEST_URL, reason="MONGO_TEST_URL not set (needs a real MongoDB planner)")
+async def test_representative_queries_use_indexes():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_TEST_URL, tz_aware=True)
+    database = client[f"royal_plan_test_{uuid.uuid4().hex[:8]}"]
+    try:
+        await bootstrap_database(database)
+        assert await check_queries(database) == []
+    finally:
+        await client.drop_database(database.name)
+        client.close()
@@ -0,0 +1,50 @@
+"""Limits are enforced with a Redis sliding window shared by every worker"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache
+import server
+from rate_limit import LIMITS, limiter, parse_limit
+
+
+@pytest.fixture
+def api(db, redis):
+    return TestClient(server.app)
+
+
+def test_login_limit_returns_429_with_retry_after(api):
+    allowed, _ = parse_limit(LIMITS['login'])
+    for _ in range(allowed):
+        response = api.post("/api/token", data={"username": "nobody", "password": "x"})
+        assert response.status_code == 401
+
+    response = api.post("/api/token", data={"username": "nobody", "password": "x"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_api_limit_is_shared_between_workers(api, db):
+    asyncio.run(db.users.insert_one({"username": "tester", "hashed_password": "-"}))
+    headers = {"Authorization": f"Bearer {server.create_access_token({'sub': 'tester'})}"}
+    allowed, _ = parse_limit(LIMITS['api'])
+    for i in range(allowed):
+        if i % 10 == 0:
+            # Başka bir worker'a düşen istek: yerel kova boş, sayaç Redis'te
+            limiter.reset()
+        assert api.get("/api/services", headers=headers).status_code == 200
+
+    limiter.reset()
+    response = api.get("/api/services", headers=headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+
+def test_limits_fall_back_to_local_buckets_without_redis(db, monkeypatch):
+    monkeypatch.setattr(cache, "_redis_ok", False)
+    api = TestClient(server.app)
+    allowed, _ = parse_limit(LIMITS['login'])
+    statuses = [api.post("/api/token", data={"username": "nobody", "password": "x"}).status_code
+                for _ in range(allowed + 1)]
+    assert statuses == [401] * allowed + [429]
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import OperationFailure
+from starlette.websockets import WebSocketDisconnect
+
+import realtime
+import server
+from user_cache import invalidate_user
+
+FIELDS = {"appointments": server.Appointment.model_fields}
+
+
+@pytest.fixture
+def feed(db, monkeypatch):
+    change_feed = realtime.ChangeFeed(db, FIELDS)
+    monkeypatch.setattr(realtime, "change_feed", change_feed)
+    asyncio.run(db.users.insert_one({"username": "tester", "hashed_password": "-"}))
+    return change_feed
+
+
+def bearer(expires=timedelta(minutes=5)):
+    return ["bearer", server.create_access_token({"sub": "tester"}, expires_delta=expires)]
+
+
+def test_token_is_taken_from_the_subprotocol(feed):
+    client = TestClient(server.app)
+    with client.websocket_connect("/api/ws", subprotocols=bearer()) as ws:
+        assert ws.accepted_subprotocol == "bearer"
+        feed._publish("t1", '{"type":"change"}')
+        assert ws.receive_text() == '{"type":"change"}'
+
+
+@pytest.mark.parametrize("path", ["/api/ws", "/api/ws?token=whatever"])
+def test_missing_or_query_token_is_rejected(feed, path):
+    client = TestClient(server.app)
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(path) as ws:
+            ws.receive_text()
+    assert closed.value.code == 1008
+
+
+def test_socket_closes_when_token_expires(feed):
+    client = TestClient(server.app)
+    with client.websocket_connect("/api/ws", subprotocols=bearer(timedelta(seconds=1))) as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_text()
+    assert closed.value.code == 1008
+
+
+def test_socket_closes_when_user_is_removed(feed, db, monkeypatch):
+    monkeypatch.setattr(realtime, "SESSION_RECHECK_SECONDS", 0.05)
+    client = TestClient(server.app)
+    with client.websocket_connect("/api/ws", subprotocols=bearer()) as ws:
+        feed._publish("t1", "before")
+        assert ws.receive_text() == "before"
+        asyncio.run(db.users.delete_one({"username": "tester"}))
+        asyncio.run(invalidate_user("tester"))
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_text()
+    assert closed.value.code == 1008
+
+
+class FakeServer:
+    def __init__(self, version):
+        self.version = version
+
+    async def server_info(self):
+        return {"versionArray": self.version}
+
+
+class FakeDatabase:
+    """Records watch() options; the change stream itself is never iterated"""
+
+    def __init__(self, version, reject_pre_images=False):
+        self.client = FakeServer(version)
+        self.reject_pre_images = reject_pre_images
+        self.watched = []
+        self.commands = []
+
+    async def command(self, *args, **kwargs):
+        self.commands.append(args)
+
+    def watch(self, pipeline, **options):
+        self.watched.append(options)
+        return FakeStream(self.reject_pre_images and "full_document_before_change" in options)
+
+
+class FakeStream:
+    def __init__(self, reject):
+        self.reject = reject
+
+    async def __aenter__(self):
+        if self.reject:
+            raise OperationFailure("BSON field '$changeStream.fullDocumentBeforeChange' is an unknown field.", 40415)
+        raise asyncio.CancelledError
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("version, pre_images", [([5, 0, 9, 0], False), ([6, 0, 1, 0], True), ([7, 0, 2, 0], True)])
+async def test_pre_images_only_requested_on_mongo_6(version, pre_images):
+    database = FakeDatabase(version)
+    change_feed = realtime.ChangeFeed(database, FIELDS)
+    await change_feed.start()
+    await asyncio.gather(change_feed._task, return_exceptions=True)
+
+    assert change_feed.pre_images is pre_images
+    assert ("full_document_before_change" in database.watched[0]) is pre_images
+    assert bool(database.commands) is pre_images
+
+
+@pytest.mark.anyio
+async def test_rejected_pre_images_fall_back_without_retry_loop():
+    database = FakeDatabase([6, 0, 0, 0], reject_pre_images=True)
+    change_feed = realtime.ChangeFeed(database, FIELDS)
+    await change_feed.start()
+    await asyncio.gather(change_feed._task, return_exceptions=True)
+
+    assert change_feed.pre_images is False
+    assert [("full_document_before_change" in options) for options in database.watched] == [True, False]
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import indexes
+import reminders
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = {"now": NOW}
+    monkeypatch.setattr(reminders, "utcnow", lambda: current["now"])
+    monkeypatch.setenv("REMINDER_HOURS_BEFORE", "24")
+    return current
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Records queued reminder SMS; set `outbox.failing = True` to simulate an enqueue failure"""
+    class Outbox(list):
+        failing = False
+
+    box = Outbox()
+
+    async def enqueue(phone, message, kind="generic"):
+        if box.failing:
+            return None
+        box.append((phone, message, kind))
+        return f"sms-{len(box)}"
+
+    monkeypatch.setattr(reminders, "enqueue_sms", enqueue)
+    return box
+
+
+def appointment(starts_at: datetime, appointment_id="a1") -> dict:
+    return {"id": appointment_id, "phone": "05455953250", "customer_name": "Ayşe", "starts_at": starts_at,
+            "appointment_date": starts_at.date().isoformat(), "appointment_time": starts_at.strftime("%H:%M")}
+
+
+def message(job: dict) -> str:
+    return f"Hatırlatma {job['appointment_time']}"
+
+
+async def test_booking_inside_the_reminder_window_never_sends_a_reminder(db, clock, outbox):
+    await reminders.schedule_reminder(db, appointment(NOW + timedelta(hours=3)))
+
+    job = await db.reminder_jobs.find_one({"appointment_id": "a1"})
+    assert job["status"] == reminders.REMINDER_EXPIRED
+    assert await reminders.dispatch_due_reminders(db, message) == 0
+    assert outbox == []
+
+
+async def test_due_reminder_is_sent_once(db, clock, outbox):
+    await reminders.schedule_reminder(db, appointment(NOW + timedelta(days=3)))
+    assert await reminders.dispatch_due_reminders(db, message) == 0
+
+    clock["now"] = NOW + timedelta(days=2, minutes=1)
+    assert await reminders.dispatch_due_reminders(db, message) == 1
+    assert await reminders.dispatch_due_reminders(db, message) == 0
+
+    job = await db.reminder_jobs.find_one({"appointment_id": "a1"})
+    assert job["status"] == reminders.REMINDER_SENT and job["sms_id"] == "sms-1"
+    assert [kind for _, _, kind in outbox] == ["appointment_reminder"]
+
+
+async def test_failed_enqueue_keeps_the_job_pending_for_the_next_tick(db, clock, outbox):
+    await reminders.schedule_reminder(db, appointment(NOW + timedelta(days=3)))
+    clock["now"] = NOW + timedelta(days=2, minutes=1)
+
+    outbox.failing = True
+    assert await reminders.dispatch_due_reminders(db, message) == 0
+    assert (await db.reminder_jobs.find_one({"appointment_id": "a1"}))["status"] == reminders.REMINDER_PENDING
+
+    outbox.failing = False
+    assert await reminders.dispatch_due_reminders(db, message) == 1
+    assert len(outbox) == 1
+
+
+async def test_job_for_an_appointment_already_started_is_expired(db, clock, outbox):
+    await reminders.schedule_reminder(db, appointment(NOW + timedelta(days=3)))
+    clock["now"] = NOW + timedelta(days=3, minutes=1)
+
+    assert await reminders.dispatch_due_reminders(db, message) == 0
+    assert (await db.reminder_jobs.find_one({"appointment_id": "a1"}))["status"] == reminders.REMINDER_EXPIRED
+    assert outbox == []
+
+
+async def test_backfill_does_not_create_reminders_already_due(db, clock, outbox):
+    await db.appointments.insert_many([
+        {**appointment(NOW + timedelta(hours=5), "soon"), "status": "Bekliyor"},
+        {**appointment(NOW + timedelta(days=5), "later"), "status": "Bekliyor"},
+    ])
+
+    assert await reminders.backfill_reminders(db) == 2
+    statuses = {job["appointment_id"]: job["status"] async for job in db.reminder_jobs.find({})}
+    assert statuses == {"soon": reminders.REMINDER_EXPIRED, "later": reminders.REMINDER_PENDING}
+
+
+async def test_backfill_runs_once_as_a_migration_not_on_every_tick(db, clock, outbox):
+    await db.appointments.insert_one({**appointment(NOW + timedelta(days=5)), "status": "Bekliyor"})
+
+    await reminders.run_reminders(db, message)
+    assert await db.reminder_jobs.count_documents({}) == 0
+
+    backfill = [entry for entry in indexes.MIGRATIONS if entry[0] == "reminder_jobs_initial"]
+    assert await indexes.run_migrations(db, backfill) == ["reminder_jobs_initial"]
+    assert await indexes.run_migrations(db, backfill) == []
+    assert await db.reminder_jobs.count_documents({"status": reminders.REMINDER_PENDING}) == 1
@@ -0,0 +1,87 @@
+"""revenue_daily buckets must always match the transactions they summarize"""
+from collections import defaultdict
+
+import pytest
+
+from conftest import appointment_body, create_service
+from rollups import rebuild_rollups, record_revenue
+from scheduler import LeaderLock
+
+pytestmark = pytest.mark.anyio
+
+DAYS = ["2099-01-01", "2099-01-02", "2099-01-03"]
+
+
+async def from_transactions(database) -> dict:
+    totals = defaultdict(lambda: [0.0, 0])
+    async for trans in database.transactions.find({}, {"_id": 0, "date": 1, "amount": 1}):
+        totals[trans["date"]][0] += trans["amount"]
+        totals[trans["date"]][1] += 1
+    return {day: tuple(total) for day, total in totals.items()}
+
+
+async def buckets(database, include_empty: bool = False) -> dict:
+    return {bucket["_id"]: (bucket["amount"], bucket["count"])
+            async for bucket in database.revenue_daily.find({})
+            if include_empty or bucket["count"]}
+
+
+@pytest.fixture
+async def completed(indexed_db, async_client):
+    await create_service(indexed_db)
+    ids = []
+    for i, day in enumerate(DAYS * 2):
+        body = appointment_body(day=day, time=f"{10 + i}:00", phone=f"0545{i:07d}")
+        appointment = (await async_client.post("/api/appointments", json=body)).json()
+        await async_client.put(f"/api/appointments/{appointment['id']}", json={"status": "Tamamlandı"})
+        ids.append(appointment["id"])
+    return [await indexed_db.transactions.find_one({"appointment_id": appointment_id}) for appointment_id in ids]
+
+
+async def test_rollups_follow_transaction_edits_and_deletes(indexed_db, async_client, completed):
+    assert await buckets(indexed_db) == await from_transactions(indexed_db) == {day: (1500.0, 2) for day in DAYS}
+
+    await async_client.put(f"/api/transactions/{completed[0]['id']}", json={"amount": 900.0})
+    await async_client.delete(f"/api/transactions/{completed[1]['id']}")
+    await async_client.delete(f"/api/transactions/{completed[4]['id']}")
+    assert await buckets(indexed_db) == await from_transactions(indexed_db)
+
+    response = await async_client.post("/api/stats/rollups/rebuild")
+
+    assert response.json() == {"rebuilt_days": 2}
+    assert await buckets(indexed_db, include_empty=True) == await from_transactions(indexed_db) == {
+        "2099-01-01": (1650.0, 2), "2099-01-03": (1500.0, 2),
+    }
+
+
+async def test_range_rebuild_leaves_other_days_alone(indexed_db, completed):
+    await indexed_db.revenue_daily.update_many({}, {"$set": {"amount": 1.0}})
+    await indexed_db.revenue_daily.insert_one({"_id": "2099-01-02x", "amount": 5.0, "count": 1})
+
+    assert await rebuild_rollups(indexed_db, "2099-01-02", "2099-01-02") == 1
+
+    assert await buckets(indexed_db) == {"2099-01-01": (1.0, 2), "2099-01-02": (1500.0, 2),
+                                         "2099-01-02x": (5.0, 1), "2099-01-03": (1.0, 2)}
+
+
+async def test_rebuild_keeps_revenue_recorded_while_it_runs(indexed_db, completed, monkeypatch):
+    bulk_write = type(indexed_db.revenue_daily).bulk_write
+
+    async def with_concurrent_completion(self, *args, **kwargs):
+        result = await bulk_write(self, *args, **kwargs)
+        await record_revenue(indexed_db, "2099-02-01", 750.0)
+        return result
+
+    monkeypatch.setattr(type(indexed_db.revenue_daily), "bulk_write", with_concurrent_completion)
+    await rebuild_rollups(indexed_db)
+
+    assert (await buckets(indexed_db))["2099-02-01"] == (750.0, 1)
+
+
+async def test_rebuild_refuses_while_a_migration_holds_the_lock(indexed_db, async_client):
+    lock = LeaderLock(indexed_db, "schema_migrations")
+    assert await lock.acquire()
+
+    assert (await async_client.post("/api/stats/rollups/rebuild")).status_code == 409
+    await lock.release()
+    assert (await async_client.post("/api/stats/rollups/rebuild")).status_code == 200
@@ -0,0 +1,85 @@
+"""search_keys / search_filter: typeahead as index equality lookups"""
+import uuid
+
+import pytest
+
+import indexes
+from search import fold, search_filter, search_keys
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("text, folded", [
+    ("ŞAHİN", "sahin"), ("Şahin", "sahin"), ("sahin", "sahin"),
+    ("IŞIL", "isil"), ("İsmail", "ismail"), ("Gülşen Öztürk", "gulsen ozturk"), (None, ""),
+])
+def test_fold(text, folded):
+    assert fold(text) == folded
+
+
+def test_search_keys_hold_name_and_phone_prefixes():
+    keys = set(search_keys("Ayşe Yılmaz", "+90 545 595 32 50"))
+
+    assert {"a", "ay", "ayse", "y", "yilmaz"} <= keys
+    assert {"5", "545", "5455953250"} <= keys
+    assert not any(key.startswith(("0", "9")) for key in keys)
+
+
+def test_landline_keys_hold_both_forms():
+    keys = set(search_keys("Ali", "0384 212 34 56"))
+
+    assert {"03842123456", "0384", "3842123456", "384212"} <= keys
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("ayşe", ["ayse"]),
+    ("AYŞE yıl", ["ayse", "yil"]),
+    ("0545 12", ["54512"]),
+    ("+90 545", ["545"]),
+    ("0384 212", ["384212"]),
+    ("ayşe 0545", ["ayse", "545"]),
+])
+def test_search_filter_tokens(query, expected):
+    assert sorted(search_filter(query)["search_keys"]["$all"]) == sorted(expected)
+
+
+def test_search_filter_without_tokens_matches_nothing():
+    assert search_filter("  -- ") == {"search_keys": {"$in": []}}
+    assert search_filter(None) == {"search_keys": {"$in": []}}
+
+
+def test_search_filter_orders_longest_token_first_and_caps_tokens():
+    tokens = search_filter("a bb ccc dddd eeeee ffffff")["search_keys"]["$all"]
+    assert tokens == ["ffffff", "eeeee", "dddd", "ccc", "bb"]
+
+
+async def insert(database, name, phone, keys=True):
+    doc = {"id": str(uuid.uuid4()), "customer_name": name, "phone": phone}
+    if keys:
+        doc["search_keys"] = search_keys(name, phone)
+    await database.appointments.insert_one(doc)
+    return doc["id"]
+
+
+async def found(database, query):
+    return {doc["id"] async for doc in database.appointments.find(search_filter(query))}
+
+
+async def test_phone_queries_find_mobile_and_landline_numbers(db):
+    mobile = await insert(db, "Ayşe Yılmaz", "05455953250")
+    landline = await insert(db, "Ali Kaya", "0384 212 34 56")
+
+    for query in ("0545 595", "545595", "+90 545", "ayşe 0545"):
+        assert await found(db, query) == {mobile}
+    for query in ("0384 212", "384212", "0384-212-34-56", "ali 0384"):
+        assert await found(db, query) == {landline}
+
+
+async def test_migration_refreshes_landline_keys(db):
+    landline = await insert(db, "Ali Kaya", "03842123456", keys=False)
+    await db.appointments.update_one({"id": landline}, {"$set": {"search_keys": ["ali", "03842123456"]}})
+    assert await found(db, "0384") == set()
+
+    await indexes._refresh_phone_search_keys(db)
+
+    assert await found(db, "0384") == {landline}
@@ -0,0 +1,113 @@
+"""One active appointment per (date, time) slot, enforced by the partial unique index"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import indexes
+from conftest import appointment_body, create_index_model, create_service
+
+pytestmark = pytest.mark.anyio
+
+PARALLEL_BOOKINGS = 300
+
+
+@pytest.fixture
+def mongomock_index_builds(monkeypatch):
+    monkeypatch.setattr(indexes, "_create", create_index_model)
+
+
+async def test_parallel_bookings_of_one_slot(indexed_db, async_client):
+    await create_service(indexed_db)
+    bodies = [appointment_body(phone=f"0545{i:07d}", name=f"Müşteri {i}") for i in range(PARALLEL_BOOKINGS)]
+
+    responses = await asyncio.gather(*(async_client.post("/api/appointments", json=body) for body in bodies))
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200] + [400] * (PARALLEL_BOOKINGS - 1)
+    assert await indexed_db.appointments.count_documents({"slot_active": True}) == 1
+
+
+async def test_cancelled_slot_can_be_rebooked(indexed_db, async_client):
+    await create_service(indexed_db)
+    first = (await async_client.post("/api/appointments", json=appointment_body())).json()
+    assert (await async_client.post("/api/appointments", json=appointment_body())).status_code == 400
+
+    await async_client.put(f"/api/appointments/{first['id']}", json={"status": "İptal"})
+    assert (await async_client.post("/api/appointments", json=appointment_body())).status_code == 200
+
+
+async def insert_double_booking(database, copies: int = 3) -> list:
+    created = datetime.now(timezone.utc)
+    docs = [{
+        "id": str(uuid.uuid4()), "customer_name": f"Müşteri {i}", "phone": "05455953250", "address": "-",
+        "service_id": "koltuk", "service_name": "Koltuk Yıkama", "service_price": 750.0,
+        "appointment_date": "2099-01-01", "appointment_time": "10:00", "status": "Bekliyor",
+        "created_at": created + timedelta(seconds=i),
+    } for i in range(copies)]
+    await database.appointments.insert_many(docs)
+    return docs
+
+
+async def test_migrations_release_double_bookings(db):
+    # bootstrap_database yerine: mongomock mevcut veride partial index kurarken
+    # partialFilterExpression'ı yok sayar
+    docs = await insert_double_booking(db)
+
+    await indexes.run_migrations(db)
+
+    active = await db.appointments.find({"slot_active": True}, {"_id": 0, "id": 1}).to_list(None)
+    assert [doc["id"] for doc in active] == [docs[0]["id"]]
+    assert await db.appointments.count_documents({"slot_conflict": True, "status": "Bekliyor"}) == 2
+
+
+async def test_bootstrap_fails_without_slot_index(db, mongomock_index_builds, monkeypatch):
+    await insert_double_booking(db)
+    monkeypatch.setattr(indexes, "MIGRATIONS", [("slot_active", indexes._backfill_slot_active)])
+
+    with pytest.raises(RuntimeError, match="appointment_date_1_appointment_time_1"):
+        await indexes.bootstrap_database(db)
+
+
+async def test_concurrent_bootstraps_migrate_once(db, mongomock_index_builds, monkeypatch):
+    runs = []
+
+    async def slow_migration(database):
+        runs.append(1)
+        await asyncio.sleep(0.2)
+
+    monkeypatch.setattr(indexes, "MIGRATIONS", [("slow", slow_migration)])
+
+    await asyncio.gather(*(indexes.bootstrap_database(db) for _ in range(3)))
+
+    assert len(runs) == 1
+    assert await db.scheduler_locks.count_documents({}) == 0
+
+
+async def test_rescheduling_a_released_appointment_reclaims_a_slot(indexed_db, async_client):
+    await create_service(indexed_db)
+    docs = await insert_double_booking(indexed_db, copies=2)
+    await indexed_db.appointments.update_one({"id": docs[0]["id"]}, {"$set": {"slot_active": True}})
+    released = docs[1]["id"]
+    await indexed_db.appointments.update_one({"id": released}, {"$set": {"slot_active": False, "slot_conflict": True}})
+    taken = (await async_client.post("/api/appointments", json=appointment_body(time="11:00"))).json()
+
+    # Dolu saate taşımak her zamanki 400'ü verir, kayıt değişmez
+    response = await async_client.put(f"/api/appointments/{released}", json={"appointment_time": "11:00"})
+    assert response.status_code == 400
+    unchanged = await indexed_db.appointments.find_one({"id": released})
+    assert (unchanged["appointment_time"], unchanged["slot_active"], unchanged["slot_conflict"]) == ("10:00", False, True)
+
+    response = await async_client.put(f"/api/appointments/{released}", json={"appointment_time": "12:00"})
+    assert response.status_code == 200
+    moved = await indexed_db.appointments.find_one({"id": released})
+    assert moved["slot_active"] is True
+    assert "slot_conflict" not in moved
+    assert (await async_client.post("/api/appointments", json=appointment_body(time="12:00"))).status_code == 400
+
+    await async_client.put(f"/api/appointments/{taken['id']}", json={"status": "İptal"})
+    await async_client.put(f"/api/appointments/{taken['id']}", json={"appointment_time": "13:00"})
+    cancelled = await indexed_db.appointments.find_one({"id": taken["id"]})
+    assert cancelled["slot_active"] is False
+    assert (await async_client.post("/api/appointments", json=appointment_body(time="13:00"))).status_code == 200
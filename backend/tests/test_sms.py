@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+import fake_iletimerkezi
+import sms
+from conftest import appointment_body, create_service
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def provider():
+    """Fake İletimerkezi on a free local port; tests tune `delay`/`fail_rate` through make_app."""
+    runners = []
+
+    async def start(delay=0.0, fail_rate=0.0):
+        app = fake_iletimerkezi.make_app(delay, fail_rate)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        host, port = runner.addresses[0][:2]
+        return f"http://{host}:{port}", app
+
+    yield start
+    for runner in runners:
+        await runner.cleanup()
+
+
+@pytest.fixture
+async def dispatcher(db, monkeypatch):
+    started = []
+
+    async def start(api_url, **options):
+        monkeypatch.setenv("ILETIMERKEZI_API_URL", api_url)
+        monkeypatch.setenv("SMS_ENABLED", "true")
+        instance = sms.SmsDispatcher(db, **{"retry_base_seconds": 0.05, "http_timeout": 5, **options})
+        instance.poll_interval = 0.05
+        await instance.start()
+        monkeypatch.setattr(sms, "dispatcher", instance)
+        started.append(instance)
+        return instance
+
+    yield start
+    for instance in started:
+        await instance.stop()
+
+
+async def wait_for_status(db, sms_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        doc = await db.sms_log.find_one({"id": sms_id}, {"_id": 0})
+        if doc and doc["status"] in statuses:
+            return doc
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"sms {sms_id} did not reach {statuses}: {doc}")
+
+
+async def test_queued_message_is_delivered_and_logged(db, provider, dispatcher):
+    url, app = await provider()
+    await dispatcher(url)
+
+    sms_id = await sms.enqueue_sms("0545 595 32 50", "Merhaba   dünya", kind="test")
+
+    doc = await wait_for_status(db, sms_id, {sms.STATUS_SENT})
+    assert doc["phone"] == "5455953250"
+    assert doc["attempts"] == 1
+    assert doc["provider_code"] == "200"
+    assert app["sent"] == [{"receipents": "5455953250", "text": "Merhaba dünya"}]
+
+
+async def test_invalid_phone_fails_without_calling_the_provider(db, provider, dispatcher):
+    url, app = await provider()
+    await dispatcher(url)
+
+    sms_id = await sms.enqueue_sms("123", "x")
+
+    doc = await db.sms_log.find_one({"id": sms_id})
+    assert doc["status"] == sms.STATUS_FAILED and doc["last_error"] == "invalid_phone"
+    assert app["sent"] == []
+
+
+async def test_provider_errors_are_retried_until_max_attempts(db, provider, dispatcher):
+    url, app = await provider(fail_rate=1.0)
+    await dispatcher(url, max_attempts=3)
+
+    sms_id = await sms.enqueue_sms("05455953250", "x")
+
+    doc = await wait_for_status(db, sms_id, {sms.STATUS_FAILED})
+    assert doc["attempts"] == 3
+    assert doc["provider_code"] == "503"
+
+
+async def test_appointment_create_p99_does_not_wait_for_a_slow_provider(db, async_client, provider, dispatcher):
+    provider_delay = 1.0
+    url, _ = await provider(delay=provider_delay)
+    await dispatcher(url, workers=2)
+    await create_service(db)
+
+    latencies = []
+    for i in range(100):
+        body = appointment_body(day=f"2099-{i // 28 + 1:02d}-{i % 28 + 1:02d}")
+        started = time.perf_counter()
+        response = await async_client.post("/api/appointments", json=body)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200
+
+    latencies.sort()
+    p99 = latencies[98]
+    # Eski senkron gönderim her isteğe en az provider_delay eklerdi
+    assert p99 < provider_delay / 4, f"p99={p99 * 1000:.0f} ms"
+    assert await db.sms_log.count_documents({"kind": "appointment_created"}) == 100
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import indexes
+import sync
+from conftest import appointment_body
+
+
+def since(delta=timedelta(minutes=1)) -> str:
+    return (datetime.now(timezone.utc) - delta).isoformat()
+
+
+def test_first_sync_asks_for_a_full_reload(client):
+    body = client.get("/api/sync").json()
+    assert body["resync"] is True
+    assert sync.parse_watermark(body["watermark"]) < datetime.now(timezone.utc)
+
+
+def test_invalid_watermark_is_rejected(client):
+    assert client.get("/api/sync", params={"since": "yesterday"}).status_code == 400
+
+
+def test_delta_contains_changes_and_deletions(client):
+    start = since()
+    service = client.post("/api/services", json={"name": "Koltuk Yıkama", "price": 750.0}).json()
+    kept = client.post("/api/appointments", json=appointment_body(service_id=service["id"])).json()
+    removed = client.post("/api/appointments", json=appointment_body(service_id=service["id"], time="11:00")).json()
+    assert client.delete(f"/api/appointments/{removed['id']}").status_code == 200
+
+    body = client.get("/api/sync", params={"since": start}).json()
+
+    assert body["resync"] is False
+    assert [row["id"] for row in body["changes"]["services"]] == [service["id"]]
+    assert [row["id"] for row in body["changes"]["appointments"]] == [kept["id"]]
+    assert body["deleted"]["appointments"] == [removed["id"]]
+
+    # Sonraki senkron yalnız o andan sonrakileri getirir
+    later = client.get("/api/sync", params={"since": since(timedelta(0))}).json()
+    assert later["resync"] is False and later["changes"]["appointments"] == []
+
+
+def test_expired_or_oversized_delta_forces_resync(client, monkeypatch):
+    old = since(timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 1))
+    assert client.get("/api/sync", params={"since": old}).json()["resync"] is True
+
+    monkeypatch.setattr(sync, "SYNC_MAX_CHANGES", 1)
+    start = since()
+    for name in ("Koltuk", "Halı"):
+        client.post("/api/services", json={"name": name, "price": 100.0})
+    assert client.get("/api/sync", params={"since": start}).json()["resync"] is True
+
+
+@pytest.mark.anyio
+async def test_updated_at_backfill_uses_only_datetime_created_at(db):
+    created = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    await db.services.insert_many([
+        {"id": "dated", "created_at": created},
+        {"id": "text", "created_at": "2024-05-01T10:00:00"},
+        {"id": "missing"},
+    ])
+
+    # BSON tarihleri milisaniye hassasiyetinde saklanır
+    now = datetime.now(timezone.utc)
+    before = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    await indexes._backfill_updated_at(db)
+
+    updated = {doc["id"]: doc["updated_at"] async for doc in db.services.find({})}
+    assert updated["dated"] == created
+    assert updated["text"] >= before and updated["missing"] >= before
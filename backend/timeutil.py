@@ -0,0 +1,43 @@
+"""
+Time Helper Module
+
+Appointments store their local (Europe/Istanbul) date and time as strings and,
+next to them, the canonical UTC `starts_at`. These helpers convert between
+the two and turn local calendar days into UTC ranges for starts_at queries.
+"""
+from datetime import date, datetime, time, timezone, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+try:
+    TURKEY_TZ = ZoneInfo("Europe/Istanbul")
+except Exception:
+    TURKEY_TZ = timezone(timedelta(hours=3))
+
+
+def appointment_starts_at(appointment_date: str, appointment_time: str) -> datetime:
+    """Parse "%Y-%m-%d" + "%H:%M" local strings into a UTC datetime.
+
+    Raises ValueError/TypeError for malformed values.
+    """
+    naive_dt = datetime.strptime(f"{appointment_date} {appointment_time}", "%Y-%m-%d %H:%M")
+    return naive_dt.replace(tzinfo=TURKEY_TZ).astimezone(timezone.utc)
+
+
+def local_day_start(day: date) -> datetime:
+    """UTC instant of the local midnight that starts `day`."""
+    return datetime.combine(day, time.min, tzinfo=TURKEY_TZ).astimezone(timezone.utc)
+
+
+def local_day_range(start_day: Optional[date], end_day: Optional[date]) -> dict:
+    """starts_at filter for the local calendar days start_day..end_day (either end open)."""
+    bounds = {}
+    if start_day is not None:
+        bounds["$gte"] = local_day_start(start_day)
+    if end_day is not None:
+        bounds["$lt"] = local_day_start(end_day + timedelta(days=1))
+    return bounds
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
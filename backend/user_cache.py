@@ -0,0 +1,86 @@
+"""
+Authenticated User Cache Module
+
+Caches the public user principal resolved by `get_current_user` so protected
+endpoints do not hit `db.users` on every request. Entries live in a small
+in-process TTL/LRU keyed by (username, token jti) and, when Redis is
+available, in a shared `royal:user:<username>` key. Invalidations are published
+as the `user:<username>` cache tag so every worker drops its local copies.
+"""
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+import cache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '60'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+
+_principals = cache.LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def _user_tag(username: str) -> str:
+    return f"user:{username}"
+
+
+def _drop_principals(tags):
+    usernames = {tag[len("user:"):] for tag in tags if tag.startswith("user:")}
+    if usernames:
+        _principals.discard_where(lambda key: key[0] in usernames)
+
+
+cache.add_invalidation_listener(_drop_principals)
+
+
+def _redis_key(username: str) -> str:
+    return cache.get_cache_key("user", username)
+
+
+async def get_user_cached(username: str, jti: Optional[str],
+                          loader: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+    """Return the cached user fields or load them with `loader(username)`.
+
+    The returned dict never contains the password hash.
+    """
+    key = (username, jti)
+    user = _principals.get(key)
+    if user is not None:
+        return user
+
+    client = cache.get_redis()
+    if client is not None:
+        try:
+            cached = await client.get(_redis_key(username))
+            if cached is not None:
+                user = json.loads(cached)
+        except Exception as e:
+            cache.mark_redis_down(e)
+
+    if user is None:
+        user = await loader(username)
+        if user is None:
+            return None
+        user = {k: v for k, v in user.items() if k != 'hashed_password'}
+        if client is not None:
+            try:
+                await client.setex(_redis_key(username), USER_CACHE_TTL, json.dumps(user, default=str))
+            except Exception as e:
+                cache.mark_redis_down(e)
+
+    _principals.set(key, user)
+    return user
+
+
+async def invalidate_user(username: str):
+    """Drop every cached principal of `username` (call after password/profile changes)."""
+    client = cache.get_redis()
+    if client is not None:
+        try:
+            await client.delete(_redis_key(username))
+        except Exception as e:
+            logger.warning(f"User cache invalidation failed: {e}")
+    # Drops local entries here and, via pub/sub, in the other workers
+    await cache.invalidate_cache(_user_tag(username))